@@ -0,0 +1,80 @@
+# Jakob Balkovec
+# Sun Oct 18th 2026
+# DR-Summer Research
+
+# bench_parallel_parse.py
+
+# desc: Benchmarks parse() serial vs. parse(workers=N) on a few thousand synthetic DIARETDB1-style XML files
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from lesion_parser import LesionXMLParser
+from config import VALID_LESION_TYPES
+
+N_FILES = 3000
+MARKINGS_PER_FILE = 40
+WORKER_COUNTS = [2, 4, 8]
+
+
+def _marking(rng):
+    # post: one random <marking> element as text (circle / ellipse / polygon, same mix as the ground truth)
+    cx, cy = rng.integers(0, 1500, 2)
+    kind = rng.choice(["circle", "ellipse", "polygon"], p=[0.7, 0.13, 0.17])
+    if kind == "circle":
+        region = (f"<circleregion><centroid><coords2d>{cx},{cy}</coords2d></centroid>"
+                  f"<radius direction=\"x\">{rng.integers(3, 150)}</radius></circleregion>")
+    elif kind == "ellipse":
+        region = (f"<ellipseregion><centroid><coords2d>{cx},{cy}</coords2d></centroid>"
+                  f"<radius direction=\"x\">{rng.integers(3, 60)}</radius><radius direction=\"y\">{rng.integers(3, 60)}</radius>"
+                  f"<angle>{rng.integers(0, 180)}</angle></ellipseregion>")
+    else:
+        pts = "".join(f"<coords2d>{x},{y}</coords2d>" for x, y in rng.integers(-80, 80, (12, 2)) + (cx, cy))
+        region = f"<polygonregion><centroid><coords2d>{cx},{cy}</coords2d></centroid>{pts}</polygonregion>"
+    return (f"<marking>{region}<representativepoint><coords2d>{cx},{cy}</coords2d></representativepoint>"
+            f"<confidencelevel>High</confidencelevel><markingtype>{rng.choice(VALID_LESION_TYPES)}</markingtype></marking>")
+
+
+def make_corpus(root, n_files=N_FILES, markings=MARKINGS_PER_FILE, seed=1337):
+    # post: writes n_files XML files under root, returns the structured input (4 annotators per image)
+    rng = np.random.default_rng(seed)
+    structured_input = []
+    for i in range(0, n_files, 4):
+        xmls = []
+        for a in range(1, 5):
+            name = f"synthetic_image{i // 4:04d}_{a:02d}.xml"
+            body = "\n".join(_marking(rng) for _ in range(markings))
+            with open(os.path.join(root, name), "w") as f:
+                f.write(f"<?xml version=\"1.0\"?>\n<imgannotooldata><markinglist>\n{body}\n</markinglist></imgannotooldata>\n")
+            xmls.append(name)
+        structured_input.append({"image": f"images/synthetic_image{i // 4:04d}.png", "xmls": xmls})
+    return structured_input
+
+
+def run_benchmark():
+    with tempfile.TemporaryDirectory() as root:
+        structured_input = make_corpus(root)
+
+        t0 = time.perf_counter()
+        serial = LesionXMLParser(structured_input, root_dir=root).parse()
+        t_serial = time.perf_counter() - t0
+        print(f"serial      {len(serial)} markings  {t_serial:.2f}s")
+
+        for workers in WORKER_COUNTS:
+            t0 = time.perf_counter()
+            parallel = LesionXMLParser(structured_input, root_dir=root).parse(workers=workers)
+            t = time.perf_counter() - t0
+            assert list(parallel) == list(serial), "parallel parse differs from the serial one"
+            print(f"workers={workers:<3} {len(parallel)} markings  {t:.2f}s  ({t_serial / t:.1f}x)")
+
+
+if __name__ == "__main__":
+    print(f"[INFO] Parsing {N_FILES} synthetic XML files...")
+    run_benchmark()
+    print("[DONE]")
@@ -20,3 +20,23 @@ VALID_LESION_TYPES = [
   'Haemorrhages',
   'IRMA'
 ]
+
+# desc: fields of one parsed lesion record, in column order (parse(), to_format(), save_as())
+RECORD_FIELDS = [
+  'image_path',
+  'image_id',
+  'xml_file',
+  'type',
+  'lesion_id',
+  'x',
+  'y',
+  'radius',
+  'radius_x',
+  'radius_y',
+  'angle',
+  'polygon_points',
+  'region_type'
+]
+
+# desc: number of records per chunk when streaming (iter_chunks(), save_as() without parse())
+PARSE_CHUNK_SIZE = 4096
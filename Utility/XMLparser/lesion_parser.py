@@ -11,10 +11,184 @@ import xml.etree.ElementTree as ET
 import pandas as pd
 import numpy as np
 import json
+import shutil
+from itertools import chain, islice
+from multiprocessing import Pool
 
 import threading
 
-from config import VALID_LESION_TYPES
+try:  # imported as the XMLparser package (e.g. by the pipeline)
+    from .config import VALID_LESION_TYPES, RECORD_FIELDS, PARSE_CHUNK_SIZE
+    from .lesion_table import LesionTable, CATEGORICAL_FIELDS, MARKING_DTYPE
+except ImportError:  # run / imported from inside XMLparser/
+    from config import VALID_LESION_TYPES, RECORD_FIELDS, PARSE_CHUNK_SIZE
+    from lesion_table import LesionTable, CATEGORICAL_FIELDS, MARKING_DTYPE
+
+
+def _marking_record(mark):
+    # pre:  mark is a complete <marking> element
+    # post: returns (lesion_type, centroid x, centroid y, region fields dict) or None if it has no region
+    # desc: reads the centroid, the region (circle / ellipse / polygon) and the marking type
+
+    # note: updated due to different types of regions
+    #   circleregion
+    #   polygonregion
+    #   elipsisregion
+
+    coords_text = mark.find(".//centroid/coords2d").text
+    x, y = map(float, coords_text.split(","))
+    region = None
+
+    for child in mark:
+        if child.tag.endswith("region"):
+            region = child
+            break
+
+    if region is None:
+        return None
+
+    radius = radius_x = radius_y = angle = None
+    polygon_points = []
+
+    if region.tag == "circleregion":
+        radius_elem = region.find("radius")
+        if radius_elem is not None:
+            radius = float(radius_elem.text)
+            # radius_x = radius_y = radius
+            # angle = 0.0
+
+    elif region.tag == "ellipseregion":
+        rx_elem = region.find("radius[@direction='x']")
+        ry_elem = region.find("radius[@direction='y']")
+        angle_elem = region.find("angle")
+        if rx_elem is not None and ry_elem is not None:
+            radius_x = float(rx_elem.text)
+            radius_y = float(ry_elem.text)
+            radius = (radius_x + radius_y) / 2
+            angle = float(angle_elem.text) if angle_elem is not None else 0.0
+
+    elif region.tag == "polygonregion":
+        centroid_text = region.find("centroid/coords2d").text
+        cx, cy = map(float, centroid_text.split(","))
+        radius = 0
+
+        for pt in region.findall("coords2d"):
+            px, py = map(float, pt.text.split(","))
+            polygon_points.append((px, py))
+            dist = ((px - cx) ** 2 + (py - cy) ** 2) ** 0.5
+            radius = max(radius, dist)
+        # radius_x = radius_y = radius
+        # angle = 0.0
+
+    lesion_type = mark.find("markingtype").text
+
+    return lesion_type, x, y, {
+        "radius": radius,
+        "radius_x": radius_x,
+        "radius_y": radius_y,
+        "angle": angle,
+        "polygon_points": polygon_points,
+        "region_type": region.tag
+    }
+
+
+def _iter_marking_elements(xml_path):
+    # pre:  xml_path is a readable XML file
+    # post: yields every <marking> element once it is complete, then drops it from the tree
+    # desc: ET.iterparse keeps only the open ancestors + the current marking in memory, so the
+    #       cost per file is constant no matter how many markings it holds
+
+    stack = []
+    for event, elem in ET.iterparse(xml_path, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag == "marking":
+            yield elem
+            if stack:
+                stack[-1].remove(elem)  # parent keeps no reference -> the marking can be freed
+            else:
+                elem.clear()
+
+
+def _file_records(xml_rel, xml_path, image_path, mute_output=True):
+    # pre:  xml_path is the resolved path of xml_rel, image_path is the associated image or None
+    # post: yields the records of one XML file in file order, lesion_id still None
+    # desc: an error ends the file early, records before it are kept (same as the serial parser always did)
+
+    image_id = os.path.splitext(os.path.basename(image_path))[0] if image_path else None
+    xml_name = os.path.basename(xml_path)
+    try:
+        for mark in _iter_marking_elements(xml_path):
+            parsed = _marking_record(mark)
+            if parsed is None:
+                if mute_output == False:
+                    print("INFO: region is None")
+                continue
+
+            lesion_type, x, y, region = parsed
+            yield {
+                "image_path": image_path,
+                "image_id": image_id,
+                "xml_file": xml_name,
+                "type": lesion_type,
+                "lesion_id": None,
+                "x": x,
+                "y": y,
+                **region
+            }
+
+    except Exception as e:
+        print(f"Skipping {xml_rel} due to error: {e}")
+
+
+# desc: columns of a per-file chunk, lesion_id is assigned by the driver (@see iter_markings)
+_CHUNK_FIELDS = [field for field in RECORD_FIELDS if field != "lesion_id"]
+
+
+def _parse_file_columns(task):
+    # pre:  task is one (xml_rel, xml_path, image_path, mute_output) tuple of LesionXMLParser._file_tasks
+    # post: returns the file's records as columns {field: list}, without lesion_id
+    # desc: process-pool worker of parse(workers=N); lives at module level so it pickles by name
+
+    columns = {field: [] for field in _CHUNK_FIELDS}
+    for record in _file_records(*task):
+        for field in _CHUNK_FIELDS:
+            columns[field].append(record[field])
+    return columns
+
+
+def _batched(iterable, n):
+    # post: yields lists of up to n consecutive items
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, n))
+        if not batch:
+            return
+        yield batch
+
+
+def _to_structured(records):
+    # pre:  records is a list of lesion record dicts
+    # post: returns them as a MARKING_DTYPE array; raises ValueError if a string doesn't fit its field
+    # note: a streamed export can't widen the fields afterwards (parsed tables are sized to fit)
+    for field in CATEGORICAL_FIELDS:
+        width = MARKING_DTYPE[field].itemsize // 4
+        overflow = next((r[field] for r in records if r[field] and len(r[field]) > width), None)
+        if overflow is not None:
+            raise ValueError(f"{field} {overflow!r} is longer than {width} characters. "
+                             f"Run parse() first to export it as numpy.")
+
+    arr = np.zeros(len(records), dtype=MARKING_DTYPE)
+    for i, r in enumerate(records):
+        arr[i] = (
+            r["image_path"] or "", r["image_id"] or "", r["xml_file"], r["type"] or "", r["lesion_id"],
+            r["x"], r["y"],
+            *(np.nan if r[k] is None else r[k] for k in ("radius", "radius_x", "radius_y", "angle")),
+            r["region_type"], len(r["polygon_points"])
+        )
+    return arr
 
 class LesionXMLParser:
     # init: accepts XML file(s) directly or as part of a structured list with optional image associations.
@@ -52,9 +226,9 @@ class LesionXMLParser:
         else:
             raise ValueError("xml_input must be a string, list of strings, or list of dicts")
 
-        self.xml_input = xml_input
         self.root_dir = root_dir
-        self.parsed_data = []
+        self.parsed_data = LesionTable.empty()
+        self._parsed = False  # parse() has filled parsed_data (it may still be empty, e.g. after a filter)
         self._format_cache = {}
         self.parsed_object = None
         self.lock = threading.Lock()
@@ -75,116 +249,94 @@ class LesionXMLParser:
         return None
 
 
-    def parse(self, mode="overwrite", mute_output=True):
+    def _file_tasks(self, mute_output=True):
+        # post: yields (xml_rel, xml_path, image_path, mute_output) per input XML that exists, in input order
+        for entry in self.xml_input:
+            image_path = entry.get("image")
+            for xml_rel in entry["xmls"]:
+                xml_path = self._resolve_path(xml_rel)
+                if not xml_path:
+                    print(f"File not found: {xml_rel}")
+                    continue
+                yield xml_rel, xml_path, image_path, mute_output
+
+
+    def iter_markings(self, mute_output=True, workers=None, start_id=None):
+        # pre:  xml_input is a valid list of .xml paths or dicts; files are accessible from root_dir or absolute paths
+        #       workers is None / 1 (serial) or the number of processes parsing files in parallel
+        #       start_id is the first lesion_id (None -> the parser's lesion_counter)
+        # post: yields one lesion record (dict, keys = RECORD_FIELDS) per marking, in input order,
+        #       with consecutive lesion_ids; lesion_counter is left alone (only parse() advances it)
+        # desc: streams the XML files with ET.iterparse, each marking element is released as soon as
+        #       its record has been built, so memory stays constant over the whole corpus.
+        #       nothing is stored on the parser and no lock is held
+        # note: with workers > 1 every file is parsed by a pool process into one columnar chunk
+        #       (@see _parse_file_columns); chunks come back in input order (imap) and lesion_ids are
+        #       only assigned here, so the records are exactly the ones of the serial path.
+        #       every stream counts on its own, so concurrent streams / exports don't race on the parser
+
+        lesion_id = self.lesion_counter if start_id is None else start_id
+        if workers is None or workers <= 1:
+            for task in self._file_tasks(mute_output):
+                for record in _file_records(*task):
+                    record["lesion_id"] = lesion_id
+                    lesion_id += 1
+                    yield record
+            return
+
+        tasks = list(self._file_tasks(mute_output))
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with Pool(processes=workers) as pool:
+            for columns in pool.imap(_parse_file_columns, tasks, chunksize=chunksize):
+                for i in range(len(columns["x"])):
+                    record = {field: columns[field][i] for field in _CHUNK_FIELDS}
+                    record["lesion_id"] = lesion_id
+                    lesion_id += 1
+                    yield {field: record[field] for field in RECORD_FIELDS}
+
+
+    def iter_chunks(self, chunk_size=PARSE_CHUNK_SIZE, mute_output=True):
+        # pre:  chunk_size > 0
+        # post: yields pandas DataFrames (columns = RECORD_FIELDS) of up to chunk_size records
+        # desc: columnar view of iter_markings(), at most one chunk is alive at a time
+
+        for batch in _batched(self.iter_markings(mute_output), chunk_size):
+            yield pd.DataFrame(batch, columns=RECORD_FIELDS)
+
+
+    def parse(self, mode="overwrite", mute_output=True, workers=None):
         # pre:  xml_input is a valid list of .xml paths or dicts; files are accessible from root_dir or absolute paths
+        #       workers is None / 1 (serial) or the size of the process pool parsing the files
         # post: parsed_data is populated with extracted lesion entries, cache is cleared, optionally appends
         # desc: parses all provided XML files and extracts lesion metadata. Supports appending or overwriting previous results.
-        with self.lock:
-            if mode == "overwrite":
-                self.parsed_data = []
-            elif mode != "append":
-                raise ValueError("Invalid mode. Use 'overwrite' or 'append'.")
+        # note: the files are read through iter_markings() without the lock, it is only held to swap the results in.
+        #       the result (incl. lesion_ids) doesn't depend on workers.
+        #       parsed_data is a LesionTable (typed columns); it indexes and iterates like the old list of dicts
 
-            self._format_cache.clear()
+        if mode not in ("overwrite", "append"):
+            raise ValueError("Invalid mode. Use 'overwrite' or 'append'.")
 
-            for entry in self.xml_input:
-                image_path = entry.get("image")
-                for xml_rel in entry["xmls"]:
-                    xml_path = self._resolve_path(xml_rel)
-                    if not xml_path:
-                        print(f"File not found: {xml_rel}")
-                        continue
-
-                    try:
-                        tree = ET.parse(xml_path)
-                        root = tree.getroot()
-                        image_id = os.path.splitext(os.path.basename(image_path))[0] if image_path else None
-                        xml_name = os.path.basename(xml_path)
-
-                        # note: updated due to different types of regions
-                        #   circleregion
-                        #   polygonregion
-                        #   elipsisregion
-
-                        for mark in root.findall(".//marking"):
-                            coords_text = mark.find(".//centroid/coords2d").text
-                            x, y = map(float, coords_text.split(","))
-                            region = None
-
-                            for child in mark:
-                                if child.tag.endswith("region"):
-                                    region = child
-                                    break
-
-                            if region is None:
-                                if mute_output == False:
-                                    print("INFO: region is None")
-                                else:
-                                    continue
-
-                            radius = radius_x = radius_y = angle = None
-                            polygon_points = []
-
-                            if region.tag == "circleregion":
-                                radius_elem = region.find("radius")
-                                if radius_elem is not None:
-                                    radius = float(radius_elem.text)
-                                    # radius_x = radius_y = radius
-                                    # angle = 0.0
-
-                            elif region.tag == "ellipseregion":
-                                rx_elem = region.find("radius[@direction='x']")
-                                ry_elem = region.find("radius[@direction='y']")
-                                angle_elem = region.find("angle")
-                                if rx_elem is not None and ry_elem is not None:
-                                    radius_x = float(rx_elem.text)
-                                    radius_y = float(ry_elem.text)
-                                    radius = (radius_x + radius_y) / 2
-                                    angle = float(angle_elem.text) if angle_elem is not None else 0.0
-
-                            elif region.tag == "polygonregion":
-                                centroid_text = region.find("centroid/coords2d").text
-                                cx, cy = map(float, centroid_text.split(","))
-                                radius = 0
-                                polygon_points = []
-
-                                for pt in region.findall("coords2d"):
-                                    px, py = map(float, pt.text.split(","))
-                                    polygon_points.append((px, py))
-                                    dist = ((px - cx) ** 2 + (py - cy) ** 2) ** 0.5
-                                    radius = max(radius, dist)
-                                # radius_x = radius_y = radius
-                                # angle = 0.0
-
-                            lesion_type = mark.find("markingtype").text
-
-                            self.parsed_data.append({
-                                "image_path": image_path,
-                                "image_id": image_id,
-                                "xml_file": xml_name,
-                                "type": lesion_type,
-                                "lesion_id": self.lesion_counter,
-                                "x": x,
-                                "y": y,
-                                "radius": radius,
-                                "radius_x": radius_x,
-                                "radius_y": radius_y,
-                                "angle": angle,
-                                "polygon_points": polygon_points,
-                                "region_type": region.tag
-                            })
-                            self.lesion_counter += 1
-
-                    except Exception as e:
-                        print(f"Skipping {xml_rel} due to error: {e}")
+        with self.lock:
+            start_id = self.lesion_counter
+        table = LesionTable.from_records(self.iter_markings(mute_output, workers=workers, start_id=start_id))
 
+        with self.lock:
+            self.lesion_counter = max(self.lesion_counter, start_id + len(table))  # ids continue over parse() calls
+            if mode == "overwrite":
+                self.parsed_data = table
+            else:
+                self.parsed_data = LesionTable.from_records(chain(self.parsed_data, table))
+            self._parsed = True
+            self._format_cache.clear()
             return self.parsed_data
 
 
     def to_format(self, format="pandas"):
         # pre:  parser has been run with parse(), and parsed_data is available
         # post: returns parsed data in the specified format (with caching)
-        # desc: converts the parsed data into one of the supported formats (pandas, csv, numpy, json)
+        # desc: converts the parsed data into one of the supported formats (pandas, csv, numpy, json, arrow)
+        # note: numpy -> MARKING_DTYPE record array, arrow -> pyarrow.Table (optional dependency);
+        #       the typed table itself is parsed_data (zero-copy rows: parsed_data.to_numpy())
         with self.lock:
             if not self.parsed_data:
                 raise ValueError("No parsed data. Run parse() first.")
@@ -194,15 +346,15 @@ class LesionXMLParser:
                 return self._format_cache[format]
 
             if format == "pandas":
-                parsed_object = pd.DataFrame(self.parsed_data)
+                parsed_object = self.parsed_data.to_pandas()
             elif format == "csv":
-                df = pd.DataFrame(self.parsed_data)
-                parsed_object = df.to_csv(index=False)
+                parsed_object = self.parsed_data.to_pandas().to_csv(index=False)
             elif format == "numpy":
-                df = pd.DataFrame(self.parsed_data)
-                parsed_object = df.to_numpy()
+                parsed_object = self.parsed_data.to_marking_array()
             elif format == "json":
-                parsed_object = json.dumps(self.parsed_data, indent=2)
+                parsed_object = json.dumps(list(self.parsed_data), indent=2)
+            elif format == "arrow":
+                parsed_object = self.parsed_data.to_arrow()
             else:
                 raise ValueError(f"Unsupported format: {format}")
 
@@ -211,39 +363,85 @@ class LesionXMLParser:
 
 
     def save_as(self, filename, format="csv"):
-        # pre:  parser has been run with parse(), and parsed_data is available
+        # pre:  parse() has been run, or the XML inputs are readable (then they are streamed, see note)
         # post: writes parsed data to a file in the specified format
-        # desc: saves the current parsed dataset to disk using one of the supported formats
-        # note: locking handled in "to_format" method
-
-        if not self.parsed_data:
-            raise ValueError("No parsed data. Run parse() first.")
+        # desc: saves the current parsed dataset to disk using one of the supported formats.
+        #       csv / txt / json / numpy are written record by record (chunk by chunk), never as
+        #       one big in-memory string or array
+        # note: if parse() was never called the records come straight from iter_markings(), so a whole
+        #       corpus can be exported in constant memory without calling parse() first.
+        #       an empty parsed (or filtered) table is not re-read from the XML files, it raises
+        #       ("pandas" is the exception, a DataFrame pickle needs every row at once).
+        #       "numpy" writes a MARKING_DTYPE record array (loads without allow_pickle),
+        #       "parquet" needs pyarrow
+
+        if self._parsed and not self.parsed_data:
+            raise ValueError("No parsed data. The parsed / filtered table is empty.")
 
         format = format.lower()
+        records = self.parsed_data if self._parsed else self.iter_markings()
 
-        if format == "csv":
-            parsed_object = self.to_format("csv")
-            with open(filename, "w") as f:
-                f.write(parsed_object)
+        if format == "csv" or (format == "pandas" and not filename.endswith(".pkl")):
+            with open(filename, "w", newline="") as f:
+                for i, batch in enumerate(_batched(records, PARSE_CHUNK_SIZE)):
+                    pd.DataFrame(batch, columns=RECORD_FIELDS).to_csv(f, index=False, header=(i == 0))
 
         elif format == "txt":
             with open(filename, "w") as f:
-                for entry in self.parsed_data:
+                for entry in records:
                     line = f"{entry['image_path'] or ''} {entry['xml_file']} {entry['type']} {entry['x']} {entry['y']} {entry['radius']}\n"
                     f.write(line)
 
         elif format == "json":
-            parsed_object = self.to_format("json")
+            # same text as json.dumps(list, indent=2), one record at a time
             with open(filename, "w") as f:
-                f.write(parsed_object)
+                first = True
+                for entry in records:
+                    f.write("[\n" if first else ",\n")
+                    f.write("\n".join("  " + line for line in json.dumps(entry, indent=2).split("\n")))
+                    first = False
+                f.write("[]" if first else "\n]")
 
         elif format == "pandas":
-            df = self.to_format("pandas")
-            df.to_pickle(filename) if filename.endswith(".pkl") else df.to_csv(filename, index=False)
+            pd.DataFrame(list(records), columns=RECORD_FIELDS).to_pickle(filename)
+
+        elif format == "numpy" and isinstance(records, LesionTable):
+            np.save(filename, records.to_marking_array())
 
         elif format == "numpy":
-            arr = self.to_format("numpy")
-            np.save(filename, arr)
+            filename = filename if filename.endswith(".npy") else filename + ".npy"  # same as np.save
+            part = filename + ".part"
+            count = 0
+            try:
+                with open(part, "wb") as raw:
+                    for batch in _batched(records, PARSE_CHUNK_SIZE):
+                        _to_structured(batch).tofile(raw)
+                        count += len(batch)
+            except Exception:
+                os.remove(part)
+                raise
+            with open(filename, "wb") as out, open(part, "rb") as raw:
+                header = {"descr": np.lib.format.dtype_to_descr(MARKING_DTYPE), "fortran_order": False, "shape": (count,)}
+                np.lib.format.write_array_header_1_0(out, header)
+                shutil.copyfileobj(raw, out)
+            os.remove(part)
+
+        elif format == "parquet" and isinstance(records, LesionTable):
+            records.to_parquet(filename)
+
+        elif format == "parquet":
+            # one row group per chunk, every chunk is encoded as its own small table
+            writer = None
+            try:
+                for batch in _batched(records, PARSE_CHUNK_SIZE):
+                    chunk = LesionTable.from_records(batch).to_arrow()
+                    if writer is None:
+                        import pyarrow.parquet as pq
+                        writer = pq.ParquetWriter(filename, chunk.schema)
+                    writer.write_table(chunk)
+            finally:
+                if writer is not None:
+                    writer.close()
 
         else:
             raise ValueError(f"Unsupported format for saving: {format}")
@@ -257,7 +455,8 @@ class LesionXMLParser:
         # desc: resets the parser to its initial state by clearing stored data and cached conversions
 
         with self.lock:
-            self.parsed_data = []
+            self.parsed_data = LesionTable.empty()
+            self._parsed = False
             self._format_cache.clear()
             print("Cleared parsed data and format cache.")
 
@@ -266,21 +465,21 @@ class LesionXMLParser:
         # pre:  'lesion_types' is a string or list of valid lesion type(s)
         # post: updates and returns parsed data filtered by specified type(s)
         # desc: filters the parsed lesion data to include only selected lesion types
+        # note: one vectorized comparison of the type codes; the result is a view of the parsed table
+        #       (rows, strings and polygons are shared, nothing is rebuilt)
 
         with self.lock:
-            if lesion_types not in VALID_LESION_TYPES:
-                raise ValueError(f"Invalid lesion type(s): {lesion_types}. Valid types are: {VALID_LESION_TYPES}")
+            if isinstance(lesion_types, str):
+                lesion_types = [lesion_types]
+
+            invalid = [t for t in lesion_types if t not in VALID_LESION_TYPES]
+            if invalid:
+                raise ValueError(f"Invalid lesion type(s): {invalid}. Valid types are: {VALID_LESION_TYPES}")
 
             if not self.parsed_data:
                 raise ValueError("No parsed data. Run parse() first.")
 
-            if isinstance(lesion_types, str):
-                lesion_types = [lesion_types]
-
-            filtered = [
-                entry for entry in self.parsed_data
-                if entry["type"] in lesion_types
-            ]
+            filtered = self.parsed_data.view(self.parsed_data.type_mask(lesion_types))
 
             self.parsed_data = filtered
             self._format_cache.clear()
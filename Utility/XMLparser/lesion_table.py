@@ -0,0 +1,290 @@
+# Jakob Balkovec
+# Sun Oct 18th 2026
+# DR-Summer Research
+
+# lesion_table.py
+
+# desc: This file defines LesionTable, the typed columnar container behind LesionXMLParser.parsed_data
+
+import numpy as np
+import pandas as pd
+
+try:  # imported as the XMLparser package (e.g. by the pipeline)
+    from .config import RECORD_FIELDS, PARSE_CHUNK_SIZE
+except ImportError:  # run / imported from inside XMLparser/
+    from config import RECORD_FIELDS, PARSE_CHUNK_SIZE
+
+# desc: row layout of a LesionTable. string fields are categorical codes into table.categories
+#       (-1 = None), float fields use NaN for None, polygon vertices live in one flat buffer and
+#       every row points at its slice with (poly_start, n_points)
+ROW_DTYPE = np.dtype([
+    ("lesion_id", "<i8"),
+    ("image_path", "<i4"),
+    ("image_id", "<i4"),
+    ("xml_file", "<i4"),
+    ("type", "<i2"),
+    ("region_type", "<i1"),
+    ("x", "<f8"),
+    ("y", "<f8"),
+    ("radius", "<f8"),
+    ("radius_x", "<f8"),
+    ("radius_y", "<f8"),
+    ("angle", "<f8"),
+    ("poly_start", "<i8"),
+    ("n_points", "<i4"),
+])
+
+CATEGORICAL_FIELDS = ["image_path", "image_id", "xml_file", "type", "region_type"]
+FLOAT_FIELDS = ["x", "y", "radius", "radius_x", "radius_y", "angle"]
+
+# desc: fixed-width, self-contained record layout (strings decoded) of to_format("numpy") / save_as(..., "numpy")
+#       (None -> NaN / "", polygon vertices are reduced to their count; csv/json/parquet keep them)
+MARKING_DTYPE = np.dtype([
+    ("image_path", "U128"),
+    ("image_id", "U64"),
+    ("xml_file", "U64"),
+    ("type", "U24"),
+    ("lesion_id", "<i8"),
+    ("x", "<f8"),
+    ("y", "<f8"),
+    ("radius", "<f8"),
+    ("radius_x", "<f8"),
+    ("radius_y", "<f8"),
+    ("angle", "<f8"),
+    ("region_type", "U16"),
+    ("n_points", "<i4"),
+])
+
+
+def marking_dtype(widths):
+    # pre:  widths maps string fields of MARKING_DTYPE -> the longest value (characters) to hold
+    # post: returns MARKING_DTYPE with those fields widened where needed (never narrowed)
+    fields = []
+    for name in MARKING_DTYPE.names:
+        dtype = MARKING_DTYPE[name]
+        if dtype.kind == "U":
+            dtype = np.dtype(f"U{max(dtype.itemsize // 4, widths.get(name, 0))}")
+        fields.append((name, dtype))
+    return np.dtype(fields)
+
+
+class LesionTable:
+    # init: rows (ROW_DTYPE structured array), categories (field -> list of str), vertices ((M, 2) float64)
+    #       and an optional row index. with an index the table is a view: it shares rows, categories
+    #       and vertices with the table it was taken from and only holds the selected positions
+
+    def __init__(self, rows, categories, vertices, index=None):
+        # pre:  rows.dtype == ROW_DTYPE, every categorical code is < len(categories[field]),
+        #       every (poly_start, n_points) lies inside vertices
+        # post: table over rows (or rows[index] if index is given)
+        # desc: use from_records() to build a table, this only wires existing arrays together
+
+        self._rows = rows
+        self.categories = categories
+        self.vertices = vertices
+        self._index = index
+
+
+    @classmethod
+    def from_records(cls, records):
+        # pre:  records is an iterable of lesion record dicts (keys = RECORD_FIELDS, @see LesionXMLParser.iter_markings)
+        # post: returns a new table holding all of them, in order
+        # desc: one pass; strings are dictionary-encoded on the fly, vertices appended to one flat list
+
+        lookup = {field: {} for field in CATEGORICAL_FIELDS}
+        columns = {field: [] for field in ROW_DTYPE.names}
+        vertices = []
+
+        for r in records:
+            for field in CATEGORICAL_FIELDS:
+                value = r[field]
+                codes = lookup[field]
+                columns[field].append(-1 if value is None else codes.setdefault(value, len(codes)))
+            for field in FLOAT_FIELDS:
+                value = r[field]
+                columns[field].append(np.nan if value is None else value)
+            columns["lesion_id"].append(r["lesion_id"])
+
+            points = r["polygon_points"]
+            columns["poly_start"].append(len(vertices))
+            columns["n_points"].append(len(points))
+            vertices.extend(points)
+
+        rows = np.zeros(len(columns["lesion_id"]), dtype=ROW_DTYPE)
+        for field, values in columns.items():
+            rows[field] = values
+
+        categories = {field: list(codes) for field, codes in lookup.items()}  # insertion order == code order
+        return cls(rows, categories, np.array(vertices, dtype=np.float64).reshape(-1, 2))
+
+
+    @classmethod
+    def empty(cls):
+        # post: returns a table without rows
+        return cls.from_records([])
+
+
+    def __len__(self):
+        return len(self._rows) if self._index is None else len(self._index)
+
+
+    @property
+    def rows(self):
+        # post: the ROW_DTYPE rows of this table; the stored array itself (no copy) unless this is a view
+        return self._rows if self._index is None else self._rows[self._index]
+
+
+    def column(self, field):
+        # pre:  field is a ROW_DTYPE field
+        # post: returns that column (categorical fields as codes); a strided view when this isn't a view table
+        return self._rows[field] if self._index is None else self._rows[field][self._index]
+
+
+    def categorical(self, field):
+        # pre:  field is one of CATEGORICAL_FIELDS
+        # post: returns the column as a pandas Categorical (codes are shared, not decoded)
+        return pd.Categorical.from_codes(self.column(field), categories=self.categories[field])
+
+
+    def polygon_buffer(self):
+        # post: returns (offsets, vertices): row i's polygon is vertices[offsets[i]:offsets[i + 1]]
+        # desc: for a full table this is the stored vertex buffer itself (rows point at it in order);
+        #       a view gathers the vertices of its rows once
+
+        counts = self.column("n_points").astype(np.int64)
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        if self._index is None:
+            return offsets, self.vertices
+
+        starts = self.column("poly_start")
+        gather = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])
+        return offsets, self.vertices[gather]
+
+
+    def _records(self, lo, hi):
+        # post: returns rows lo..hi-1 as record dicts (Python types, None where the value is missing)
+        # desc: converts whole column slices with tolist() instead of one numpy scalar at a time
+
+        rows = self._rows[lo:hi] if self._index is None else self._rows[self._index[lo:hi]]
+        columns = {"lesion_id": rows["lesion_id"].tolist()}
+        for field in CATEGORICAL_FIELDS:
+            categories = self.categories[field]
+            columns[field] = [categories[c] if c >= 0 else None for c in rows[field].tolist()]
+        for field in FLOAT_FIELDS:
+            columns[field] = [None if v != v else v for v in rows[field].tolist()]
+
+        vertices = self.vertices
+        columns["polygon_points"] = [
+            [tuple(p) for p in vertices[s:s + n].tolist()]
+            for s, n in zip(rows["poly_start"].tolist(), rows["n_points"].tolist())
+        ]
+        return [{field: columns[field][i] for field in RECORD_FIELDS} for i in range(len(rows))]
+
+
+    def __iter__(self):
+        # post: yields every row as a record dict, converted PARSE_CHUNK_SIZE rows at a time
+        for lo in range(0, len(self), PARSE_CHUNK_SIZE):
+            yield from self._records(lo, min(lo + PARSE_CHUNK_SIZE, len(self)))
+
+
+    def __getitem__(self, key):
+        # pre:  key is an int or a slice
+        # post: one record dict (int) or a list of them (slice), same as indexing the old list of dicts
+        if isinstance(key, slice):
+            positions = range(len(self))[key]
+            if positions.step == 1:
+                return self._records(positions.start, positions.stop)
+            return [self[i] for i in positions]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("LesionTable index out of range")
+        return self._records(key, key + 1)[0]
+
+
+    def type_mask(self, lesion_types):
+        # pre:  lesion_types is a list of lesion type names
+        # post: returns a boolean mask, True where the row's type is one of them
+        # desc: compares the small int codes, the strings are only looked up once
+        codes = [i for i, name in enumerate(self.categories["type"]) if name in lesion_types]
+        return np.isin(self.column("type"), codes)
+
+
+    def view(self, selection):
+        # pre:  selection is a boolean mask of len(self) or an array of positions
+        # post: returns a table over the selected rows that shares rows, categories and vertices with this one
+        selection = np.asarray(selection)
+        positions = np.flatnonzero(selection) if selection.dtype == bool else selection.astype(np.int64)
+        index = positions if self._index is None else self._index[positions]
+        return LesionTable(self._rows, self.categories, self.vertices, index)
+
+
+    def to_numpy(self):
+        # post: returns the ROW_DTYPE rows (zero-copy for a full table; decode with .categories)
+        return self.rows
+
+
+    def to_marking_array(self):
+        # post: returns a MARKING_DTYPE array (strings decoded, NaN for None); string fields are
+        #       widened to the longest category, so long paths / ids are never cut off
+        # desc: every categorical column is decoded with one lookup-table gather
+        rows = self.rows
+        widths = {field: max(map(len, self.categories[field]), default=0) for field in CATEGORICAL_FIELDS}
+        out = np.zeros(len(rows), dtype=marking_dtype(widths))
+        for field in CATEGORICAL_FIELDS:
+            lut = np.array(self.categories[field] + [""], dtype=str)  # code -1 -> the trailing ""
+            out[field] = lut[rows[field]]
+        for field in FLOAT_FIELDS + ["lesion_id", "n_points"]:
+            out[field] = rows[field]
+        return out
+
+
+    def to_pandas(self):
+        # post: returns a DataFrame with RECORD_FIELDS columns (strings as pandas categoricals,
+        #       polygon_points as lists of (x, y) tuples)
+        offsets, vertices = self.polygon_buffer()
+        points = vertices.tolist()
+        data = {}
+        for field in RECORD_FIELDS:
+            if field in CATEGORICAL_FIELDS:
+                data[field] = self.categorical(field)
+            elif field == "polygon_points":
+                data[field] = [[tuple(p) for p in points[a:b]] for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+            else:
+                data[field] = self.column(field)
+        return pd.DataFrame(data, columns=RECORD_FIELDS)
+
+
+    def to_arrow(self):
+        # post: returns a pyarrow.Table with RECORD_FIELDS columns: dictionary-encoded strings,
+        #       float64 numbers (null for None) and polygon_points as list<fixed_size_list<float64, 2>>
+        # note: pyarrow is optional, it is only imported here
+
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError("to_arrow() / parquet export needs pyarrow (pip install pyarrow)") from e
+
+        offsets, vertices = self.polygon_buffer()
+        arrays = []
+        for field in RECORD_FIELDS:
+            if field in CATEGORICAL_FIELDS:
+                codes = np.ascontiguousarray(self.column(field))
+                arrays.append(pa.DictionaryArray.from_arrays(
+                    pa.array(codes, mask=codes < 0), pa.array(self.categories[field], type=pa.string())))
+            elif field == "polygon_points":
+                flat = pa.array(np.ascontiguousarray(vertices).reshape(-1))
+                arrays.append(pa.ListArray.from_arrays(pa.array(offsets.astype(np.int32)),
+                                                       pa.FixedSizeListArray.from_arrays(flat, 2)))
+            else:
+                values = np.ascontiguousarray(self.column(field))
+                arrays.append(pa.array(values, mask=np.isnan(values)) if values.dtype.kind == "f" else pa.array(values))
+        return pa.Table.from_arrays(arrays, names=RECORD_FIELDS)
+
+
+    def to_parquet(self, filename):
+        # post: writes to_arrow() to a parquet file
+        table = self.to_arrow()
+        import pyarrow.parquet as pq
+        pq.write_table(table, filename)
@@ -8,3 +8,48 @@
 
 
 # XMLParser/Tests are no longer needed, as we're shifting our focus to a different dataset.
+# note: the checks below only guard the export paths of the parser (parsed table vs. streamed)
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # the parser uses flat imports
+
+import pytest
+
+from lesion_parser import LesionXMLParser
+from utils import parse_txt_file
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+
+
+@pytest.fixture
+def xml_input():
+    # post: the first few images of the DIARETDB1 train split (image + expert XMLs)
+    return parse_txt_file(str(DATA_DIR / "ddb1_v02_01_train.txt"))[:5]
+
+
+@pytest.mark.parametrize("format", ["csv", "json", "txt"])
+def test_save_as_same_bytes_parsed_or_streamed(xml_input, tmp_path, format):
+    # desc: save_as after parse() writes the table, without parse() it streams iter_markings();
+    #       both must produce the same file
+    parsed = LesionXMLParser(xml_input, root_dir=str(DATA_DIR))
+    parsed.parse()
+    parsed.save_as(str(tmp_path / f"parsed.{format}"), format)
+
+    streamed = LesionXMLParser(xml_input, root_dir=str(DATA_DIR))
+    streamed.save_as(str(tmp_path / f"streamed.{format}"), format)
+
+    assert (tmp_path / f"parsed.{format}").read_bytes() == (tmp_path / f"streamed.{format}").read_bytes()
+
+
+def test_streamed_export_leaves_lesion_ids_alone(xml_input, tmp_path):
+    # desc: a streamed save_as numbers its records on its own; it must not shift the ids parse() hands out
+    parser = LesionXMLParser(xml_input, root_dir=str(DATA_DIR))
+    parser.save_as(str(tmp_path / "first.json"), "json")
+    parser.save_as(str(tmp_path / "second.json"), "json")
+    assert (tmp_path / "first.json").read_bytes() == (tmp_path / "second.json").read_bytes()
+
+    parsed = parser.parse()
+    assert parsed[0]["lesion_id"] == 0
+    assert [r["lesion_id"] for r in parsed] == list(range(len(parsed)))
@@ -0,0 +1,64 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: micro-benchmark for patch cropping
+#        one crop (+ pad when needed) per patch vs. one pad + one sliding_window_view gather per image
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+import time
+
+import numpy as np
+
+from pipeline.config.settings import IMAGE_SHAPE, PATCH_SIZE, SEED
+from pipeline.utils.geometry_utils import _reflective_crop, crop_batch, grid_tiles
+
+# brief: patches per image (a busy image yields a few hundred lesion + healthy patches)
+PATCH_COUNTS = [50, 300, 1000]
+
+def _legacy_crops(img, centers):
+    # desc: what PatchExtractionPipe did before, one _reflective_crop per patch
+    return [_reflective_crop(img, int(cx), int(cy), PATCH_SIZE)[0] for cx, cy in centers]
+
+def _batch_crops(img, centers):
+    half = PATCH_SIZE // 2
+    return crop_batch(img, centers[:, 0] - half, centers[:, 1] - half, PATCH_SIZE)
+
+def _time(fn, *args, repeat=5) -> float:
+    # post: best wall time in seconds over `repeat` runs
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def run_benchmark(counts=PATCH_COUNTS):
+    # post: prints per-image crop time for both paths, checks they agree
+
+    rng = np.random.default_rng(SEED)
+    h, w = IMAGE_SHAPE
+    img = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+
+    print(f"{'patches':>8}  {'legacy [ms]':>12}  {'batch [ms]':>11}  {'speedup':>8}")
+    for n in counts:
+        # any center, so some windows hang over the border and get reflect-padded
+        centers = np.stack([rng.integers(0, w, n), rng.integers(0, h, n)], axis=1)
+        assert np.array_equal(np.stack(_legacy_crops(img, centers)), _batch_crops(img, centers))
+
+        t_old = _time(_legacy_crops, img, centers)
+        t_new = _time(_batch_crops, img, centers)
+        print(f"{n:>8}  {t_old * 1e3:>12.2f}  {t_new * 1e3:>11.2f}  {t_old / t_new:>7.1f}x")
+
+    tiles, _ = grid_tiles(img, PATCH_SIZE)
+    print(f"{'grid':>8}  {len(tiles)} tiles in {_time(grid_tiles, img, PATCH_SIZE) * 1e3:.2f} ms")
+
+if __name__ == "__main__":
+    print("[INFO] Benchmarking patch cropping...")
+    run_benchmark()
+    print("[DONE]")
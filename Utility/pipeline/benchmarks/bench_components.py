@@ -0,0 +1,95 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: micro-benchmark for connected-component analysis on synthetic lesion masks
+#        legacy per-component np.where scan vs. single-pass cv2.connectedComponentsWithStats
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+import time
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+from pipeline.config.settings import IMAGE_SHAPE, SEED
+from pipeline.utils.geometry_utils import ComponentPixelIndex
+
+# brief: number of components per synthetic mask
+COMPONENT_COUNTS = [10, 100, 500, 1000, 2500, 5000]
+
+def _legacy_connected_component_centroids(mask: np.ndarray) -> List[Tuple[int,int,int]]:
+    # pre: mask is binary uint8
+    # post: list of (cx,cy,area) for each connected component
+    # desc: verbatim copy of the pre-stats implementation, kept here as the baseline
+
+    m = (mask > 0).astype(np.uint8)
+    n, lbl = cv2.connectedComponents(m)
+    out = []
+    for i in range(1, n):
+        ys, xs = np.where(lbl == i)
+        if xs.size == 0:
+            continue
+        cx = int(round(xs.mean()))
+        cy = int(round(ys.mean()))
+        out.append((cx, cy, int(xs.size)))
+    return out
+
+def make_synthetic_mask(n_components: int, shape=IMAGE_SHAPE, seed=SEED) -> np.ndarray:
+    # pre: n_components fits on a 4 px grid over shape
+    # post: binary uint8 mask with exactly n_components separated 2x2..3x3 blobs
+    # desc: places microaneurysm-sized blobs on random cells of a 4 px grid so they never touch
+
+    rng = np.random.default_rng(seed)
+    h, w = shape
+    cells_y, cells_x = (h - 4) // 4, (w - 4) // 4
+    picks = rng.choice(cells_y * cells_x, size=n_components, replace=False)
+    sizes = rng.integers(2, 4, size=n_components)
+
+    mask = np.zeros(shape, dtype=np.uint8)
+    for cell, s in zip(picks, sizes):
+        y, x = divmod(int(cell), cells_x)
+        mask[4 * y:4 * y + s, 4 * x:4 * x + s] = 1
+    return mask
+
+def _time(fn, *args, repeat=3) -> float:
+    # pre: fn is callable
+    # post: best wall time in seconds over `repeat` runs
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def _new_path(mask: np.ndarray):
+    # desc: what PatchExtractionPipe now does per class mask (stats + CSR pixel index)
+    return ComponentPixelIndex.from_mask(mask)
+
+def run_benchmark(counts=COMPONENT_COUNTS):
+    # pre: counts is an iterable of component counts
+    # post: prints a timing table and checks both paths agree on centroids/areas
+
+    print(f"{'components':>10}  {'legacy [ms]':>12}  {'stats [ms]':>11}  {'speedup':>8}")
+    for n in counts:
+        mask = make_synthetic_mask(n)
+
+        legacy = _legacy_connected_component_centroids(mask)
+        index = _new_path(mask)
+        assert len(legacy) == n == len(index)
+        assert legacy == [(int(cx), int(cy), int(a)) for (cx, cy), a in zip(index.centroids, index.areas)]
+
+        repeat = 1 if n >= 2500 else 3
+        t_old = _time(_legacy_connected_component_centroids, mask, repeat=repeat)
+        t_new = _time(_new_path, mask)
+        print(f"{n:>10}  {t_old * 1e3:>12.1f}  {t_new * 1e3:>11.1f}  {t_old / t_new:>7.1f}x")
+
+if __name__ == "__main__":
+    print("[INFO] Benchmarking connected-component analysis...")
+    run_benchmark()
+    print("[DONE]")
@@ -0,0 +1,98 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: per-image healthy-sampling benchmark
+#        legacy rejection loop (_random_point_in_mask + crop + is_mostly_black) vs. HealthySampler
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+import math
+import time
+
+import cv2
+import numpy as np
+
+from pipeline.config.settings import (IMAGE_SHAPE, PATCH_SIZE, SEED, LESION_DILATE_PX,
+                                      HEALTHY_TO_LESION_RATIO)
+from pipeline.utils.geometry_utils import _random_point_in_mask, _reflective_crop, _dilate
+from pipeline.utils.image_utils import is_mostly_black, DarknessTable
+from pipeline.utils.sampling_utils import HealthySampler
+
+# brief: lesion counts per synthetic image (healthy target = ratio * lesions)
+LESION_COUNTS = [20, 100, 400]
+
+def make_synthetic_fundus(n_lesions: int, shape=IMAGE_SHAPE, seed=SEED):
+    # pre: n_lesions >= 0
+    # post: (image, allowed) -> RGB fundus-like image with black corners, allowed-center mask
+    # desc: bright disc on black background (FOV) + small lesion blobs kept out by dilation
+
+    rng = np.random.default_rng(seed)
+    h, w = shape
+    image = np.zeros((h, w, 3), dtype=np.uint8)
+    cv2.circle(image, (w // 2, h // 2), int(0.47 * min(h, w)), (140, 70, 30), -1)
+    image = cv2.add(image, rng.integers(0, 15, image.shape, dtype=np.uint8))
+
+    lesions = np.zeros(shape, dtype=np.uint8)
+    for x, y in rng.integers(200, min(h, w) - 200, size=(n_lesions, 2)):
+        cv2.circle(lesions, (int(x), int(y)), int(rng.integers(2, 8)), 1, -1)
+    allowed = cv2.bitwise_not(_dilate(lesions, LESION_DILATE_PX))
+    return image, allowed
+
+def legacy_sampling(image, allowed, n_target):
+    # desc: the pre-HealthySampler loop from PatchExtractionPipe (minus the write)
+    np.random.seed(SEED)
+    kept, tries = 0, 0
+    max_tries = max(5000, 20 * max(1, n_target))
+    while kept < n_target and tries < max_tries:
+        tries += 1
+        pt = _random_point_in_mask(allowed)
+        if pt is None:
+            break
+        patch, _ = _reflective_crop(image, pt[0], pt[1], PATCH_SIZE)
+        if is_mostly_black(patch):
+            continue
+        kept += 1
+    return kept, tries
+
+def sampler_sampling(image, allowed, n_target):
+    # desc: the current loop (sampler built per image, crop only for accepted centers)
+    np.random.seed(SEED)
+    kept = 0
+    sampler = HealthySampler(allowed, DarknessTable(image))
+    max_tries = max(5000, 20 * max(1, n_target))
+    for cx, cy in sampler.candidates(max_tries):
+        _reflective_crop(image, cx, cy, PATCH_SIZE)
+        kept += 1
+        if kept >= n_target:
+            break
+    return kept, sampler.tries
+
+def run_benchmark(counts=LESION_COUNTS):
+    # pre: counts is an iterable of lesion counts
+    # post: prints per-image healthy-sampling time for both paths
+
+    print(f"{'lesions':>8}  {'target':>7}  {'legacy [s]':>11}  {'sampler [ms]':>13}  {'speedup':>8}")
+    for n in counts:
+        image, allowed = make_synthetic_fundus(n)
+        target = int(math.ceil(HEALTHY_TO_LESION_RATIO * n))
+
+        t0 = time.perf_counter()
+        kept_old, _ = legacy_sampling(image, allowed, target)
+        t_old = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        kept_new, _ = sampler_sampling(image, allowed, target)
+        t_new = time.perf_counter() - t0
+
+        assert kept_old == kept_new == target
+        print(f"{n:>8}  {target:>7}  {t_old:>11.2f}  {t_new * 1e3:>13.1f}  {t_old / t_new:>7.1f}x")
+
+if __name__ == "__main__":
+    print("[INFO] Benchmarking healthy-patch sampling (per image)...")
+    run_benchmark()
+    print("[DONE]")
@@ -0,0 +1,88 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: micro-benchmark for patch labeling over 10k patch centers
+#        legacy crop + np.any per (patch, class) vs. one vectorized LabelCube gather
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+import time
+
+import numpy as np
+
+from pipeline.benchmarks.bench_components import make_synthetic_mask
+from pipeline.config.settings import IMAGE_SHAPE, LESION_LABELS, PATCH_SIZE, SEED
+from pipeline.utils.mask_utils import LabelCube, PackedMask
+
+# brief: number of patch centers labelled per run
+N_CENTERS = 10_000
+
+def _legacy_labels(masks, centers):
+    # desc: verbatim copy of the per-patch loop of the pre-vectorized LabelPatchesPipe (minus logging)
+    out = []
+    for cx, cy in centers:
+        label_vector = []
+        for lesion_type in LESION_LABELS:
+            mask = masks.get(lesion_type)
+            if mask is None:
+                label_vector.append(0)
+                continue
+            y0, y1 = cy - PATCH_SIZE // 2, cy + PATCH_SIZE // 2
+            x0, x1 = cx - PATCH_SIZE // 2, cx + PATCH_SIZE // 2
+            lesion_crop = mask[y0:y1, x0:x1]
+            label_vector.append(int(np.any(lesion_crop > 0)))
+        out.append(label_vector)
+    return out
+
+def _new_labels(masks, centers):
+    # desc: what LabelPatchesPipe now does per image (reflect-padded cube build included)
+    cube = LabelCube(masks, IMAGE_SHAPE, pad=PATCH_SIZE // 2)
+    cx, cy = centers[:, 0], centers[:, 1]
+    x0, y0 = cx - PATCH_SIZE // 2, cy - PATCH_SIZE // 2
+    return cube.label_vectors(x0, y0, x0 + PATCH_SIZE, y0 + PATCH_SIZE)
+
+def _time(fn, *args, repeat=3) -> float:
+    # post: best wall time in seconds over `repeat` runs
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def run_benchmark(n=N_CENTERS):
+    # post: prints timings for dense and packed masks, checks both paths agree
+
+    rng = np.random.default_rng(SEED)
+    h, w = IMAGE_SHAPE
+    half = PATCH_SIZE // 2
+    # interior centers: the legacy slicing wraps around for windows crossing the top/left border
+    centers = np.stack([rng.integers(half, w - half, n), rng.integers(half, h - half, n)], axis=1)
+
+    dense = {
+        LESION_LABELS[0]: make_synthetic_mask(1000, seed=SEED),
+        LESION_LABELS[1]: make_synthetic_mask(100, seed=SEED + 1),
+        LESION_LABELS[2]: make_synthetic_mask(300, seed=SEED + 2),
+        LESION_LABELS[3]: None,
+    }
+    packed = {k: (PackedMask.from_array(m) if m is not None else None) for k, m in dense.items()}
+
+    legacy = _legacy_labels(dense, centers)
+    assert np.array_equal(np.array(legacy, dtype=np.uint8), _new_labels(dense, centers))
+    assert np.array_equal(np.array(legacy, dtype=np.uint8), _new_labels(packed, centers))
+
+    print(f"{'masks':>8}  {'legacy [ms]':>12}  {'cube [ms]':>10}  {'speedup':>8}")
+    for name, masks in (("dense", dense), ("packed", packed)):
+        t_old = _time(_legacy_labels, masks, centers, repeat=1)
+        t_new = _time(_new_labels, masks, centers)
+        print(f"{name:>8}  {t_old * 1e3:>12.1f}  {t_new * 1e3:>10.1f}  {t_old / t_new:>7.1f}x")
+
+if __name__ == "__main__":
+    print(f"[INFO] Benchmarking patch labeling over {N_CENTERS} centers...")
+    run_benchmark()
+    print("[DONE]")
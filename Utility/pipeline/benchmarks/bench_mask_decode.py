@@ -0,0 +1,74 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: micro-benchmark for lesion mask loading
+#        legacy exists() + RGB decode + channel 0 vs. single-channel decode into a PackedMask
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from pipeline.benchmarks.bench_components import make_synthetic_mask
+from pipeline.utils.io_utils import read_image
+from pipeline.utils.mask_utils import PackedMask, read_mask
+
+# brief: number of lesion components per synthetic mask (microaneurysm-like blobs)
+COMPONENT_COUNTS = [0, 10, 100, 1000, 5000]
+
+def _legacy_load(path: Path):
+    # desc: verbatim copy of the pre-packed LesionMaskLoadingPipe per-mask path, kept as the baseline
+    if path.exists():
+        return read_image(path)[:, :, 0]
+    return None
+
+def _new_load(path: Path):
+    # desc: what LesionMaskLoadingPipe now does per mask
+    m = read_mask(path)
+    return PackedMask.from_array(m) if m is not None else None
+
+def _time(fn, *args, repeat=20) -> float:
+    # post: best wall time in seconds over `repeat` runs
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def run_benchmark(counts=COMPONENT_COUNTS):
+    # post: prints decode time + resident mask size for both paths, checks they agree
+
+    print(f"{'components':>10}  {'legacy [ms]':>12}  {'packed [ms]':>12}  {'legacy [KB]':>12}  {'packed [KB]':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in counts:
+            mask = make_synthetic_mask(n) * 255
+            rgb = np.zeros(mask.shape + (3,), dtype=np.uint8)
+            rgb[:, :, 2] = mask  # red channel, stored as BGR
+            path = Path(tmp) / f"mask_{n}.png"
+            cv2.imwrite(str(path), rgb)
+
+            legacy = _legacy_load(path)
+            packed = _new_load(path)
+            assert np.array_equal(legacy > 0, packed.to_array() > 0)
+
+            t_old = _time(_legacy_load, path)
+            t_new = _time(_new_load, path)
+            print(f"{n:>10}  {t_old * 1e3:>12.2f}  {t_new * 1e3:>12.2f}  "
+                  f"{legacy.nbytes / 1024:>12.1f}  {packed.nbytes / 1024:>12.1f}")
+
+        missing = Path(tmp) / "missing.png"
+        print(f"{'missing':>10}  {_time(_legacy_load, missing) * 1e3:>12.3f}  {_time(_new_load, missing) * 1e3:>12.3f}")
+
+if __name__ == "__main__":
+    print("[INFO] Benchmarking lesion mask decoding...")
+    run_benchmark()
+    print("[DONE]")
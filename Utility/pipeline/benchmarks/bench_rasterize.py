@@ -0,0 +1,114 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: micro-benchmark for XML mask rasterization
+#        per-marking cv2 drawing vs. rasterize_markings vs. decoding the same masks from PNGs
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from pipeline.config.settings import IMAGE_SHAPE, LESION_LABELS, SEED, XML_LESION_MAP
+from pipeline.utils.mask_utils import PackedMask, read_mask
+from pipeline.utils.rasterize import rasterize_markings
+
+# brief: number of markings per annotation file (4 files = 4 experts per image)
+MARKING_COUNTS = [10, 100, 1000]
+EXPERTS = 4
+
+def make_synthetic_records(n: int, seed=SEED) -> list:
+    # post: n random circle / ellipse / polygon markings per expert, spread over the XML lesion types
+    rng = np.random.RandomState(seed)
+    h, w = IMAGE_SHAPE
+    types = list(XML_LESION_MAP)
+    records = []
+    for e in range(EXPERTS):
+        for _ in range(n):
+            x, y = float(rng.randint(50, w - 50)), float(rng.randint(50, h - 50))
+            r = {"xml_file": f"expert_{e}.xml", "type": types[rng.randint(len(types))], "x": x, "y": y,
+                 "radius": None, "radius_x": None, "radius_y": None, "angle": None, "polygon_points": []}
+            kind = rng.randint(3)
+            if kind == 0:
+                r.update(region_type="circleregion", radius=float(rng.randint(3, 30)))
+            elif kind == 1:
+                r.update(region_type="ellipseregion", radius_x=float(rng.randint(3, 40)),
+                         radius_y=float(rng.randint(3, 40)), angle=float(rng.randint(180)))
+            else:
+                t = np.sort(rng.uniform(0, 2 * np.pi, 8))
+                rad = rng.uniform(5, 40, 8)
+                r.update(region_type="polygonregion",
+                         polygon_points=list(zip((x + rad * np.cos(t)).tolist(), (y + rad * np.sin(t)).tolist())))
+            records.append(r)
+    return records
+
+def _per_marking(records):
+    # desc: the straightforward version, one cv2 draw call per marking (integer geometry)
+    out = np.zeros((len(LESION_LABELS),) + IMAGE_SHAPE, dtype=np.uint8)
+    for r in records:
+        plane = out[LESION_LABELS.index(XML_LESION_MAP[r["type"]])]
+        center = (int(r["x"]), int(r["y"]))
+        if r["region_type"] == "circleregion":
+            cv2.circle(plane, center, int(r["radius"]), 1, -1)
+        elif r["region_type"] == "ellipseregion":
+            cv2.ellipse(plane, center, (int(r["radius_x"]), int(r["radius_y"])), r["angle"], 0, 360, 1, -1)
+        else:
+            cv2.fillPoly(plane, [np.array(r["polygon_points"], dtype=np.int32)], 1)
+    return {lesion: PackedMask.from_array(out[k]) for k, lesion in enumerate(LESION_LABELS)}
+
+def _rasterize(records):
+    # desc: what XMLMaskLoadingPipe does after parsing
+    stack = rasterize_markings(records, IMAGE_SHAPE)
+    return {lesion: PackedMask.from_array(stack[k]) for k, lesion in enumerate(LESION_LABELS)}
+
+def _decode(paths):
+    # desc: what LesionMaskLoadingPipe does with precomputed mask PNGs
+    return {lesion: PackedMask.from_array(read_mask(p)) for lesion, p in paths.items()}
+
+def _time(fn, *args, repeat=10) -> float:
+    # post: best wall time in seconds over `repeat` runs
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def run_benchmark(counts=MARKING_COUNTS):
+    # post: prints time per image for the three paths; the rasterized masks must cover the
+    #       per-marking ones up to outline pixels (sub-pixel vs. integer geometry)
+
+    print(f"{'markings':>9}  {'per-marking [ms]':>17}  {'rasterize [ms]':>15}  {'png decode [ms]':>16}  {'px diff':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in counts:
+            records = make_synthetic_records(n)
+            masks = _rasterize(records)
+            baseline = _per_marking(records)
+            diff = sum(int((m.to_array() != baseline[k].to_array()).sum()) for k, m in masks.items())
+            total = sum(int(m.to_array().sum()) for m in baseline.values())
+            assert diff <= 0.05 * max(total, 1)
+
+            paths = {}
+            for lesion, m in masks.items():
+                rgb = np.zeros(IMAGE_SHAPE + (3,), dtype=np.uint8)
+                rgb[:, :, 2] = m.to_array() * 255  # red channel, stored as BGR
+                paths[lesion] = Path(tmp) / f"{lesion}_{n}.png"
+                cv2.imwrite(str(paths[lesion]), rgb)
+
+            t_loop = _time(_per_marking, records)
+            t_rast = _time(_rasterize, records)
+            t_png = _time(_decode, paths)
+            print(f"{n:>9}  {t_loop * 1e3:>17.2f}  {t_rast * 1e3:>15.2f}  {t_png * 1e3:>16.2f}  {diff / max(total, 1):>8.2%}")
+
+if __name__ == "__main__":
+    print("[INFO] Benchmarking XML mask rasterization...")
+    run_benchmark()
+    print("[DONE]")
@@ -0,0 +1,80 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: micro-benchmark for patch-window lesion queries
+#        linear shapely scan per window (the deprecated labelling path) vs. the LesionIndex grid
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+import time
+
+import numpy as np
+import shapely
+
+from pipeline.benchmarks.bench_rasterize import make_synthetic_records
+from pipeline.config.settings import IMAGE_SHAPE, PATCH_SIZE
+from pipeline.utils.spatial_index import LesionIndex
+
+# brief: markings per expert (4 experts per image) and the stride of the dense window grid
+MARKING_COUNTS = [10, 100, 1000]
+WINDOW_STRIDE = 16
+
+def _windows(stride=WINDOW_STRIDE):
+    # post: (x0, y0, x1, y1) of every PATCH_SIZE window on a stride grid over the image
+    h, w = IMAGE_SHAPE
+    ys, xs = np.mgrid[0:h - PATCH_SIZE + 1:stride, 0:w - PATCH_SIZE + 1:stride]
+    x0, y0 = xs.ravel().astype(np.float64), ys.ravel().astype(np.float64)
+    return x0, y0, x0 + PATCH_SIZE, y0 + PATCH_SIZE
+
+def _linear_scan(polygons, classes, n_labels, x0, y0, x1, y1):
+    # desc: every window tests every polygon (intersects + intersection area), as _deprecated_process did
+    out = np.zeros((len(x0), n_labels))
+    for i in range(len(x0)):
+        window = shapely.box(x0[i], y0[i], x1[i], y1[i])
+        hit = shapely.intersects(polygons, window)
+        if hit.any():
+            np.add.at(out[i], classes[hit], shapely.area(shapely.intersection(polygons[hit], window)))
+    return out
+
+def _indexed(records, x0, y0, x1, y1, exact):
+    # desc: build the index for the image, then one batch query for all windows
+    index = LesionIndex.from_records(records, IMAGE_SHAPE)
+    return index.window_areas(x0, y0, x1, y1, exact=exact)
+
+def _time(fn, *args, repeat=3) -> float:
+    # post: best wall time in seconds over `repeat` runs
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def run_benchmark(counts=MARKING_COUNTS):
+    # post: prints query time for all windows of one image, checks the exact areas agree
+
+    x0, y0, x1, y1 = _windows()
+    print(f"[INFO] {len(x0)} windows of {PATCH_SIZE}x{PATCH_SIZE} px per image")
+    print(f"{'lesions':>8}  {'linear [ms]':>12}  {'grid bbox [ms]':>15}  {'grid exact [ms]':>16}  {'speedup':>8}")
+    for n in counts:
+        records = make_synthetic_records(n)
+        index = LesionIndex.from_records(records, IMAGE_SHAPE)
+        polygons = index._shapely_polygons()
+
+        baseline = _linear_scan(polygons, index.classes, len(index.labels), x0, y0, x1, y1)
+        assert np.allclose(baseline, index.window_areas(x0, y0, x1, y1, exact=True))
+
+        t_lin = _time(_linear_scan, polygons, index.classes, len(index.labels), x0, y0, x1, y1, repeat=1)
+        t_box = _time(_indexed, records, x0, y0, x1, y1, False)
+        t_ex = _time(_indexed, records, x0, y0, x1, y1, True)
+        print(f"{len(index):>8}  {t_lin * 1e3:>12.1f}  {t_box * 1e3:>15.1f}  {t_ex * 1e3:>16.1f}  {t_lin / t_ex:>7.1f}x")
+
+if __name__ == "__main__":
+    print("[INFO] Benchmarking patch-window lesion queries...")
+    run_benchmark()
+    print("[DONE]")
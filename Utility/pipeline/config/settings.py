@@ -26,8 +26,21 @@ MASTER_PATHS_CSV_PATH = PATCH_OUTPUT_DIR / "master_paths.csv"         # 4
 TARGET_DF = "patch_frame.pkl"   # 1
 SUBDIR = "frame"                # 2
 
-# brief: path to a folder used for intermediate caching of pipeline results (unused as of right now)
-CACHE_DIR = PIPELINE_DIR / "cache"
+# 1. brief: patch metadata backend -> "columnar" (append-only structured records) or "pickle" (legacy patch_frame.pkl per image)
+# 2. brief: directory holding the columnar metadata segments
+# 3. brief: path to the consolidated columnar master index (structured .npy, memory-mappable)
+METADATA_BACKEND = "columnar"                             # 1
+PATCH_META_DIR = PATCH_OUTPUT_DIR / "meta"                # 2
+MASTER_INDEX_PATH = PATCH_OUTPUT_DIR / "master_index.npy"  # 3
+
+# 1. brief: path to a folder used for intermediate caching of pipeline results (@see utils/stage_cache.py)
+# 2. brief: if True, the drivers wrap the mask loading + component analysis pipes in a CachedPipe
+# 3. brief: byte budget of the stage cache, least recently used entries are evicted beyond it
+# 4. brief: code version of the cached pipes -> bump whenever their logic changes, invalidates every entry
+CACHE_DIR = PIPELINE_DIR / "cache"      # 1
+STAGE_CACHE = True                      # 2
+CACHE_MAX_BYTES = 4 * 1024 ** 3         # 3 (4 GB)
+CACHE_VERSION = 3                       # 4
 
 PATCH_SIZE = 128                    # 128 x 128 -> 100 pathches per image
 PATCH_HALF = PATCH_SIZE // 2
@@ -75,6 +88,27 @@ COLOR_MAP = {
 #       it is also used to generate labels for patches in the labeling pipeline.
 LESION_LABELS = list(LESION_MASKS.keys())
 
+# 1. brief: where the lesion masks come from -> "png" (precomputed masks under MASK_ROOT) or
+#           "xml" (rasterized from the XML annotations, @see pipes/xml_masks.py), no mask PNGs needed
+# 2. brief: directory holding the XML annotation files (one file per image and expert)
+# 3. brief: file name pattern of an image's annotation files ({stem} = image file name without suffix)
+#           note: DIARETDB1 ships every annotation twice (_01.xml, _01_plain.xml) -> only one is matched
+# 4. brief: XML marking type -> lesion type (LESION_LABELS); unlisted types (Disc, IRMA, ...) are not rasterized
+# 5. brief: (h, w) of the images the annotations were drawn on, coordinates are scaled from it to
+#           IMAGE_SHAPE (None -> annotations are already in IMAGE_SHAPE pixels)
+# 6. brief: a pixel is lesion if at least this many annotation files (experts) mark it (1 -> union)
+MASK_SOURCE = "png"                                             # 1
+XML_ANNOTATION_DIR = BASE_DIR / "data" / "groundtruth"          # 2
+XML_ANNOTATION_PATTERN = "{stem}_[0-9][0-9].xml"                # 3
+XML_LESION_MAP = {                                              # 4
+    'Red_small_dots': 'microaneurysms',
+    'Haemorrhages': 'hemorrhages',
+    'Hard_exudates': 'hard_exudates',
+    'Soft_exudates': 'soft_exudates',
+}
+XML_SOURCE_SHAPE = None                                         # 5
+XML_MIN_EXPERTS = 1                                             # 6
+
 # 1. brief: maximum number of patches/images per shard (e.g. healthy_n has SHARD_DIR_LIMIT patches)
 # 2. brief: maximum number of healthy patches to retain in the final dataset (30k as of right now)
 # 3. brief: maximum number of black patches to retain in the final dataset (2k as of right now)
@@ -82,6 +116,11 @@ SHARD_DIR_LIMIT = 1000          # 1
 HEALTHY_PATCHES_LIMIT = 30000   # 2
 BLACK_PATCHES_LIMIT = 2000      # 3
 
+# 1. brief: patch output backend -> "png" (one file per patch) or "shard" (SHARD_DIR_LIMIT raw patches per file)
+# 2. brief: directory holding the shard files and their offset index when PATCH_BACKEND == "shard"
+PATCH_BACKEND = "png"                           # 1
+PATCH_SHARD_DIR = PATCH_OUTPUT_DIR / "shards"   # 2
+
 # 1. brief: threshold for determining if a patch is mostly black (in pixels)
 # 2. brief: ratio of black pixels in a patch to consider it mostly black
 # 3. brief: minimum number of black pixels in a patch to consider it mostly black
@@ -89,6 +128,16 @@ PATCH_BLACK_THRESHOLD = 10     # 1
 BLACK_RATIO = 0.90             # 2
 BLACK_PIXELS_THRESHOLD = BLACK_RATIO * pow(PATCH_SIZE, 2) # 3 0.88 * patch_size^2 (128 * 128 = 16384)
 
+# brief: number of candidate centers drawn (and black-checked) per batch by the healthy sampler
+HEALTHY_SAMPLE_BATCH = 64
+
+# 1. brief: PNG compression level used when writing patches (0-9, cv2 default is 1 = fastest)
+# 2. brief: number of background threads encoding + writing patches
+# 3. brief: max patches waiting to be written before the sampler blocks (backpressure)
+PNG_COMPRESSION_LEVEL = 1       # 1
+WRITER_THREADS = 2              # 2
+WRITER_QUEUE_SIZE = 256         # 3
+
 # brief: if False, tqdm bar behaves as normal, else it's turned [OFF]
 DISABLE_TQDM = False # default behavior
 
@@ -101,6 +150,30 @@ def toggle_disable_tqdm(default=False):
 # brief: batch size when running the pipeline in parallel
 BATCH_SIZE = 100
 
+# brief: number of worker processes for the parallel runner (None -> half the cores)
+NUM_WORKERS = None
+
+# 1. brief: fixed per-image cost (in bytes of mask source files) added to every estimate by the scheduler
+# 2. brief: guided scheduling factor -> each chunk targets remaining_cost / (factor * workers)
+SCHED_BASE_COST = 20000     # 1
+SCHED_CHUNK_FACTOR = 2      # 2
+
+# 1. brief: if True, the parallel runner decodes images in dedicated processes and hands them to the
+#           workers through a shared-memory ring (@see utils/shm_ring.py) instead of per-worker decoding
+# 2. brief: number of ring slots -> bounds how many decoded images wait in memory (~4.9 MB each)
+# 3. brief: number of decoder processes filling the ring
+SHM_HANDOFF = False         # 1
+SHM_SLOTS = 8               # 2
+SHM_DECODERS = 1            # 3
+
+# 1. brief: staged execution of a single pipeline (@see DRPipeline.stream_staged) -> one
+#           (number of consecutive pipes, threads) pair per stage, None = plain sequential run
+#           e.g. for load, masks, components, extract, label, save:
+#           [(1, 2), (2, 1), (1, 4), (1, 2), (1, 2)] -> 2 decoders, 4 samplers, 2 labelers, 2 savers
+# 2. brief: capacity of the bounded queue in front of every stage (images in flight per queue)
+PIPELINE_STAGES = None      # 1
+STAGE_QUEUE_SIZE = 4        # 2
+
 # brief: maximum number of healthy patches to retain in each batch when running in parallel
 # note: this is used to limit the number of healthy patches processed in each parallel batch
 #       to avoid overwhelming the system with too many healthy patches at once + I don't want to rewrite my pipe
@@ -114,6 +187,7 @@ HEALTHY_PATCHES_LIMIT_MP = HEALTHY_PATCHES_LIMIT // BATCH_SIZE  # for multiproce
 # 4. brief: path to the log file that stores batch processing results in JSON format
 # 5. brief: maximum size of the log file in bytes before rotating
 # 6. brief: number of backup log files to retain
+# 7. brief: SQLite completion ledger (one row per finished image + config hash), replaces BATCH_LOG_PATH for resuming
 
 LOG_ALL = False                                              # 1
 LOG_DIR = Path(__file__).resolve().parent.parent / "logs"    # 2
@@ -121,6 +195,7 @@ LOG_FILE = LOG_DIR / "pipeline.log"                          # 3
 BATCH_LOG_PATH = LOG_DIR / "batch_log.json"                  # 4
 MAX_BYTES = 512 * 1024  # 512 KB                             # 5
 BACKUP_COUNT = 2                                             # 6
+LEDGER_PATH = LOG_DIR / "ledger.sqlite"                      # 7
 
 # ===== logging =====
 
@@ -10,67 +10,360 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 # == sys path ==
 
-from typing import List, Dict
-
-import pandas as pd
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 from pipeline.utils.logger import get_logger
-from pipeline.utils.io_utils import ensure_dir
-from pipeline.config.settings import LOG_ALL, DISABLE_TQDM
+from pipeline.config import settings
+from pipeline.config.settings import LOG_ALL, STAGE_QUEUE_SIZE
 from pipeline.utils.io_utils import tqdm_if_verbose
 
 logger = get_logger(__name__, file_logging=True)
 
+# brief: keys kept in the results of run()/stream() by default (on top of the input keys)
+# note: everything else a pipe provides (image, masks, ...) is dropped as soon as no later pipe needs it
+DEFAULT_RETAIN = ("patches",)
+
+# brief: keys every dataset item carries before the first pipe runs (@see io_utils.read_csv_image_paths)
+PIPELINE_INPUTS = ("image_path", "image_id", "grade")
+
+# brief: end-of-input marker passed between the stages of a staged run
+_END = object()
+
 class Pipe:
     # brief: base class for all pipeline components
+    # note: requires -> keys process() reads from data
+    #       provides -> keys process() writes to data
+    #       consumes -> keys process() takes out of data (popped, unavailable to later pipes)
+    #       DRPipeline validates the chain against these at build time and uses them to drop large
+    #       intermediates (image, masks) right after their last use.
+    #       a pipe that doesn't declare `requires` (None) is treated as reading everything.
+    requires: Optional[Tuple[str, ...]] = None
+    provides: Tuple[str, ...] = ()
+    consumes: Tuple[str, ...] = ()
+    deprecated: bool = False  # deprecated pipes are rejected by DRPipeline
+
+    # brief: settings (names in settings.py) that change this pipe's output -> part of its cache key
+    cache_settings: Tuple[str, ...] = ()
+
     def process(self, data: Dict) -> Dict:
         raise NotImplementedError("{!important!} each pipe must implement a process() method")
 
+    def cache_files(self, data: Dict) -> List[Path]:
+        # post: the files this pipe's output is derived from (hashed into its cache key)
+        # note: @see utils/stage_cache.py | CachedPipe
+        return [Path(data["image_path"])]
+
+@dataclass
+class StageStats:
+    # brief: counters of one stage of a staged run, @see DRPipeline.stream_staged
+    # note: a stage whose input queue sits near capacity while the queues after it stay near
+    #       empty is the bottleneck -> give it more threads (or the stage before it fewer)
+    name: str
+    threads: int
+    capacity: int
+    items: int = 0
+    busy_s: float = 0.0     # summed process() time over the stage's threads
+    idle_s: float = 0.0     # summed time its threads waited for input
+    depth_sum: int = 0      # input queue depth, sampled every time an item is taken
+    depth_max: int = 0
+
+    def record(self, depth: int, busy: float, idle: float) -> None:
+        self.items += 1
+        self.busy_s += busy
+        self.idle_s += idle
+        self.depth_sum += depth
+        self.depth_max = max(self.depth_max, depth)
+
+    @property
+    def mean_depth(self) -> float:
+        return self.depth_sum / self.items if self.items else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.name} x{self.threads}: {self.items} items, busy {self.busy_s:.2f}s, "
+                f"idle {self.idle_s:.2f}s, input queue {self.mean_depth:.1f}/{self.capacity} (max {self.depth_max})")
+
 class DRPipeline:
     # brief: manages and runs a sequential set of data processing steps
 
-    def __init__(self, pipes: List[Pipe], batch_idx=None):
+    def __init__(self, pipes: List[Pipe], batch_idx=None, ledger=None, inputs: Iterable[str] = PIPELINE_INPUTS,
+                 stages: Optional[Sequence[Tuple[int, int]]] = None):
         # pre: pipes is a list of classes with a `process()` method
-        # post: initializes a pipeline with registered stages
+        #      ledger is an optional CompletionLedger (@see utils/ledger.py)
+        #      inputs are the keys each dataset item starts with
+        #      stages is an optional (number of pipes, threads) list -> run() goes through stream_staged()
+        # post: initializes a pipeline with registered stages; raises if the chain is invalid
         self.pipes = pipes
         self.batch_idx = batch_idx
+        self.ledger = ledger
+        self.inputs = tuple(inputs)
+        self.validate()
+        self._skippable = [self._is_skippable(pipe) for pipe in pipes]
+        self.stages = self.stage_bounds(stages) if stages else None
+        self.stage_stats: List[StageStats] = []
         logger.info(f"[Main Line] Initialized with {len(pipes)} pipes") if LOG_ALL else None
 
-    def run(self, dataset: List[Dict]) -> List[Dict]:
+    def validate(self) -> None:
+        # post: returns if every pipe has process(), isn't deprecated, and finds all of its required
+        #       keys among the inputs + what earlier pipes provide (minus what they consumed)
+        # desc: raises TypeError / ValueError at build time instead of failing on the first image
+
+        available = set(self.inputs)
+        for i, pipe in enumerate(self.pipes):
+            name = pipe.__class__.__name__
+            if not callable(getattr(pipe, "process", None)):
+                raise TypeError(f"[Main Line] pipe {i} ({name}) has no process() method")
+            if getattr(pipe, "deprecated", False):
+                raise ValueError(f"[Main Line] pipe {i} ({name}) is deprecated and can't be part of a pipeline")
+
+            requires = getattr(pipe, "requires", None)
+            consumes = tuple(getattr(pipe, "consumes", ()))
+            missing = [key for key in tuple(requires or ()) + consumes if key not in available]
+            if missing:
+                raise ValueError(f"[Main Line] pipe {i} ({name}) needs {missing}, which neither the inputs "
+                                 f"nor an earlier pipe provide (available: {sorted(available)})")
+            available |= set(getattr(pipe, "provides", ()))
+            available -= set(consumes)
+
+    def stage_bounds(self, stages: Sequence[Tuple[int, int]]) -> List[Tuple[int, int, int]]:
+        # pre: stages is a list of (number of consecutive pipes, threads)
+        # post: (first pipe, end pipe, threads) per stage; raises if the stages don't cover the pipes exactly
+        bounds, lo = [], 0
+        for n_pipes, threads in stages:
+            if n_pipes < 1 or threads < 1:
+                raise ValueError(f"[Main Line] invalid stage ({n_pipes} pipes, {threads} threads)")
+            bounds.append((lo, lo + n_pipes, threads))
+            lo += n_pipes
+        if lo != len(self.pipes):
+            raise ValueError(f"[Main Line] stages cover {lo} pipes, the pipeline has {len(self.pipes)}")
+        return bounds
+
+    @staticmethod
+    def _is_skippable(pipe) -> bool:
+        # post: True if the pipe only adds keys (doesn't update one it reads), so it can be skipped
+        #       once all of them are already in data (e.g. restored from a cache)
+        provides = set(getattr(pipe, "provides", ()))
+        requires = getattr(pipe, "requires", None)
+        return bool(provides) and requires is not None and not provides & set(requires)
+
+    def eviction_plan(self, retain: Optional[Iterable[str]] = DEFAULT_RETAIN) -> List[List[str]]:
+        # pre: retain is the set of keys the caller wants back (None = keep everything)
+        # post: plan[i] = keys to delete from data right after pipes[i] has run
+        # desc: a key provided by some pipe dies after the last pipe that requires (or provides) it;
+        #       an undeclared pipe keeps every key provided before it alive up to itself.
+        #       consumed keys are already gone after their consumer, so they need no eviction
+
+        plan: List[List[str]] = [[] for _ in self.pipes]
+        if retain is None:
+            return plan
+
+        last: Dict[str, int] = {}
+        provided = set()
+        for i, pipe in enumerate(self.pipes):
+            requires = getattr(pipe, "requires", None)
+            provides = tuple(getattr(pipe, "provides", ()))
+            consumes = tuple(getattr(pipe, "consumes", ()))
+            provided.update(provides)
+            if requires is None:
+                for key in provided:
+                    last[key] = i
+            for key in tuple(requires or ()) + provides + consumes:
+                last[key] = i
+
+        keep = set(retain)
+        for key in sorted(provided - keep):
+            consumer = last[key]
+            if key not in getattr(self.pipes[consumer], "consumes", ()):
+                plan[consumer].append(key)
+        return plan
+
+    def stream(self, dataset: List[Dict], retain: Optional[Iterable[str]] = DEFAULT_RETAIN,
+               keep_open: bool = False) -> Iterator[Dict]:
         # pre: dataset is a list of dicts, each representing one input case
-        # post: returns dataset after passing through all pipe stages
-        # desc: applies each pipe sequentially to each item in the dataset
+        # post: yields one result per (not yet completed) item: its input keys + the `retain` keys;
+        #       with keep_open the pipes' background resources stay up for the next run (caller closes)
+        # desc: applies each pipe sequentially to each item, evicting keys per eviction_plan(), so
+        #       at most one image's buffers are alive at a time. a pipe whose outputs are all
+        #       present already (e.g. passed in or restored from a cache) is skipped
+        # note: with a ledger, items already completed under the same config are skipped (set lookup)
+        #       and every item is recorded as done right after its last pipe returns
 
         logger.info(f"[Main Line] Starting run on {len(dataset)} items") if LOG_ALL else None
-        results = []
+        plan = self.eviction_plan(retain)
+        dataset = self._pending(dataset)
+
+        try:
+            for item in tqdm_if_verbose(dataset, desc="Running Pipeline", disable=settings.DISABLE_TQDM):
+                data = self._apply(item.copy(), 0, len(self.pipes), plan)
+                if self.ledger is not None:
+                    self.ledger.mark_done([item["image_id"]])
+                yield data
+        finally:
+            self.close() if not keep_open else None
+
+        logger.info("[Main Line] Run complete") if LOG_ALL else None
 
-        for item in tqdm_if_verbose(dataset, desc="Running Pipeline", disable=DISABLE_TQDM):
-            data = item.copy()
-            for pipe in self.pipes:
-                pipe_name = pipe.__class__.__name__
+    def _pending(self, dataset: List[Dict]) -> List[Dict]:
+        # post: dataset minus the items the ledger has as completed under the same config
+        if self.ledger is None:
+            return dataset
+        done = self.ledger.completed()
+        todo = [item for item in dataset if item.get("image_id") not in done]
+        if len(todo) < len(dataset):
+            logger.info(f"[Main Line] Skipping {len(dataset) - len(todo)} completed items") if LOG_ALL else None
+        return todo
+
+    def _apply(self, data: Dict, lo: int, hi: int, plan: List[List[str]]) -> Dict:
+        # post: pipes[lo:hi] applied to data, evicting keys per plan; pipes with all outputs present are skipped
+        for pipe, dead, skippable in zip(self.pipes[lo:hi], plan[lo:hi], self._skippable[lo:hi]):
+            pipe_name = pipe.__class__.__name__
+            if skippable and all(key in data for key in pipe.provides):
+                logger.debug(f"[Main Line] Skipping pipe: {pipe_name} (outputs present)") if LOG_ALL else None
+            else:
                 logger.debug(f"[Main Line] Running pipe: {pipe_name}") if LOG_ALL else None
                 data = pipe.process(data)
-            results.append(data)
+            for key in dead:
+                data.pop(key, None)
+        return data
 
-        logger.info("[Main Line] Run complete") if LOG_ALL else None
+    def stream_staged(self, dataset: List[Dict], retain: Optional[Iterable[str]] = DEFAULT_RETAIN,
+                      stages: Optional[Sequence[Tuple[int, int]]] = None,
+                      queue_size: int = STAGE_QUEUE_SIZE, keep_open: bool = False) -> Iterator[Dict]:
+        # pre: stages (default: the ones given at construction) cover the pipes in order, @see stage_bounds;
+        #      the pipes of a stage with more than one thread must be thread-safe
+        # post: same results as stream(), yielded in completion order; self.stage_stats holds one
+        #       StageStats per stage once the run is over (also logged)
+        # desc: every stage runs its pipes on its own threads, stages are connected by bounded
+        #       queues (backpressure: a full queue blocks the stage in front of it). cv2 decode,
+        #       encode and most numpy work release the GIL, so e.g. PNG decoding overlaps with
+        #       sampling even though everything runs in one process
+        # note: the ledger is only touched from the consuming thread (sqlite connections are per thread)
+
+        bounds = self.stage_bounds(stages) if stages else self.stages
+        if not bounds:
+            raise ValueError("[Main Line] stream_staged needs stages, none were given")
+
+        logger.info(f"[Main Line] Starting staged run on {len(dataset)} items") if LOG_ALL else None
+        plan = self.eviction_plan(retain)
+        dataset = self._pending(dataset)
 
-        # # collect all patches into a dataframe
-        # all_patches = []
-        # for result in results:
-        #     all_patches.extend(result.get("patches", []))
+        queues = [queue.Queue(maxsize=queue_size) for _ in range(len(bounds) + 1)]
+        stats = [StageStats("+".join(getattr(p, "wrapped", p).__class__.__name__ for p in self.pipes[lo:hi]),
+                            threads, queue_size)
+                 for lo, hi, threads in bounds]
+        self.stage_stats = stats
+        remaining = [threads for _, _, threads in bounds]
+        lock = threading.Lock()
+        stop = threading.Event()
+        errors: List[BaseException] = []
 
-        # patch_df = pd.DataFrame(all_patches)
-        # logger.info(f"[Main Line] Final patch dataframe shape: {patch_df.shape}") if LOG_ALL else None
+        def put(q: queue.Queue, obj) -> bool:
+            # post: obj queued (True), or the run was stopped first (False)
+            while not stop.is_set():
+                try:
+                    q.put(obj, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
 
-        # # store as attribute so it can be processed after running it
-        # self.patch_df = patch_df
+        def feed() -> None:
+            for item in dataset:
+                if not put(queues[0], item.copy()):
+                    return
+            for _ in range(bounds[0][2]):
+                put(queues[0], _END)
 
-        # batch_idx = results[0].get("batch_idx", None)
-        # pickle_path = PATCHES_PICKLE if self.batch_idx is None else PATCHES_PICKLE.parent / f"patches_batch_{self.batch_idx}.pkl"
+        def work(s: int) -> None:
+            lo, hi, _ = bounds[s]
+            inq, outq = queues[s], queues[s + 1]
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                try:
+                    data = inq.get(timeout=0.1)
+                except queue.Empty:
+                    with lock:
+                        stats[s].idle_s += time.perf_counter() - t0
+                    continue
+                depth = inq.qsize()
+                t1 = time.perf_counter()
+
+                if data is _END:
+                    # the last thread of a stage to finish hands one end marker to every thread of the next
+                    with lock:
+                        remaining[s] -= 1
+                        last = remaining[s] == 0
+                    if last:
+                        for _ in range(bounds[s + 1][2] if s + 1 < len(bounds) else 1):
+                            put(outq, _END)
+                    return
+
+                try:
+                    data = self._apply(data, lo, hi, plan)
+                except BaseException as e:
+                    errors.append(e)
+                    stop.set()
+                    return
+                with lock:
+                    stats[s].record(depth, time.perf_counter() - t1, t1 - t0)
+                put(outq, data)
+
+        workers = [threading.Thread(target=feed, name="stage-feed", daemon=True)]
+        for s, (_, _, threads) in enumerate(bounds):
+            workers += [threading.Thread(target=work, args=(s,), name=f"stage-{s}-{t}", daemon=True)
+                        for t in range(threads)]
+
+        def drain() -> Iterator[Dict]:
+            while True:
+                try:
+                    data = queues[-1].get(timeout=0.1)
+                except queue.Empty:
+                    if errors:
+                        raise errors[0]
+                    continue
+                if data is _END:
+                    return
+                yield data
+
+        try:
+            for w in workers:
+                w.start()
+            for data in tqdm_if_verbose(drain(), desc="Running Pipeline", total=len(dataset),
+                                        disable=settings.DISABLE_TQDM):
+                if self.ledger is not None:
+                    self.ledger.mark_done([data["image_id"]])
+                yield data
+            if errors:
+                raise errors[0]
+        finally:
+            stop.set()
+            for w in workers:
+                w.join()
+            self.close() if not keep_open else None
+            for st in stats:
+                logger.info(f"[Main Line] stage {st}")
+
+        logger.info("[Main Line] Staged run complete") if LOG_ALL else None
+
+    def run(self, dataset: List[Dict], retain: Optional[Iterable[str]] = DEFAULT_RETAIN,
+            keep_open: bool = False) -> List[Dict]:
+        # pre: dataset is a list of dicts, each representing one input case
+        # post: returns the (lightweight) results of stream() (stream_staged() if the pipeline has
+        #       stages), pass retain=None to keep every key
+        # note: keep_open=True skips close() at the end, for callers that run the same pipeline
+        #       many times (e.g. once per image / chunk in a worker) and close it once on exit
+        if self.stages:
+            return list(self.stream_staged(dataset, retain=retain, keep_open=keep_open))
+        return list(self.stream(dataset, retain=retain, keep_open=keep_open))
 
-        # ensure_dir(pickle_path.parent)
-        # patch_df.to_pickle(pickle_path)
-        # if LOG_ALL:
-        #     logger.info(f"saved patch dataframe to {pickle_path}")
+    def close(self) -> None:
+        # post: every pipe that holds background resources (e.g. SavePatchesPipe's writers) has released them
+        # desc: pipes opt in by defining close(); called at the end of each run (unless keep_open)
 
-        # return results
+        for pipe in self.pipes:
+            close = getattr(pipe, "close", None)
+            if callable(close):
+                close()
@@ -12,112 +12,247 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parents[2]))
 # == sys path ==
 
-import json
 import os
-from multiprocessing import Pool
+import queue
+import multiprocessing as mp
+from multiprocessing import Pool, util
 
-from filelock import FileLock
+import cv2
+import numpy as np
 
 from pipeline.pipes.load_image import LoadImagePipe
 from pipeline.pipes.clahe_green import CLAHEGreenChannelPipe
-from pipeline.pipes.lesion_masks import LesionMaskLoadingPipe
+from pipeline.pipes.xml_masks import mask_loading_pipe
+from pipeline.pipes.lesion_components import LesionComponentsPipe
 from pipeline.pipes.extract_patches import PatchExtractionPipe
 from pipeline.pipes.label_patches import LabelPatchesPipe
 from pipeline.pipes.save_patches import SavePatchesPipe
 
 from pipeline.core import DRPipeline
+from pipeline.utils.stage_cache import with_stage_cache
 
 from pipeline.utils.data_utils import load_and_prepare_metadata
+from pipeline.utils.dir_index import dataset_index
+from pipeline.utils.scheduler import estimate_image_cost, guided_chunks
+from pipeline.utils.ledger import CompletionLedger, config_hash
+from pipeline.utils.shm_ring import ShmRing
 
-from pipeline.config.settings import (BATCH_LOG_PATH, BATCH_SIZE,
+from pipeline.config.settings import (NUM_WORKERS, IMAGE_SHAPE, SHM_HANDOFF, SHM_SLOTS, SHM_DECODERS,
                                       toggle_disable_tqdm)
 
 from pipeline.utils.logger import get_logger
 
-from tqdm.contrib.concurrent import process_map # to track progress
+from tqdm import tqdm # to track progress
 
 logger = get_logger(__name__, file_logging=True)
 
-def load_log():
-    # pre: BATCH_LOG_PATH exists and is valid
-    # post: returns a dictionary with batch indices as keys and their status as values
-    # desc: loads the batch log from a JSON file, if it exists
+def build_pipes(index=None) -> list:
+    # pre: index is an optional DirectoryIndex of the image + mask folders (@see utils/dir_index.py)
+    # post: returns the pipe chain every worker runs (nothing is opened until the first image)
+    return [
+        LoadImagePipe(index=index),
+        with_stage_cache(mask_loading_pipe(index=index)),
+        with_stage_cache(LesionComponentsPipe()),
+        PatchExtractionPipe(),
+        LabelPatchesPipe(),
+        SavePatchesPipe(),
+    ]
+
+def build_pipeline(batch_idx=None, index=None) -> DRPipeline:
+    # post: returns the pipeline every worker runs, bound to the completion ledger of its config
+    pipes = build_pipes(index=index)
+    return DRPipeline(pipes=pipes, batch_idx=batch_idx,
+                      ledger=CompletionLedger(config=config_hash(pipes)))
+
+# brief: per-process worker state, filled once by _init_worker (pool initializer)
+_WORKER = {}
+
+def _init_worker(all_data, index):
+    # pre: all_data is the metadata list, index the DirectoryIndex the driver already built
+    # post: this worker holds the metadata, the index and one pipeline instance for its whole lifetime
+    # desc: runs once per worker process, so neither the CSV, the directory scan nor the pipe graph
+    #       is redone per chunk. the pipeline is closed when the worker exits (not after every chunk),
+    #       so its writers, shard stream and metadata segment are shared by all of the worker's chunks
+
+    toggle_disable_tqdm(True)
+    _WORKER["data"] = all_data
+    _WORKER["index"] = index
+    _WORKER["pipeline"] = build_pipeline(index=index)
+    util.Finalize(_WORKER["pipeline"], _WORKER["pipeline"].close, exitpriority=10)
+
+def run_pipeline_chunk(work_item):
+    # pre: work_item is (chunk_no, indices) -> positions in the worker's metadata list
+    # post: returns (chunk_no, image ids that completed)
+    # desc: only the slim index list crosses the process boundary. the chunk runs as one pipeline
+    #       run (which records each finished image in the ledger); if that fails, the images are
+    #       retried one by one -> the ones already recorded are skipped by the pipeline itself
+
+    chunk_no, indices = work_item
+    _WORKER["index"].refresh()  # one stat per indexed directory, rescans only the ones that changed
+    pipeline = _WORKER["pipeline"]
+    pipeline.batch_idx = chunk_no
+    items = [_WORKER["data"][i] for i in indices]
 
-    if BATCH_LOG_PATH.exists():
-        try:
-            with open(BATCH_LOG_PATH, "r") as f:
-                content = f.read().strip()
-                return json.loads(content) if content else {}
-        except json.JSONDecodeError:
-            print("[WARN] Corrupted batch log (or) starting fresh")
-            return {}
-    return {}
-
-def save_log(log):
-    # pre: log is a dictionary with batch indices as keys and their status as values
-    # post: writes the log to BATCH_LOG_PATH in JSON format
-    # desc: saves the batch log to a JSON file
     try:
-        lock_path = str(BATCH_LOG_PATH) + ".lock"
-        BATCH_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
-        with FileLock(lock_path):
-            with open(BATCH_LOG_PATH, "w") as f:
-                json.dump(log, f, indent=2)
-            logger.debug(f"Updated batch log: {BATCH_LOG_PATH}")
+        pipeline.run(items, retain=(), keep_open=True)  # nothing but completion is needed back
+        return chunk_no, [item["image_id"] for item in items]
     except Exception as e:
-        logger.error(f"[ERROR] Could not save batch log: {e}")
-
-def run_pipeline_batch(batch_idx, batch_size=BATCH_SIZE):
-    # pre: batch_idx is an integer representing the batch index
-    #      batch_size is an integer representing the number of samples per batch
-    #
-    # post: processes the batch of data and updates the log
-    # desc: runs the pipeline for a specific batch of data, skipping if already done
-
-    log = load_log()
-    if str(batch_idx) in log and log[str(batch_idx)] == "done":
-        print(f"[SKIP] Batch {batch_idx} already complete")
-        return
+        print(f"[WARN] Chunk {chunk_no} failed ({e}), retrying its {len(items)} images one by one")
 
-    print(f"[RUN] Batch {batch_idx}")
+    done = []
+    for item in items:
+        try:
+            pipeline.run([item], retain=(), keep_open=True)
+            done.append(item["image_id"])
+        except Exception as e:
+            print(f"[ERROR] Image {item['image_id']} failed: {e}")
+    return chunk_no, done
 
-    all_data = load_and_prepare_metadata()
-    start = batch_idx * batch_size
-    end = start + batch_size
-    batch_data = all_data[start:end]
-
-    pipeline = DRPipeline(
-        pipes=[
-            LoadImagePipe(),
-            LesionMaskLoadingPipe(),
-            PatchExtractionPipe(),
-            LabelPatchesPipe(),
-            SavePatchesPipe(),
-        ],
-        batch_idx=batch_idx)
+def _decode_worker(ring: ShmRing, items, index, results):
+    # pre: items is this decoder's share of the pending metadata, results a queue back to the driver
+    # post: every item is either published into the ring (RGB pixels in a slot, PackedMasks + shape
+    #       in the slot's metadata) or reported as failed on results
+    # desc: decodes straight into the slot (BGR->RGB conversion writes into shared memory). the masks
+    #       are loaded here too (stage cached) -> they are a few KB each, so they ride along pickled
+
+    toggle_disable_tqdm(True)
+    mask_pipe = with_stage_cache(mask_loading_pipe(index=index))
+    for item in items:
+        try:
+            bgr = cv2.imread(str(item["image_path"]))
+            if bgr is None:
+                raise ValueError(f"can't decode {item['image_path']}")
+            masks = mask_pipe.process(item.copy())["masks"]
+        except Exception as e:
+            results.put((item["image_id"], str(e)))
+            continue
+
+        slot = ring.acquire()  # blocks while every slot waits for a consumer (backpressure)
+        try:
+            cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=ring.slot(slot, bgr.shape))
+        except Exception as e:
+            ring.release(slot)
+            results.put((item["image_id"], str(e)))
+            continue
+        ring.publish(slot, {"item": item, "shape": bgr.shape, "masks": masks})
+    ring.close()
+
+def _ring_worker(ring: ShmRing, index, results):
+    # post: runs the pipeline on every image the decoders publish, until the end marker;
+    #       reports (image_id, None) or (image_id, error) per image on results
+    # desc: the image is a zero-copy view of its slot, so LoadImagePipe and the mask pipe are skipped
+    #       by the pipeline (their outputs are already present). the slot is released as soon as the
+    #       image's run returns -> nothing downstream keeps a view (patches are cropped copies)
+    # note: every image is its own run, but the pipeline is only closed once on exit -> the patch
+    #       writer threads, shard stream and metadata segment live as long as the worker
+
+    toggle_disable_tqdm(True)
+    pipeline = build_pipeline(index=index)
+    while True:
+        msg = ring.receive()
+        if msg is None:
+            break
+        slot, meta = msg
+        item = meta["item"]
+        error = None
+        try:
+            data = dict(item, image=ring.slot(slot, meta["shape"]), masks=meta["masks"])
+            pipeline.run([data], retain=(), keep_open=True)
+        except Exception as e:
+            error = str(e)
+        finally:
+            data = None
+            ring.release(slot)
+        results.put((item["image_id"], error))
+    pipeline.close()
+    pipeline.ledger.close()
+    ring.close()
+
+def _run_with_shm_ring(all_data, pending, index, num_workers, num_decoders=SHM_DECODERS, n_slots=SHM_SLOTS):
+    # pre: pending are positions in all_data of the images still to do
+    # post: every pending image was run by one of the workers (or reported as failed)
+    # desc: num_decoders processes decode images into a ShmRing, num_workers processes sample + label
+    #       + save from it. decoding and sampling scale independently, and no image array is ever
+    #       pickled. decoders walk their share in decreasing cost order, workers pull whatever is ready
+
+    ctx = mp.get_context()
+    ring = ShmRing(max(n_slots, num_workers + num_decoders), IMAGE_SHAPE + (3,), np.uint8, ctx)
+    results = ctx.Queue()
+
+    order = sorted(pending, key=lambda i: estimate_image_cost(all_data[i], index), reverse=True)
+    decoders = [ctx.Process(target=_decode_worker, daemon=True,
+                            args=(ring, [all_data[i] for i in order[d::num_decoders]], index, results))
+                for d in range(num_decoders)]
+    workers = [ctx.Process(target=_ring_worker, args=(ring, index, results), daemon=True)
+               for _ in range(num_workers)]
 
+    failed = []
     try:
-        _ = pipeline.run(batch_data)
-        log[str(batch_idx)] = "done"
+        for p in decoders + workers:
+            p.start()
+        with tqdm(total=len(pending)) as bar:
+            while bar.n < len(pending):
+                try:
+                    image_id, error = results.get(timeout=5)
+                except queue.Empty:
+                    dead = [p.pid for p in decoders + workers if p.exitcode not in (None, 0)]
+                    if dead:
+                        raise RuntimeError(f"[Parallel] ring processes {dead} died, aborting")
+                    continue
+                if error is not None:
+                    failed.append(image_id)
+                    print(f"[ERROR] Image {image_id} failed: {error}")
+                bar.update(1)
 
-        save_log(log)
-        print(f"[DONE] Batch {batch_idx}")
-    except Exception as e:
-        print(f"[ERROR] Batch {batch_idx} failed: {e}")
+        ring.finish(num_workers)
+        for p in decoders + workers:
+            p.join()
+    finally:
+        for p in decoders + workers:
+            if p.is_alive():
+                p.terminate()
+        ring.close()
+
+    if failed:
+        logger.warning(f"Shared-memory run: {len(failed)} images failed")
 
-def run_pipeline_in_parallel(batch_size=BATCH_SIZE):
-    # pre: batch_size is an integer representing the number of samples per batch
-    # post: runs the pipeline in parallel across multiple batches
-    # desc: divides the dataset into batches and processes each batch in parallel
-    #       using the cpu_count/2 number of workers
+def run_pipeline_in_parallel(num_workers=NUM_WORKERS, shm_handoff=SHM_HANDOFF):
+    # pre: num_workers is the pool size (None -> cpu_count/2)
+    # post: runs the pipeline in parallel over every image not yet marked done
+    # desc: images are dispatched in cost-sorted, shrinking chunks (see scheduler.guided_chunks) to a
+    #       persistent pool. workers append each finished image to the completion ledger,
+    #       so a rerun redoes exactly the images that never finished
+    # note: with shm_handoff the images are decoded by separate processes instead and handed over
+    #       through shared memory (@see _run_with_shm_ring)
 
-    num_workers = max(1, os.cpu_count() // 2) # floor div by 2...use only half the cores
+    if num_workers is None:
+        num_workers = max(1, os.cpu_count() // 2) # floor div by 2...use only half the cores
 
     all_data = load_and_prepare_metadata()
-    num_batches = (len(all_data) + batch_size - 1) // batch_size
-    batch_indices = list(range(num_batches))
+    index = dataset_index()  # one scandir per image/mask folder, shared with every worker
+
+    ledger = CompletionLedger(config=config_hash(build_pipes()))  # same config as the workers' ledgers
+    done = ledger.completed()
+    ledger.close()
+    pending = [i for i, item in enumerate(all_data) if item["image_id"] not in done]
+    print(f"[INFO] {len(all_data) - len(pending)} images already complete, {len(pending)} pending")
+
+    if shm_handoff:
+        _run_with_shm_ring(all_data, pending, index, num_workers)
+        return
+
+    costs = [estimate_image_cost(all_data[i], index) for i in pending]
+    chunks = guided_chunks(costs, num_workers)
+    work = [(n, [pending[j] for j in chunk]) for n, chunk in enumerate(chunks)]
 
-    process_map(run_pipeline_batch, batch_indices, max_workers=num_workers)
+    with Pool(processes=num_workers, initializer=_init_worker, initargs=(all_data, index)) as pool:
+        with tqdm(total=len(pending)) as bar:
+            for chunk_no, finished in pool.imap_unordered(run_pipeline_chunk, work):
+                if len(finished) < len(work[chunk_no][1]):
+                    logger.warning(f"Chunk {chunk_no}: {len(work[chunk_no][1]) - len(finished)} images failed")
+                bar.update(len(work[chunk_no][1]))
+        pool.close()
+        pool.join()  # workers exit on their own -> their pipelines are closed (terminate() would skip that)
 
 if __name__ == "__main__":
     toggle_disable_tqdm(True) # just to make sure it's on/off
@@ -13,26 +13,31 @@ sys.path.append(str(Path(__file__).resolve().parents[2]))
 # == sys path ==
 
 from pipeline.pipes.load_image import LoadImagePipe
-from pipeline.pipes.clahe_green import CLAHEGreenChannelPipe
-from pipeline.pipes.lesion_masks import LesionMaskLoadingPipe
+from pipeline.pipes.xml_masks import mask_loading_pipe
+from pipeline.pipes.lesion_components import LesionComponentsPipe
 from pipeline.pipes.extract_patches import PatchExtractionPipe
 from pipeline.pipes.label_patches import LabelPatchesPipe
 from pipeline.pipes.save_patches import SavePatchesPipe
 from pipeline.utils.data_utils import load_and_prepare_metadata
 
 from pipeline.core import DRPipeline
+from pipeline.utils.dir_index import dataset_index
+from pipeline.utils.stage_cache import with_stage_cache
+from pipeline.config.settings import PIPELINE_STAGES
 
 
 all_data = load_and_prepare_metadata()
 
+index = dataset_index()
+
 pipeline = DRPipeline([
-    LoadImagePipe(),
-    CLAHEGreenChannelPipe(),
-    LesionMaskLoadingPipe(),
+    LoadImagePipe(index=index),
+    with_stage_cache(mask_loading_pipe(index=index)),
+    with_stage_cache(LesionComponentsPipe()),
     PatchExtractionPipe(),
     LabelPatchesPipe(),
-    SavePatchesPipe(multiprocessing=False)
-])
+    SavePatchesPipe()
+], stages=PIPELINE_STAGES)  # None -> sequential, else staged threads (@see DRPipeline.stream_staged)
 
 _ = pipeline.run(all_data) # assignable
 
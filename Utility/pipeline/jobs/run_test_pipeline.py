@@ -12,12 +12,15 @@ sys.path.append(str(Path(__file__).resolve().parents[2]))
 
 from pipeline.pipes.load_image import LoadImagePipe
 from pipeline.pipes.clahe_green import CLAHEGreenChannelPipe
-from pipeline.pipes.lesion_masks import LesionMaskLoadingPipe
+from pipeline.pipes.xml_masks import mask_loading_pipe
+from pipeline.pipes.lesion_components import LesionComponentsPipe
 from pipeline.pipes.extract_patches import PatchExtractionPipe
 from pipeline.pipes.label_patches import LabelPatchesPipe
 from pipeline.pipes.save_patches import SavePatchesPipe
 
 from pipeline.core import DRPipeline
+from pipeline.utils.dir_index import dataset_index
+from pipeline.utils.stage_cache import with_stage_cache
 
 from pipeline.utils.io_utils import read_csv_image_paths
 from pipeline.config.settings import IMAGE_DIR, CSV_PATH
@@ -35,9 +38,12 @@ for item in test_data:
     item["image_path"] = IMAGE_DIR / item["image_path"]
 
 # Define pipeline
+index = dataset_index()
+
 pipeline = DRPipeline([
-    LoadImagePipe(),               # now loads to "rgb_image"
-    LesionMaskLoadingPipe(),
+    LoadImagePipe(index=index),               # now loads to "rgb_image"
+    with_stage_cache(mask_loading_pipe(index=index)),
+    with_stage_cache(LesionComponentsPipe()),
     PatchExtractionPipe(),
     LabelPatchesPipe(),
     SavePatchesPipe()
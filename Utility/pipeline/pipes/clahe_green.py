@@ -12,6 +12,7 @@ sys.path.append(str(Path(__file__).resolve().parents[2]))
 # == sys path ==
 
 from pipeline.utils.image_utils import extract_green_channel, apply_clahe
+from pipeline.core import Pipe
 from pipeline.utils.logger import get_logger
 from pipeline.config.settings import LOG_ALL
 
@@ -22,9 +23,13 @@ logger = get_logger(__name__, file_logging=True)
 # Jakob Balkovec | DR-Pipeline
 # =============================================================
 
-class CLAHEGreenChannelPipe:
+class CLAHEGreenChannelPipe(Pipe):
     # brief: applies CLAHE enhancement to the green channel of fundus images
 
+    requires = ("image",)
+    provides = ("enhanced_green",)
+    deprecated = True
+
     # -- DEPRECATED --
     # Previous approach to extract the green channel from patches and apply CLAHE.
     #
@@ -14,54 +14,74 @@ sys.path.append(str(Path(__file__).resolve().parents[2]))
 import os
 import cv2
 import math
+import time
 import numpy as np
 from dataclasses import dataclass
 from typing import Dict, List, Tuple, Optional
 
 from pipeline.config.settings import (
     PATCH_SIZE, LOG_ALL, PATCH_BLACK_THRESHOLD, BLACK_RATIO, BLACK_PIXELS_THRESHOLD,
-    PATCH_OUTPUT_DIR, HEALTHY_TO_LESION_RATIO, LESION_DILATE_PX, SEED, LESION_LABELS
+    PATCH_OUTPUT_DIR, HEALTHY_TO_LESION_RATIO, SEED, LESION_LABELS
 )
 
-from pipeline.utils.geometry_utils import (get_patch_coordinates, _black_tag, _reflective_crop,
-                                           _ensure_uint8, _connected_component_centroids, _dilate,
-                                           _random_point_in_mask, _make_label_vector, crop_128_no_pad)
+from pipeline.utils.geometry_utils import (get_patch_coordinates, _black_tag, crop_batch,
+                                           ComponentPixelIndex,
+                                           _make_label_vector, _shifted_center)
+from pipeline.core import Pipe
 from pipeline.utils.logger import get_logger
 from pipeline.utils.io_utils import ensure_dir
-from pipeline.utils.image_utils import is_mostly_black
+from pipeline.utils.image_utils import DarknessTable
+from pipeline.utils.sampling_utils import HealthySampler
+from pipeline.utils.patch_writer import PatchWriter, make_patch_writer
 
 logger = get_logger(__name__, file_logging=True)
 
-class PatchExtractionPipe:
+class PatchExtractionPipe(Pipe):
     # brief: lesion-centered patch extraction + healthy sampling (~60/40).
-    # inputs: data["image"] (RGB), data["image_id"], data["masks"] (dict[str]->mask or None)
-    # outputs: data["patches"] list of dicts expected by SavePatchesPipe (includes label_vector)
-    # writes: PNGs under PATCH_OUTPUT_DIR/<image_id>/all/
+    # inputs: data["image"] (RGB), data["image_id"], data["components"] + data["allowed"] (LesionComponentsPipe)
+    # outputs: data["patches"] list of dicts expected by SavePatchesPipe (includes label_vector and
+    #          bbox, the exact (x, y, w, h) window the saved pixels were cropped from)
+    #          data["patch_writer"] the WriteBatch of this image's pending writes (@see PatchWriter.batch)
+    # writes: PNGs under PATCH_OUTPUT_DIR/<image_id>/all/ (in the background, see PatchWriter)
+    #         or raw patches into PATCH_SHARD_DIR when PATCH_BACKEND == "shard" (see ShardWriter)
+
+    requires = ("image", "components", "allowed")
+    provides = ("patches", "patch_writer")
+
+    def __init__(self, writer: Optional[PatchWriter] = None):
+        # pre: writer is an optional shared PatchWriter / ShardWriter
+        # post: pipe owns a writer; SavePatchesPipe flushes it per image and joins it at the end
+        self.writer = writer if writer is not None else make_patch_writer()
 
     def process(self, data: dict) -> dict:
+        t_start = time.perf_counter()
         image: np.ndarray = data["image"]  # RGB
         image_id: str = data.get("image_id", Path(data["image_path"]).stem if "image_path" in data else "unknown")
-        masks_in: Dict[str, Optional[np.ndarray]] = data.get("masks", {})
 
-        masks: Dict[str, np.ndarray] = {}
-        for cls, m in masks_in.items():
-            m_bin = _ensure_uint8(m)
-            if m_bin is not None and m_bin.any():
-                masks[cls] = m_bin
+        # per-image lesion pixel index (one per non-empty class mask) + healthy keep-out, @see LesionComponentsPipe
+        comp_index: Dict[str, ComponentPixelIndex] = data["components"]
+        allowed: np.ndarray = data["allowed"]
 
         h, w, _ = image.shape
-        np.random.seed(SEED)
+        # per-image RNG seeded like np.random.seed(SEED) (same draws), but not shared between threads
+        rng = np.random.RandomState(SEED)
 
         patch_dir = os.path.join(PATCH_OUTPUT_DIR, image_id, "all")
-        ensure_dir(Path(patch_dir))
+        if self.writer.per_patch_files:
+            ensure_dir(Path(patch_dir))
 
         patches: List[dict] = []
+        windows: List[Tuple[int, int]] = []  # (x0, y0) of every patch, in patches order
         patch_counter = 1
+        half = PATCH_SIZE // 2
+
+        # O(1) black-ratio lookups for any center; black/out-of-FOV centers are rejected before cropping
+        darkness = DarknessTable(image)
 
         lesion_kept = 0
-        for cls_name, m in masks.items():
-            comps = _connected_component_centroids(m)  # [(cx,cy,area)]
-            for (cx, cy, area) in comps:
+        for cls_name, index in comp_index.items():
+            for k, (cx, cy) in enumerate(index.centroids):
+                cx, cy = int(cx), int(cy)
                 success = False
                 tries = 0
 
@@ -71,32 +91,33 @@ class PatchExtractionPipe:
                         # first attempt = centroid
                         px, py = cx, cy
                     else:
-                        # retry with random pixel inside this mask
-                        ys, xs = np.where(m > 0)
-                        idx = np.random.randint(0, len(xs))
-                        px, py = xs[idx], ys[idx]
+                        # retry with random pixel inside this component
+                        px, py = index.random_pixel(k, rng)
 
-                    patch_rgb, bbox = crop_128_no_pad(image, px, py, PATCH_SIZE, max_shift=8)
-                    if patch_rgb is None or is_mostly_black(patch_rgb):
+                    center = _shifted_center(px, py, w, h, PATCH_SIZE, max_shift=8)
+                    if center is None or darkness.is_black(*center):
                         continue  # try again
 
+                    # window of the shifted crop (crop_128_no_pad rule), cut out later in one batch
+                    nx, ny = center
+                    bbox = (nx - half, ny - half, PATCH_SIZE, PATCH_SIZE)
+                    windows.append(bbox[:2])
+
                     patch_coords = get_patch_coordinates(px, py, PATCH_SIZE)
                     patch_id = f"{image_id}_{str(px).zfill(4)}_{str(py).zfill(4)}"
                     file_name = f"{patch_id}.png"
                     file_path = os.path.join(patch_dir, file_name)
-                    rel_path = os.path.relpath(file_path, PATCH_OUTPUT_DIR.parent)
-
-                    cv2.imwrite(file_path, cv2.cvtColor(patch_rgb, cv2.COLOR_RGB2BGR))
 
                     patches.append({
                         "patch_no": int(patch_counter),
                         "image_id": image_id,
                         "patch_id": patch_id,
                         "file_name": file_name,
-                        "file_path": rel_path,
+                        "file_path": file_path,
                         "x": px,
                         "y": py,
                         "coordinates": patch_coords,
+                        "bbox": tuple(int(v) for v in bbox),  # exact (x, y, w, h) window saved
                         "filter_tag": "lesion",
                         "label_vector": _make_label_vector(cls_name),
                     })
@@ -109,50 +130,49 @@ class PatchExtractionPipe:
 
         n_healthy_target = int(math.ceil(HEALTHY_TO_LESION_RATIO * max(lesion_kept, 0)))
 
-        union = np.zeros((h, w), dtype=np.uint8)
-        for m in masks.values():
-            union |= (m > 0).astype(np.uint8)
-        keepout = _dilate(union, LESION_DILATE_PX)
-        allowed = cv2.bitwise_not(keepout)
-
         healthy_kept = 0
-        tries = 0
         max_tries = max(5000, 20 * max(1, n_healthy_target))
+        sampler = HealthySampler(allowed, darkness, rng=rng)  # only non-black centers can be drawn
 
-        while healthy_kept < n_healthy_target and tries < max_tries:
-            tries += 1
-            pt = _random_point_in_mask(allowed)
-            if pt is None:
-                break
-            cx, cy = pt
-            patch_rgb, bbox = _reflective_crop(image, cx, cy, PATCH_SIZE)
-            if is_mostly_black(patch_rgb):
-                continue  # skip and keep sampling
+        for cx, cy in (sampler.candidates(max_tries) if n_healthy_target > 0 else ()):
+            # centered window, may hang over the border (reflected pixels, same as _reflective_crop)
+            bbox = (cx - half, cy - half, PATCH_SIZE, PATCH_SIZE)
+            windows.append(bbox[:2])
 
             center_x, center_y = cx, cy
             patch_coords = get_patch_coordinates(center_x, center_y, PATCH_SIZE)
             patch_id = f"{image_id}_{str(center_x).zfill(4)}_{str(center_y).zfill(4)}"
             file_name = f"{patch_id}.png"
             file_path = os.path.join(patch_dir, file_name)
-            rel_path = os.path.relpath(file_path, PATCH_OUTPUT_DIR.parent)
-
-            cv2.imwrite(file_path, cv2.cvtColor(patch_rgb, cv2.COLOR_RGB2BGR))
 
             patches.append({
                 "patch_no": int(patch_counter),
                 "image_id": image_id,
                 "patch_id": patch_id,
                 "file_name": file_name,
-                "file_path": rel_path,
+                "file_path": file_path,
                 "x": center_x,
                 "y": center_y,
                 "coordinates": patch_coords,
+                "bbox": tuple(int(v) for v in bbox),  # may extend past the border (reflected pixels)
                 "filter_tag": "healthy",
                 "label_vector": _make_label_vector(None),
             })
             patch_counter += 1
             healthy_kept += 1
+            if healthy_kept >= n_healthy_target:
+                break
+
+        # one pad + one gather for every window of the image, then hand the rows to the writer
+        batch = self.writer.batch()  # this image's writes, flushed on their own by SavePatchesPipe
+        if windows:
+            x0, y0 = np.asarray(windows).T
+            stack = crop_batch(image, x0, y0, PATCH_SIZE)
+            for patch, patch_rgb in zip(patches, stack):
+                patch["file_path"] = batch.submit(patch["file_path"], patch_rgb)
 
         data["patches"] = patches
-        logger.info(f"[lesion-centered] {image_id}: lesion_kept={lesion_kept}  healthy_kept={healthy_kept}  total_saved={len(patches)}  tries={tries}")
+        data["patch_writer"] = batch
+        self.writer.add_sampling_time(time.perf_counter() - t_start)
+        logger.info(f"[lesion-centered] {image_id}: lesion_kept={lesion_kept}  healthy_kept={healthy_kept}  total_saved={len(patches)}  tries={sampler.tries}")
         return data
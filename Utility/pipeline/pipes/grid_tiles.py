@@ -0,0 +1,41 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: inference-time tiling, the whole image cut into a regular grid of PATCH_SIZE tiles
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+from pipeline.core import Pipe
+from pipeline.config.settings import PATCH_SIZE, LOG_ALL
+from pipeline.utils.geometry_utils import grid_tiles
+from pipeline.utils.logger import get_logger
+
+logger = get_logger(__name__, file_logging=True)
+
+class GridTilePipe(Pipe):
+    # brief: regular non-overlapping tiling of data["image"] (1280x1280 -> 100 tiles of 128x128)
+    # note: unlike PatchExtractionPipe nothing is sampled or written; the tiles are one
+    #       (N, size, size, 3) array, ready to be fed to a model as a batch
+
+    requires = ("image",)
+    provides = ("tiles", "tile_origins")
+
+    def __init__(self, size: int = PATCH_SIZE):
+        self.size = size
+
+    def process(self, data: dict) -> dict:
+        # pre: data contains "image" (RGB)
+        # post: data["tiles"] -> (N, size, size, 3) uint8, row-major over the grid
+        #       data["tile_origins"] -> (N, 2) int (x0, y0) of every tile in image coordinates
+        # desc: @see grid_tiles, images that aren't a multiple of size are reflect-padded bottom/right
+
+        tiles, origins = grid_tiles(data["image"], self.size)
+        data["tiles"] = tiles
+        data["tile_origins"] = origins
+        logger.info(f"[grid] {data.get('image_id', 'unknown')}: {len(tiles)} tiles of {self.size}px") if LOG_ALL else None
+        return data
@@ -13,8 +13,10 @@ sys.path.append(str(Path(__file__).resolve().parents[2]))
 
 import numpy as np
 
-from pipeline.config.settings import (PATCH_SIZE, LOG_ALL, LESION_LABELS)
+from pipeline.config.settings import (PATCH_SIZE, LOG_ALL, LESION_LABELS, IMAGE_SHAPE)
+from pipeline.core import Pipe
 from pipeline.utils.logger import get_logger
+from pipeline.utils.mask_utils import LabelCube
 
 logger = get_logger(__name__, file_logging=True)
 
@@ -23,41 +25,52 @@ logger = get_logger(__name__, file_logging=True)
 #       (e.g. if the patch is completely black, it will be labeled as "black"). This is so that
 #       we do not save empty patches (meaningless data...)
 
-class LabelPatchesPipe:
+class LabelPatchesPipe(Pipe):
     # brief: labels patches by dominant intersection area with lesion polygons
 
+    requires = ("image_path", "masks", "patches")
+    provides = ("patches",)
+
     def process(self, data: dict) -> dict:
         # pre: data must contain "patches" and "masks"
         # post: each patch will contain "label_vector" with binary labels for each lesion type
-        # desc: assigns label vector based on lesion mask presence in the patch crop
+        #       and "label_area" with the fraction of its pixels covered by each lesion type
+        # desc: stacks the masks into a LabelCube and labels every patch window in one vectorized gather
 
         masks = data.get("masks", {})
         patches = data.get("patches", [])
         image_id = Path(data["image_path"]).stem
 
-        for patch in patches:
-            cx, cy = patch["x"], patch["y"]
-            label_vector = []
-
-            for lesion_type in LESION_LABELS:
-                mask = masks.get(lesion_type)
-
-                if mask is None:
-                    logger.warning(f"mask not found {image_id}, {lesion_type}")
-                    label_vector.append(0)
-                    continue
-
-                y0, y1 = cy - PATCH_SIZE // 2, cy + PATCH_SIZE // 2
-                x0, x1 = cx - PATCH_SIZE // 2, cx + PATCH_SIZE // 2
-                lesion_crop = mask[y0:y1, x0:x1]
-                label = int(np.any(lesion_crop > 0))
-                label_vector.append(label)
-
+        if not patches:
+            return data
+
+        # masks are reflect-padded like _reflective_crop pads the image, so border windows
+        # are labelled from the same (mirrored) pixels that were saved
+        shape = next((m.shape[:2] for m in masks.values() if m is not None), IMAGE_SHAPE)
+        cube = LabelCube(masks, shape, pad=PATCH_SIZE // 2)
+        missing = cube.missing()
+        if missing:
+            logger.warning(f"masks not found {image_id}: {', '.join(missing)}")
+
+        # label the exact window each patch was cropped from (bbox, set by PatchExtractionPipe);
+        # patches without one fall back to the window centered on (x, y)
+        bboxes = np.array([p["bbox"] if "bbox" in p else
+                           (p["x"] - PATCH_SIZE // 2, p["y"] - PATCH_SIZE // 2, PATCH_SIZE, PATCH_SIZE)
+                           for p in patches], dtype=np.int64).reshape(len(patches), 4)
+        x0, y0 = bboxes[:, 0], bboxes[:, 1]
+        x1, y1 = x0 + bboxes[:, 2], y0 + bboxes[:, 3]
+
+        counts = cube.counts(x0, y0, x1, y1)
+        label_vectors = (counts > 0).astype(np.uint8).tolist()
+        label_areas = np.round(counts / (bboxes[:, 2:3] * bboxes[:, 3:4]).astype(np.float64), 4).tolist()
+
+        for patch, label_vector, label_area in zip(patches, label_vectors, label_areas):
             patch["label_vector"] = label_vector
+            patch["label_area"] = label_area
 
             if patch["filter_tag"] != "black":
                 patch["filter_tag"] = (
-                    "healthy" if label_vector == [0, 0, 0, 0] else "lesion"
+                    "healthy" if not any(label_vector) else "lesion"
                 )
 
             lesion_suffix = "_".join([
@@ -65,7 +78,7 @@ class LabelPatchesPipe:
             ]) or "healthy"
 
             patch["image_id"] = image_id
-            patch["file_name"] = f"{image_id}_{lesion_suffix}_{cx}_{cy}.png"
+            patch["file_name"] = f"{image_id}_{lesion_suffix}_{patch['x']}_{patch['y']}.png"
 
         logger.info(f"labeled {len(patches)} patches for image {image_id}") if LOG_ALL else None
         return data
@@ -0,0 +1,63 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: connected-component analysis of the lesion masks + the healthy-sampling keep-out mask
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+from pipeline.core import Pipe
+from pipeline.pipes.xml_masks import mask_source_files
+from pipeline.config.settings import LESION_DILATE_PX, LOG_ALL
+from pipeline.utils.geometry_utils import ComponentPixelIndex, _dilate, _ensure_uint8
+from pipeline.utils.logger import get_logger
+
+logger = get_logger(__name__, file_logging=True)
+
+class LesionComponentsPipe(Pipe):
+    # brief: per-class ComponentPixelIndex + the mask of pixels allowed as healthy patch centers
+    # note: only depends on the masks and LESION_DILATE_PX, so wrapped in a CachedPipe it is
+    #       reused across runs that only change sampling settings (e.g. HEALTHY_TO_LESION_RATIO)
+
+    requires = ("image", "masks")
+    provides = ("components", "allowed")
+    cache_settings = ("LESION_DILATE_PX", "LESION_MASKS", "MASK_SOURCE", "IMAGE_SHAPE",
+                      "XML_LESION_MAP", "XML_SOURCE_SHAPE", "XML_MIN_EXPERTS")
+
+    def cache_files(self, data: dict) -> List[Path]:
+        return mask_source_files(data["image_path"])
+
+    def process(self, data: dict) -> dict:
+        # pre: data contains "image" (for its shape) and "masks" (lesion_type -> PackedMask / array or None)
+        # post: data["components"] -> lesion_type -> ComponentPixelIndex (non-empty masks only)
+        #       data["allowed"] -> uint8 mask, 255 where no lesion is within LESION_DILATE_PX
+        # desc: binarizes every mask once, indexes its components and dilates their union
+
+        h, w = data["image"].shape[:2]
+        components: Dict[str, ComponentPixelIndex] = {}
+        union = np.zeros((h, w), dtype=np.uint8)
+
+        for cls_name, m in data.get("masks", {}).items():
+            if m is None or not m.any():
+                continue
+            m_bin = _ensure_uint8(np.asarray(m))  # a PackedMask expands here, one class at a time
+            components[cls_name] = ComponentPixelIndex.from_mask(m_bin)
+            union |= m_bin
+
+        # note: _dilate returns a 0/1 mask, so it is scaled to 0/255 before inverting
+        #       (inverting 0/1 directly gives 255/254, which is "allowed" everywhere)
+        keepout = _dilate(union, LESION_DILATE_PX)
+        data["components"] = components
+        data["allowed"] = cv2.bitwise_not(keepout * np.uint8(255))
+
+        logger.info(f"indexed {sum(len(c) for c in components.values())} lesion components") if LOG_ALL else None
+        return data
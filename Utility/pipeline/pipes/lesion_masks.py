@@ -11,32 +11,54 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parents[2]))
 # == sys path ==
 
-from pipeline.utils.io_utils import read_image
+from typing import Dict, List, Optional
+
+from pipeline.utils.mask_utils import PackedMask, read_mask
+from pipeline.utils.dir_index import DirectoryIndex
+from pipeline.core import Pipe
 from pipeline.utils.logger import get_logger
 from pipeline.config.settings import MASK_ROOT, LESION_MASKS, LOG_ALL
 
 logger = get_logger(__name__, file_logging=True)
 
-class LesionMaskLoadingPipe:
+def mask_paths(image_path) -> Dict[str, Path]:
+    # post: lesion_type -> path of that lesion's mask for the image (whether it exists or not)
+    image_name = Path(image_path).stem
+    return {lesion: MASK_ROOT / folder / f"{image_name}.png" for lesion, folder in LESION_MASKS.items()}
+
+class LesionMaskLoadingPipe(Pipe):
     # brief: loads lesion masks for each predefined lesion type
 
+    requires = ("image_path",)
+    provides = ("masks",)
+    cache_settings = ("LESION_MASKS",)
+
+    def __init__(self, index: Optional[DirectoryIndex] = None):
+        # pre: index is an optional DirectoryIndex covering the LESION_MASKS folders
+        # post: masks the index doesn't list are reported missing without touching the filesystem
+        self.index = index
+
+    def cache_files(self, data: dict) -> List[Path]:
+        return list(mask_paths(data["image_path"]).values())
+
     def process(self, data: dict) -> dict:
         # pre: data must contain the key "image_path" pointing to the RGB image file
-        # post: data will contain the key "masks", a dict of lesion_type -> binary mask (or None if missing)
+        # post: data will contain the key "masks", a dict of lesion_type -> PackedMask (or None if missing)
         # desc: attempts to load binary masks for all defined lesion types and stores them in a dictionary
 
         image_name = Path(data["image_path"]).stem
         masks = {}
 
-        for lesion, folder in LESION_MASKS.items():
-            mask_path = MASK_ROOT / folder / f"{image_name}.png"
-
-            if mask_path.exists():
-                logger.info(f"loading {lesion} mask for: {image_name}") if LOG_ALL else None
+        for lesion, mask_path in mask_paths(data["image_path"]).items():
+            # note: lesion masks are stored as RGB images with binary data in the red channel;
+            #       green and blue channels are unused (all zeros). read_mask keeps the red channel
+            #       only and returns None for a missing file (no exists() stat per lesion type)
+            listed = self.index is None or mask_path in self.index
+            mask = read_mask(mask_path) if listed else None
 
-                # note: lesion masks are stored as RGB images with binary data in the red channel (channel 0);
-                #       green and blue channels are unused (all zeros)
-                masks[lesion] = read_image(mask_path)[:, :, 0]
+            if mask is not None:
+                logger.info(f"loaded {lesion} mask for: {image_name}") if LOG_ALL else None
+                masks[lesion] = PackedMask.from_array(mask)
             else:
                 logger.info(f"{lesion} mask not found for: {image_name}") if LOG_ALL else None
                 masks[lesion] = None
@@ -11,16 +11,28 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parents[2]))
 # == sys path ==
 
+from typing import Optional
+
 from pipeline.utils.io_utils import read_image
+from pipeline.utils.dir_index import DirectoryIndex
+from pipeline.core import Pipe
 from pipeline.utils.logger import get_logger
 
 from pipeline.config.settings import LOG_ALL
 
 logger = get_logger(__name__, file_logging=True)
 
-class LoadImagePipe:
+class LoadImagePipe(Pipe):
     # brief: loads fundus images from disk and prepares them for processing
 
+    requires = ("image_path",)
+    provides = ("image",)
+
+    def __init__(self, index: Optional[DirectoryIndex] = None):
+        # pre: index is an optional DirectoryIndex covering IMAGE_DIR (@see utils/dir_index.py)
+        # post: existence checks go through the index when given, else through the filesystem
+        self.index = index
+
     def process(self, data: dict) -> dict:
         # pre: data must contain the key "image_path" with a valid image file path
         # post: data will contain the key "image" with the loaded image
@@ -29,7 +41,10 @@ class LoadImagePipe:
         image_path = data.get("image_path")
 
         msg = 'assertion error in [LoadImagePipe | process(...)] >> image_path not found'
-        assert image_path is not None and Path(image_path).exists(), msg
+        if self.index is not None:
+            assert image_path is not None and image_path in self.index, msg
+        else:
+            assert image_path is not None and Path(image_path).exists(), msg
 
         logger.info(f"loading image: {image_path}") if LOG_ALL else None
         image = read_image(Path(image_path))
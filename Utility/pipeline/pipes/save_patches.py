@@ -10,11 +10,15 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parents[2]))
 # == sys path ==
 
+import threading
+
 import pandas as pd
 
-from pipeline.config.settings import LOG_ALL, PATCH_OUTPUT_DIR
+from pipeline.config.settings import LOG_ALL, PATCH_OUTPUT_DIR, METADATA_BACKEND
+from pipeline.core import Pipe
 from pipeline.utils.logger import get_logger
 from pipeline.utils.io_utils import ensure_dir
+from pipeline.utils.metadata_store import PatchMetadataStore, patches_to_records
 
 logger = get_logger(__name__, file_logging=True)
 
@@ -26,17 +30,45 @@ logger = get_logger(__name__, file_logging=True)
 # !another! note:
 #       the logic is kinda weird (i know), but i know what i'm doing...(i think)
 
-class SavePatchesPipe:
+class SavePatchesPipe(Pipe):
     # brief: saves patches to disk in directories organized by lesion type
 
+    requires = ("patches",)
+    provides = ()
+    consumes = ("patch_writer",)
+
+    def __init__(self, backend: str = METADATA_BACKEND):
+        # pre: backend is "columnar" or "pickle"
+        # post: no writers seen yet; close() joins every PatchWriter that passed through process()
+        if backend not in ("columnar", "pickle"):
+            raise ValueError(f"unknown metadata backend: {backend!r} (expected 'columnar' or 'pickle')")
+        self.backend = backend
+        self.store = PatchMetadataStore() if backend == "columnar" else None
+        self._writers = []
+        self._lock = threading.Lock()  # process() may run on several threads (@see DRPipeline.stream_staged)
+
     def process(self, data: dict) -> dict:
-        # pre: data["patches"] must contain all patch metadata (file already saved)
-        # post: Pickle DataFrame is written to disk
-        # desc: constructs and saves patch metadata for downstream indexing/training
+        # pre: data["patches"] must contain all patch metadata (file submitted to data["patch_writer"], if any)
+        # post: patch PNGs are on disk, metadata is appended to the columnar store (or pickled per image)
+        # desc: flushes the image's writes (only those), then constructs and saves patch metadata for downstream indexing/training
+
+        batch = data.pop("patch_writer", None)
+        if batch is not None:
+            batch.flush()  # metadata must never point at a patch that is still in the queue
+            writer = getattr(batch, "writer", batch)  # a WriteBatch, or a writer handed in directly
+            with self._lock:
+                if all(w is not writer for w in self._writers):
+                    self._writers.append(writer)
 
         patches = data["patches"]
         image_id = patches[0]["image_id"] if patches else "unknown"
 
+        if self.store is not None:
+            # -> one batch of fixed-width records per image, see metadata_store.py
+            self.store.append(patches_to_records(patches))
+            logger.info(f"appended metadata for {len(patches)} patches of {image_id}") if LOG_ALL else None
+            return data
+
         metadata = []
 
         for patch in patches:
@@ -47,7 +79,9 @@ class SavePatchesPipe:
                 "filter_tag": patch["filter_tag"],
                 "coordinates": patch["coordinates"],
                 "center": {"x": patch["x"], "y": patch["y"]},
-                "label_vector": patch["label_vector"]
+                "bbox": patch.get("bbox"),
+                "label_vector": patch["label_vector"],
+                "label_area": patch.get("label_area")
             })
 
         # -> save to /patches/{image_id}/frame/patch_frame.pkl
@@ -60,3 +94,15 @@ class SavePatchesPipe:
 
         logger.info(f"saved metadata for {len(patches)} patches to {df_out_path}") if LOG_ALL else None
         return data
+
+    def close(self) -> None:
+        # post: all background writers are flushed and joined; their encode vs. sampling stats are logged
+        # desc: called by DRPipeline.run once the dataset is done
+
+        with self._lock:
+            writers, self._writers = self._writers, []
+        for writer in writers:
+            writer.close()
+            logger.info(writer.report())
+        if self.store is not None:
+            self.store.close()
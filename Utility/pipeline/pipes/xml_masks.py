@@ -0,0 +1,88 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: lesion masks rasterized straight from the XML annotations (no mask PNGs) + the mask pipe factory
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+from typing import List, Optional
+
+from pipeline.core import Pipe
+from pipeline.pipes.lesion_masks import LesionMaskLoadingPipe, mask_paths
+from pipeline.utils.dir_index import DirectoryIndex
+from pipeline.utils.mask_utils import PackedMask
+from pipeline.utils.rasterize import rasterize_markings
+from pipeline.utils.logger import get_logger
+from pipeline.config.settings import (IMAGE_SHAPE, LESION_LABELS, LOG_ALL, MASK_SOURCE, XML_ANNOTATION_DIR,
+                                      XML_ANNOTATION_PATTERN, XML_LESION_MAP, XML_MIN_EXPERTS, XML_SOURCE_SHAPE)
+
+logger = get_logger(__name__, file_logging=True)
+
+def annotation_paths(image_path, index: Optional[DirectoryIndex] = None) -> List[Path]:
+    # post: the image's annotation files (XML_ANNOTATION_PATTERN under XML_ANNOTATION_DIR), sorted
+    pattern = XML_ANNOTATION_PATTERN.format(stem=Path(image_path).stem)
+    if index is None:
+        return sorted(XML_ANNOTATION_DIR.glob(pattern))
+    return sorted(XML_ANNOTATION_DIR / name for name in index.names(XML_ANNOTATION_DIR) if Path(name).match(pattern))
+
+def mask_source_files(image_path, index: Optional[DirectoryIndex] = None) -> List[Path]:
+    # post: the files the image's masks are derived from under MASK_SOURCE (mask PNGs or XML annotations)
+    # note: cache key of every pipe whose output depends on the masks (@see CachedPipe)
+    if MASK_SOURCE == "xml":
+        return annotation_paths(image_path, index)
+    return list(mask_paths(image_path).values())
+
+class XMLMaskLoadingPipe(Pipe):
+    # brief: rasterizes the image's XML annotations into lesion masks (@see utils/rasterize.py)
+    # note: provides the same "masks" as LesionMaskLoadingPipe (lesion_type -> PackedMask), so nothing
+    #       downstream changes. wrapped in a CachedPipe its key is the content hash of the XML files,
+    #       i.e. the masks are rasterized once per annotation version and then restored from the cache
+
+    requires = ("image_path",)
+    provides = ("masks",)
+    cache_settings = ("LESION_MASKS", "IMAGE_SHAPE", "XML_LESION_MAP", "XML_SOURCE_SHAPE", "XML_MIN_EXPERTS")
+
+    def __init__(self, index: Optional[DirectoryIndex] = None):
+        # pre: index is an optional DirectoryIndex covering XML_ANNOTATION_DIR
+        # post: annotation files are looked up in the index (one scan of the folder if none is given)
+        self.index = index if index is not None else DirectoryIndex([XML_ANNOTATION_DIR])
+
+    def cache_files(self, data: dict) -> List[Path]:
+        return annotation_paths(data["image_path"], self.index)
+
+    def process(self, data: dict) -> dict:
+        # pre: data must contain the key "image_path"
+        # post: data will contain the key "masks", a dict of lesion_type -> PackedMask at IMAGE_SHAPE
+        #       (every type None if the image has no annotation files, like missing mask PNGs)
+        # desc: streams the markings of all the image's annotation files and rasterizes them in one go
+
+        image_name = Path(data["image_path"]).stem
+        xmls = annotation_paths(data["image_path"], self.index)
+
+        if not xmls:
+            logger.info(f"no annotations found for: {image_name}") if LOG_ALL else None
+            data["masks"] = {lesion: None for lesion in LESION_LABELS}
+            return data
+
+        from XMLparser.lesion_parser import LesionXMLParser  # only MASK_SOURCE="xml" runs need the parser
+
+        records = LesionXMLParser([str(p) for p in xmls]).iter_markings(mute_output=True)
+        stack = rasterize_markings(records, IMAGE_SHAPE, LESION_LABELS, XML_LESION_MAP,
+                                   source_shape=XML_SOURCE_SHAPE, min_experts=XML_MIN_EXPERTS)
+
+        logger.info(f"rasterized {len(xmls)} annotation(s) for: {image_name}") if LOG_ALL else None
+        data["masks"] = {lesion: PackedMask.from_array(stack[k]) for k, lesion in enumerate(LESION_LABELS)}
+        return data
+
+def mask_loading_pipe(index: Optional[DirectoryIndex] = None, source: str = MASK_SOURCE) -> Pipe:
+    # post: the pipe providing "masks" for the given MASK_SOURCE ("png" or "xml")
+    if source == "xml":
+        return XMLMaskLoadingPipe(index=index)
+    if source == "png":
+        return LesionMaskLoadingPipe(index=index)
+    raise ValueError(f"[Masks] unknown MASK_SOURCE {source!r}, expected 'png' or 'xml'")
@@ -0,0 +1,210 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: tests (pytest) for the vectorized pipeline helpers
+# note: every fast path is checked against the per-patch / per-marking code it replaced,
+#       on small synthetic images (no dataset needed)
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+import cv2
+import numpy as np
+import pytest
+
+from pipeline.core import DRPipeline, Pipe
+from pipeline.utils.geometry_utils import _reflective_crop, crop_batch
+from pipeline.utils.image_utils import DarknessTable, is_mostly_black
+from pipeline.utils.ledger import CompletionLedger
+from pipeline.utils.mask_utils import LabelCube, PackedMask
+from pipeline.utils.rasterize import rasterize_markings
+
+SIZE = 32
+HALF = SIZE // 2
+SHAPE = (96, 120)
+LABELS = ["microaneurysms", "hemorrhages", "hard_exudates", "soft_exudates"]
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(1337)
+
+
+def _centers(rng, n=200):
+    # post: (n, 2) int centers, a fair share of them close enough to the border to be reflect-padded
+    h, w = SHAPE
+    return np.stack([rng.integers(0, w, n), rng.integers(0, h, n)], axis=1)
+
+
+def _fundus(rng):
+    # post: RGB image with a dark border (like the area outside the FOV) and noisy pixels around the threshold
+    h, w = SHAPE
+    img = rng.integers(0, 12, (h, w, 3), dtype=np.uint8)  # ~90% of the channel means are < 10
+    cv2.ellipse(img, (w // 2, h // 2), (w // 3, h // 3), 0, 0, 360, (90, 60, 40), -1)
+    return img
+
+
+# ===== crops =====
+
+def test_crop_batch_matches_reflective_crop(rng):
+    img = _fundus(rng)
+    centers = _centers(rng)
+    stack = crop_batch(img, centers[:, 0] - HALF, centers[:, 1] - HALF, SIZE)
+
+    assert stack.shape == (len(centers), SIZE, SIZE, 3)
+    for patch, (cx, cy) in zip(stack, centers):
+        assert np.array_equal(patch, _reflective_crop(img, int(cx), int(cy), SIZE)[0])
+
+
+def test_darkness_table_matches_is_mostly_black(rng):
+    img = _fundus(rng)
+    centers = _centers(rng)
+    table = DarknessTable(img, SIZE)
+
+    fast = table.is_black(centers[:, 0], centers[:, 1])
+    slow = [is_mostly_black(_reflective_crop(img, int(cx), int(cy), SIZE)[0]) for cx, cy in centers]
+    assert fast.tolist() == slow
+    assert 0 < fast.sum() < len(centers)  # both outcomes are exercised
+
+    valid = table.valid_center_map()
+    assert valid[centers[:, 1], centers[:, 0]].tolist() == [not b for b in slow]
+
+
+# ===== labels =====
+
+def test_label_cube_matches_crop_labels(rng):
+    h, w = SHAPE
+    masks = {}
+    for lesion in LABELS[:2]:
+        m = np.zeros(SHAPE, dtype=np.uint8)
+        for _ in range(6):
+            cv2.circle(m, (int(rng.integers(0, w)), int(rng.integers(0, h))), int(rng.integers(1, 6)), 1, -1)
+        masks[lesion] = PackedMask.from_array(m)
+    masks[LABELS[2]] = np.zeros(SHAPE, dtype=np.uint8)  # present but empty
+    masks[LABELS[3]] = None                             # missing
+
+    cube = LabelCube(masks, SHAPE, LABELS, pad=HALF)
+    centers = _centers(rng)
+    x0, y0 = centers[:, 0] - HALF, centers[:, 1] - HALF
+    counts = cube.counts(x0, y0, x0 + SIZE, y0 + SIZE)
+
+    assert cube.missing() == [LABELS[3]]
+    for row, (cx, cy) in zip(counts, centers):
+        expected = [0 if masks[lesion] is None else
+                    int(_reflective_crop(np.asarray(masks[lesion]), int(cx), int(cy), SIZE)[0].sum())
+                    for lesion in LABELS]
+        assert row.tolist() == expected
+    assert counts[:, 0].any() and counts[:, 1].any()
+
+
+# ===== ledger =====
+
+class _CountingPipe(Pipe):
+    requires = ("image_id",)
+    provides = ("patches",)
+
+    def __init__(self):
+        self.seen = []
+
+    def process(self, data):
+        self.seen.append(data["image_id"])
+        data["patches"] = []
+        return data
+
+
+def test_ledger_rerun_has_nothing_pending(tmp_path):
+    items = [{"image_path": f"{i:04d}.jpg", "image_id": f"{i:04d}", "grade": 0} for i in range(5)]
+    path = tmp_path / "ledger.sqlite"
+
+    first = _CountingPipe()
+    DRPipeline([first], ledger=CompletionLedger(path, config="a")).run(items)
+    assert first.seen == [item["image_id"] for item in items]
+
+    # a new process would open the ledger from scratch -> same config, nothing left to do
+    ledger = CompletionLedger(path, config="a")
+    assert ledger.pending(items) == []
+    rerun = _CountingPipe()
+    assert DRPipeline([rerun], ledger=ledger).run(items) == []
+    assert rerun.seen == []
+
+    # a different config starts from an empty completion set
+    assert len(CompletionLedger(path, config="b").pending(items)) == len(items)
+
+
+# ===== rasterization =====
+
+def _circle(x, y, r, xml_file="a_01.xml", type="Haemorrhages"):
+    return {"type": type, "xml_file": xml_file, "region_type": "circleregion", "x": x, "y": y,
+            "radius": r, "radius_x": None, "radius_y": None, "angle": None, "polygon_points": []}
+
+
+def _ellipse(x, y, rx, ry, angle, xml_file="a_01.xml", type="Hard_exudates"):
+    return {"type": type, "xml_file": xml_file, "region_type": "ellipseregion", "x": x, "y": y,
+            "radius": None, "radius_x": rx, "radius_y": ry, "angle": angle, "polygon_points": []}
+
+
+def _polygon(points, xml_file="a_01.xml", type="Soft_exudates"):
+    return {"type": type, "xml_file": xml_file, "region_type": "polygonregion", "x": None, "y": None,
+            "radius": None, "radius_x": None, "radius_y": None, "angle": None, "polygon_points": points}
+
+
+def _exact(shape, inside):
+    # post: 0/1 mask of the pixel centers for which inside(x, y) holds
+    ys, xs = np.mgrid[0:shape[0], 0:shape[1]].astype(np.float64)
+    return inside(xs, ys).astype(np.uint8)
+
+
+def _close(mask, exact):
+    # post: True if the masks only differ within 1 px of the exact region's outline
+    kernel = np.ones((3, 3), dtype=np.uint8)
+    outline = cv2.dilate(exact, kernel) - cv2.erode(exact, kernel)
+    return not np.any((mask != exact) & (outline == 0))
+
+
+@pytest.mark.parametrize("source_shape", [None, (96, 120), (48, 60), (64, 60)])
+def test_rasterize_within_tolerance_of_exact_regions(source_shape):
+    src = source_shape or SHAPE
+    sx, sy = SHAPE[1] / src[1], SHAPE[0] / src[0]
+    s = lambda v: (v[0] * src[1], v[1] * src[0])  # fractions of the source image -> source pixels
+
+    cx, cy = s((0.3, 0.4))
+    r = 0.15 * src[0]
+    ex, ey = s((0.7, 0.6))
+    rx, ry = 0.2 * src[1], 0.1 * src[0]
+    poly = [s(p) for p in ((0.1, 0.7), (0.45, 0.65), (0.35, 0.95), (0.05, 0.9))]
+    records = [_circle(cx, cy, r), _ellipse(ex, ey, rx, ry, 30.0), _polygon(poly)]
+
+    stack = rasterize_markings(records, SHAPE, LABELS, source_shape=source_shape)
+
+    t = np.deg2rad(30.0)
+    circle = _exact(SHAPE, lambda x, y: ((x / sx - cx) ** 2 + (y / sy - cy) ** 2) <= r ** 2)
+    ellipse = _exact(SHAPE, lambda x, y: (((x / sx - ex) * np.cos(t) + (y / sy - ey) * np.sin(t)) / rx) ** 2 +
+                                         ((-(x / sx - ex) * np.sin(t) + (y / sy - ey) * np.cos(t)) / ry) ** 2 <= 1)
+    polygon = np.zeros(SHAPE, dtype=np.uint8)
+    cv2.fillPoly(polygon, [np.round(np.array(poly) * (sx, sy) * 16).astype(np.int32)], 1, shift=4)
+
+    assert _close(stack[1], circle)
+    assert _close(stack[2], ellipse)
+    assert np.array_equal(stack[3], polygon)
+    assert not stack[0].any()
+
+
+def test_rasterize_overlap_and_votes():
+    # overlapping markings of a class add up (no even-odd holes); votes count annotation files
+    a = [_circle(50, 48, 20), _circle(62, 48, 20)]
+    b = [_circle(70, 48, 20, xml_file="a_02.xml")]
+
+    union = rasterize_markings(a, SHAPE, LABELS)
+    assert union[1, 48, 56] == 1
+
+    per_file = rasterize_markings(a, SHAPE, LABELS).astype(int) + rasterize_markings(b, SHAPE, LABELS)
+    for votes in (1, 2):
+        assert np.array_equal(rasterize_markings(a + b, SHAPE, LABELS, min_experts=votes),
+                              (per_file >= votes).astype(np.uint8))
+
+    packed = rasterize_markings(a + b, SHAPE, LABELS, packed=True)
+    assert np.array_equal(np.unpackbits(packed, axis=2)[:, :, :SHAPE[1]], rasterize_markings(a + b, SHAPE, LABELS))
@@ -0,0 +1,80 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: one-shot directory listing index (os.scandir) replacing per-file exists() probes
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+import os
+from typing import Dict, FrozenSet, Iterable, Tuple
+
+from pipeline.config.settings import IMAGE_DIR, MASK_ROOT, LESION_MASKS, MASK_SOURCE, XML_ANNOTATION_DIR
+
+# note: a directory's mtime changes whenever an entry is added/removed/renamed in it, so one
+#       stat per directory is enough to tell whether its cached listing is still valid.
+#       the index is plain data (paths + frozensets) -> it pickles cheaply and is handed to pool
+#       workers once, read-only, through the pool initializer.
+
+class DirectoryIndex:
+    # brief: file names per directory, scanned once; lookups are set membership, no syscalls
+
+    def __init__(self, dirs: Iterable[Path] = ()):
+        # post: every directory in dirs is scanned (missing directories index as empty)
+        self._entries: Dict[str, Tuple[int, FrozenSet[str]]] = {}
+        for d in dirs:
+            self._entries[self._key(d)] = self._scan(d)
+
+    @staticmethod
+    def _key(directory) -> str:
+        return os.path.normpath(str(directory))
+
+    @staticmethod
+    def _scan(directory) -> Tuple[int, FrozenSet[str]]:
+        # post: (mtime_ns, names of the regular files) of the directory, (-1, {}) if it doesn't exist
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as it:
+                names = frozenset(e.name for e in it if e.is_file())
+        except OSError:
+            return -1, frozenset()
+        return mtime, names
+
+    def refresh(self) -> int:
+        # post: rescans every indexed directory whose mtime changed; returns how many were rescanned
+        # desc: one stat per directory, call it once per run (or chunk) rather than per lookup
+        stale = 0
+        for key, (mtime, _) in list(self._entries.items()):
+            try:
+                current = os.stat(key).st_mtime_ns
+            except OSError:
+                current = -1
+            if current != mtime:
+                self._entries[key] = self._scan(key)
+                stale += 1
+        return stale
+
+    def names(self, directory) -> FrozenSet[str]:
+        # post: file names in directory (scanned now if it wasn't indexed yet)
+        key = self._key(directory)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = self._scan(key)
+        return entry[1]
+
+    def __contains__(self, path) -> bool:
+        path = Path(path)
+        return path.name in self.names(path.parent)
+
+    def __len__(self) -> int:
+        return sum(len(names) for _, names in self._entries.values())
+
+def dataset_index() -> DirectoryIndex:
+    # post: index of IMAGE_DIR and every LESION_MASKS folder (XML_ANNOTATION_DIR instead if MASK_SOURCE == "xml")
+    if MASK_SOURCE == "xml":
+        return DirectoryIndex([IMAGE_DIR, XML_ANNOTATION_DIR])
+    return DirectoryIndex([IMAGE_DIR] + [MASK_ROOT / folder for folder in LESION_MASKS.values()])
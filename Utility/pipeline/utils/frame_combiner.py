@@ -15,7 +15,11 @@ import pandas as pd
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor
 
-from pipeline.config.settings import PATCH_OUTPUT_DIR, TARGET_DF, SUBDIR, MASTER_PICKLE_DF_PATH
+import numpy as np
+
+from pipeline.config.settings import (PATCH_OUTPUT_DIR, TARGET_DF, SUBDIR, MASTER_PICKLE_DF_PATH,
+                                      METADATA_BACKEND, MASTER_INDEX_PATH)
+from pipeline.utils.metadata_store import PatchMetadataStore
 
 def load_patch_df(image_dir):
     # pre: image_dir is a valid directory containing the subdirectory with TARGET_DF
@@ -46,10 +50,32 @@ def build_master_df():
     master_df = pd.concat([df for df in dfs if df is not None], ignore_index=True)
     return master_df.sort_values(by="image_id").reset_index(drop=True)
 
+def build_master_index(columns=None, lesion=None, filter_tag=None):
+    # pre: SavePatchesPipe ran with the "columnar" metadata backend
+    # post: returns a structured array with one row per patch, sorted by image_id
+    # desc: reads the columnar segments (projection + lesion/filter_tag predicates applied per segment),
+    #       no unpickling, no per-image DataFrames
+
+    master = PatchMetadataStore().load(columns=columns, lesion=lesion, filter_tag=filter_tag)
+    if "image_id" in master.dtype.names:
+        master = master[np.argsort(master["image_id"], kind="stable")]
+    return master
+
+def load_master_index(mmap=True):
+    # pre: MASTER_INDEX_PATH was written by this module
+    # post: returns the consolidated structured array (memory-mapped by default -> loads in ms)
+    return np.load(MASTER_INDEX_PATH, mmap_mode="r" if mmap else None)
+
 # brief: main entry point
 if __name__ == "__main__":
-    print("[INFO] Building master DataFrame from patch metadata...")
-    master_df = build_master_df()
-    master_df.to_pickle(MASTER_PICKLE_DF_PATH)
-    print(f"[DONE] Master DataFrame shape: {master_df.shape}")
+    if METADATA_BACKEND == "columnar":
+        print("[INFO] Building master index from columnar patch metadata...")
+        master = build_master_index()
+        np.save(MASTER_INDEX_PATH, master)
+        print(f"[DONE] Master index rows: {len(master)} -> {MASTER_INDEX_PATH}")
+    else:
+        print("[INFO] Building master DataFrame from patch metadata...")
+        master_df = build_master_df()
+        master_df.to_pickle(MASTER_PICKLE_DF_PATH)
+        print(f"[DONE] Master DataFrame shape: {master_df.shape}")
 
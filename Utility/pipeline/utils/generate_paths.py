@@ -13,22 +13,38 @@ sys.path.append(str(Path(__file__).resolve().parents[2]))
 import os
 import csv
 
-from pipeline.config.settings import PATCH_OUTPUT_DIR, MASTER_PATHS_CSV_PATH
+from pipeline.config.settings import PATCH_OUTPUT_DIR, MASTER_PATHS_CSV_PATH, PATCH_BACKEND, PATCH_SHARD_DIR
 
-def generate_paths():
-    # pre: PATCH_OUTPUT_DIR contains subdirectories with patch images
+def generate_paths(backend=PATCH_BACKEND):
+    # pre: PATCH_OUTPUT_DIR contains subdirectories with patch images (or PATCH_SHARD_DIR holds shards)
     # post: creates a CSV file with image names and their relative paths
-    # desc: walks through the PATCH_OUTPUT_DIR, collects all .png files, and writes
+    # desc: lists PATCH_OUTPUT_DIR/<image_id>/all, collects all .png files, and writes
     #       their names and relative paths to a CSV file for easy access
+    # note: with the "shard" backend nothing is walked, the shard offset index already lists every
+    #       patch; relative_path is then "<shard>#<slot>" (see ShardReader.locate)
 
     image_data = []
 
-    for root, _, files in os.walk(PATCH_OUTPUT_DIR):
-        for file in files:
-            if file.lower().endswith('.png'):
-                full_path = os.path.join(root, file).replace("\\", "/")
-                rel_path = full_path[full_path.index('patches/'):]
-                image_data.append((file, rel_path))
+    if backend == "shard":
+        from pipeline.utils.patch_store import ShardReader
+        rel_root = os.path.relpath(PATCH_SHARD_DIR, PATCH_OUTPUT_DIR.parent).replace("\\", "/")
+        for patch_id, (shard, slot) in ShardReader(PATCH_SHARD_DIR).index.items():
+            image_data.append((f"{patch_id}.png", f"{rel_root}/{shard}#{slot}"))
+    else:
+        # patches only ever live in PATCH_OUTPUT_DIR/<image_id>/all (@see PatchExtractionPipe), so only
+        # those folders are listed instead of walking (and stat-ing) the whole tree incl. meta/, shards/, ...
+        rel_root = os.path.relpath(PATCH_OUTPUT_DIR, PATCH_OUTPUT_DIR.parent).replace("\\", "/")
+        with os.scandir(PATCH_OUTPUT_DIR) as image_dirs:
+            for image_dir in image_dirs:
+                if not image_dir.is_dir():
+                    continue
+                try:
+                    with os.scandir(os.path.join(image_dir.path, "all")) as it:
+                        for entry in it:
+                            if entry.name.lower().endswith('.png'):
+                                image_data.append((entry.name, f"{rel_root}/{image_dir.name}/all/{entry.name}"))
+                except FileNotFoundError:
+                    continue
 
     image_data.sort(key=lambda x: x[0])  # sort by image_name
 
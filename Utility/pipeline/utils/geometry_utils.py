@@ -4,6 +4,8 @@
 
 # brief: provides geometry-related functions for polygon manipulation and patch validity checking
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from dataclasses import dataclass
 from typing import Optional, Tuple, List
 import cv2
 
@@ -93,6 +95,8 @@ def _reflective_crop(img: np.ndarray, cx: int, cy: int, size: int) -> Tuple[np.n
     # pre: img is HxW or HxWxC, cx,cy=center coords, size=patch size (square)
     # post: patch, bbox (x,y,w,h) in original image coords
     # desc: extract square patch centered at cx,cy with reflective padding if needed
+    # note: the bbox is the exact window that was cropped, so it may start at a negative coordinate
+    #       or end past the image; the part outside is the BORDER_REFLECT_101 mirror of the image
     h, w = img.shape[:2]
     half = size // 2
     x0, y0 = cx - half, cy - half
@@ -107,19 +111,17 @@ def _reflective_crop(img: np.ndarray, cx: int, cy: int, size: int) -> Tuple[np.n
         img_p = cv2.copyMakeBorder(img, pad_top, pad_bottom, pad_left, pad_right, cv2.BORDER_REFLECT_101)
         x0 += pad_left; y0 += pad_top; x1 += pad_left; y1 += pad_top
         patch = img_p[y0:y1, x0:x1].copy()
-        # bbox reported in original image coords (clamped at 0)
-        bx = max(0, cx - half); by = max(0, cy - half)
-        return patch, (bx, by, size, size)
+        # bbox reported in original image coords (not clamped, see note)
+        return patch, (cx - half, cy - half, size, size)
     else:
         patch = img[y0:y1, x0:x1].copy()
         return patch, (x0, y0, size, size)
 
-def crop_128_no_pad(img, cx, cy, size=128, max_shift=None):
-    # pre: img is HxW or HxWxC, cx,cy=center coords, size=patch size (square), max_shift=optional max shift from cx,cy
-    # post: patch or None if out of bounds or exceeds max_shift, bbox (x
-    # desc: extract square patch centered at cx,cy; return None if out of bounds or exceeds max_shift
+def _shifted_center(cx, cy, w, h, size=128, max_shift=None) -> Optional[Tuple[int, int]]:
+    # pre: cx,cy=center coords, w,h=image size, size=patch size, max_shift=optional max shift
+    # post: (nx, ny) center that keeps the full patch inside the image, or None if the shift exceeds max_shift
+    # desc: the clamping rule of crop_128_no_pad, usable before any crop is made
 
-    h, w = img.shape[:2]
     half = size // 2
 
     # clamp center to keep full patch inside
@@ -129,29 +131,149 @@ def crop_128_no_pad(img, cx, cy, size=128, max_shift=None):
     # optionally refuse large shifts (protect centroid fidelity)
     if max_shift is not None:
         if abs(nx - cx) > max_shift or abs(ny - cy) > max_shift:
-            return None, None  # signal to skip
+            return None
+    return nx, ny
+
+def crop_128_no_pad(img, cx, cy, size=128, max_shift=None):
+    # pre: img is HxW or HxWxC, cx,cy=center coords, size=patch size (square), max_shift=optional max shift from cx,cy
+    # post: patch or None if out of bounds or exceeds max_shift, bbox (x,y,w,h) of the (shifted) crop or None
+    # desc: extract square patch centered at cx,cy; return None if out of bounds or exceeds max_shift
+
+    h, w = img.shape[:2]
+    half = size // 2
+
+    center = _shifted_center(cx, cy, w, h, size, max_shift)
+    if center is None:
+        return None, None  # signal to skip
+    nx, ny = center
 
     x0, y0 = nx - half, ny - half
     x1, y1 = x0 + size, y0 + size
     patch = img[y0:y1, x0:x1].copy()
     return patch, (x0, y0, size, size)
 
+def crop_batch(img: np.ndarray, x0, y0, size: int = PATCH_SIZE) -> np.ndarray:
+    # pre: img is HxW or HxWxC, x0,y0 = arrays of window top-left corners (may lie outside the image)
+    # post: (N, size, size[, C]) contiguous stack, stack[i] == img window [y0[i]:y0[i]+size, x0[i]:x0[i]+size]
+    #       with BORDER_REFLECT_101 pixels where the window leaves the image (same as _reflective_crop)
+    # desc: pads the image once (only as far as the windows reach), then gathers every window in one
+    #       fancy index into a sliding_window_view; the gather is the only allocation
+    # note: for windows fully inside the image this is pixel-identical to crop_128_no_pad/_reflective_crop
+
+    h, w = img.shape[:2]
+    x0 = np.asarray(x0, dtype=np.intp).ravel()
+    y0 = np.asarray(y0, dtype=np.intp).ravel()
+    if x0.size == 0:
+        return np.empty((0, size, size) + img.shape[2:], dtype=img.dtype)
+
+    pad_left   = max(0, -int(x0.min()))
+    pad_top    = max(0, -int(y0.min()))
+    pad_right  = max(0, int(x0.max()) + size - w)
+    pad_bottom = max(0, int(y0.max()) + size - h)
+
+    padded = img
+    if any((pad_left, pad_top, pad_right, pad_bottom)):
+        padded = cv2.copyMakeBorder(img, pad_top, pad_bottom, pad_left, pad_right, cv2.BORDER_REFLECT_101)
+
+    # window over all channels at once -> view (H', W', 1, size, size, C); [y, x, 0] gathers N full patches
+    windows = sliding_window_view(padded, (size, size) + padded.shape[2:])
+    stack = windows[y0 + pad_top, x0 + pad_left]
+    return stack[:, 0] if padded.ndim == 3 else stack
+
+def grid_tiles(img: np.ndarray, size: int = PATCH_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    # pre: img is HxW or HxWxC
+    # post: (tiles, origins) -> tiles (N, size, size[, C]) row-major, origins (N, 2) int (x0, y0)
+    # desc: regular non-overlapping tiling for inference; a 1280x1280 image gives 10x10 = 100 tiles.
+    #       sizes that aren't a multiple of size are reflect-padded on the bottom/right
+    # note: the strided grid view itself is zero-copy, the only copy is the final (N, ...) reshape
+
+    h, w = img.shape[:2]
+    ny, nx = -(-h // size), -(-w // size)
+    pad_bottom, pad_right = ny * size - h, nx * size - w
+    if pad_bottom or pad_right:
+        img = cv2.copyMakeBorder(img, 0, pad_bottom, 0, pad_right, cv2.BORDER_REFLECT_101)
+
+    grid = sliding_window_view(img, (size, size) + img.shape[2:])[::size, ::size]
+    if img.ndim == 3:
+        grid = grid[:, :, 0]
+    tiles = grid.reshape((ny * nx, size, size) + img.shape[2:])
+
+    ys, xs = np.mgrid[0:ny * size:size, 0:nx * size:size]
+    origins = np.stack([xs.ravel(), ys.ravel()], axis=1)
+    return tiles, origins
+
+def _connected_component_stats(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # pre: mask is binary uint8
+    # post: (labels, centroids, areas, bboxes) for every connected component, background dropped
+    #       labels    -> HxW int32 label image (0 = background, component k has label k + 1)
+    #       centroids -> (n, 2) int array of (cx, cy), rounded like the per-pixel mean
+    #       areas     -> (n,) int array of pixel counts
+    #       bboxes    -> (n, 4) int array of (x, y, w, h)
+    # desc: single pass over the mask via cv2.connectedComponentsWithStats (8-connectivity,
+    #       same as cv2.connectedComponents), instead of one np.where(lbl == i) scan per component
+
+    m = (mask > 0).astype(np.uint8)
+    n, lbl, stats, cents = cv2.connectedComponentsWithStats(m, connectivity=8, ltype=cv2.CV_32S)
+
+    areas = stats[1:, cv2.CC_STAT_AREA].astype(np.int64)
+    bboxes = stats[1:, :cv2.CC_STAT_AREA].astype(np.int64)   # x, y, w, h
+    centroids = np.rint(cents[1:]).astype(np.int64)          # rint = round-half-even, same as round()
+    return lbl, centroids, areas, bboxes
+
+@dataclass
+class ComponentPixelIndex:
+    # brief: CSR-style label -> pixel table for all lesion components of one mask
+    # note: pixels[offsets[k]:offsets[k + 1]] are the flat (y * width + x) indices of component k;
+    #       built once per mask, so retries draw from the right component in O(1)
+
+    width: int
+    centroids: np.ndarray   # (n, 2) int (cx, cy)
+    areas: np.ndarray       # (n,) int
+    bboxes: np.ndarray      # (n, 4) int (x, y, w, h)
+    offsets: np.ndarray     # (n + 1,) int64
+    pixels: np.ndarray      # (sum(areas),) int32
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray) -> "ComponentPixelIndex":
+        # pre: mask is a binary HxW mask
+        # post: index over all connected components of the mask
+        # desc: one connectedComponentsWithStats pass + one sort of the foreground pixels by label;
+        #       offsets come straight from the component areas (labels are 1..n, sorted)
+
+        labels, centroids, areas, bboxes = _connected_component_stats(mask)
+        flat = labels.ravel()
+        fg = np.flatnonzero(flat)
+        pixels = fg[np.argsort(flat[fg], kind="stable")].astype(np.int32)
+
+        offsets = np.zeros(len(areas) + 1, dtype=np.int64)
+        np.cumsum(areas, out=offsets[1:])
+        return cls(labels.shape[1], centroids, areas, bboxes, offsets, pixels)
+
+    def __len__(self) -> int:
+        return len(self.areas)
+
+    def component_pixels(self, k: int) -> np.ndarray:
+        # post: view of the flat pixel indices of component k (no copy)
+        return self.pixels[self.offsets[k]:self.offsets[k + 1]]
+
+    def random_pixel(self, k: int, rng: Optional[np.random.RandomState] = None) -> Tuple[int, int]:
+        # pre: 0 <= k < len(self), rng is an optional RandomState (None -> the global numpy RNG)
+        # post: (x, y) of a uniformly drawn pixel of component k
+        # desc: O(1), draws from the same RNG as the rest of the extraction code
+
+        rng = np.random if rng is None else rng
+        i = self.offsets[k] + rng.randint(0, self.areas[k])
+        y, x = divmod(int(self.pixels[i]), self.width)
+        return x, y
+
 def _connected_component_centroids(mask: np.ndarray) -> List[Tuple[int,int,int]]:
     # pre: mask is binary uint8
     # post: list of (cx,cy,area) for each connected component
     # desc: find connected components and return their centroids and areas
+    # note: thin wrapper over _connected_component_stats, kept for existing callers
 
-    m = (mask > 0).astype(np.uint8)
-    n, lbl = cv2.connectedComponents(m)
-    out = []
-    for i in range(1, n):
-        ys, xs = np.where(lbl == i)
-        if xs.size == 0:
-            continue
-        cx = int(round(xs.mean()))
-        cy = int(round(ys.mean()))
-        out.append((cx, cy, int(xs.size)))
-    return out
+    _, centroids, areas, _ = _connected_component_stats(mask)
+    return [(int(cx), int(cy), int(a)) for (cx, cy), a in zip(centroids, areas)]
 
 def _dilate(mask: np.ndarray, r: int) -> np.ndarray:
     # pre: mask is binary uint8, r=dilation radius in pixels
@@ -7,7 +7,7 @@
 import cv2
 import numpy as np
 
-from pipeline.config.settings import PATCH_BLACK_THRESHOLD, BLACK_RATIO
+from pipeline.config.settings import PATCH_BLACK_THRESHOLD, BLACK_RATIO, PATCH_SIZE
 
 def extract_green_channel(image: np.ndarray) -> np.ndarray:
     # pre: image is a valid BGR image
@@ -67,3 +67,62 @@ def is_mostly_black(patch, threshold: int = PATCH_BLACK_THRESHOLD, black_ratio:
 
     return ratio > black_ratio
 
+def dark_pixel_map(image: np.ndarray, threshold: int = PATCH_BLACK_THRESHOLD) -> np.ndarray:
+    # pre: image is HxW or HxWxC
+    # post: HxW bool map, True where the pixel counts as black
+    # desc: same per-pixel rule as is_mostly_black (channel mean < threshold), computed once per image
+
+    arr = image.astype(np.float32, copy=False)
+    if arr.ndim == 3 and arr.shape[2] >= 3:
+        arr = arr.mean(axis=2)
+    return arr < threshold
+
+class DarknessTable:
+    # brief: per-image summed-area table of black pixels for O(1) black-ratio lookups
+    # note: the darkness map is reflect-padded by size // 2 before integrating, so the window of a
+    #       center near the border counts exactly the pixels _reflective_crop would mirror in; for
+    #       centers at least size // 2 from the border it is the plain in-image window. the rule per
+    #       pixel is the one is_mostly_black uses, so is_black(x, y) == is_mostly_black(crop at x, y).
+
+    def __init__(self, image: np.ndarray, size: int = PATCH_SIZE,
+                 threshold: int = PATCH_BLACK_THRESHOLD, black_ratio: float = BLACK_RATIO):
+        # pre: image is HxW or HxWxC
+        # post: table of shape (H + size + 1, W + size + 1) ready for lookups
+
+        self.size = size
+        self.half = size // 2
+        self.black_ratio = black_ratio
+        self.shape = image.shape[:2]
+
+        dark = dark_pixel_map(image, threshold).view(np.uint8)
+        pad = self.half
+        dark = cv2.copyMakeBorder(dark, pad, size - pad, pad, size - pad, cv2.BORDER_REFLECT_101)
+        self.sat = cv2.integral(dark, sdepth=cv2.CV_32S)
+
+    def black_counts(self, xs, ys) -> np.ndarray:
+        # pre: xs, ys are (arrays of) patch centers inside the image
+        # post: number of black pixels in each size x size window
+        # desc: four gathers from the SAT, fully vectorized over the batch
+
+        xs = np.asarray(xs, dtype=np.intp)
+        ys = np.asarray(ys, dtype=np.intp)
+        s, t = self.size, self.sat
+        # padded window of center (x, y) starts at (x - half + half) = (x, y)
+        return t[ys + s, xs + s] - t[ys, xs + s] - t[ys + s, xs] + t[ys, xs]
+
+    def black_ratio_at(self, xs, ys) -> np.ndarray:
+        # post: black-pixel ratio of each window
+        return self.black_counts(xs, ys) / float(self.size * self.size)
+
+    def is_black(self, xs, ys) -> np.ndarray:
+        # post: True where the window would be rejected by is_mostly_black
+        return self.black_ratio_at(xs, ys) > self.black_ratio
+
+    def valid_center_map(self) -> np.ndarray:
+        # post: HxW bool map, True where a patch centered there is NOT mostly black
+        # desc: the whole image in one vectorized pass over shifted SAT slices
+
+        h, w = self.shape
+        s, t = self.size, self.sat
+        counts = t[s:s + h, s:s + w] - t[:h, s:s + w] - t[s:s + h, :w] + t[:h, :w]
+        return counts <= self.black_ratio * (s * s)
@@ -0,0 +1,128 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: append-only, crash-safe completion ledger (SQLite, WAL mode) keyed by (image_id, config hash)
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+import os
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional, Set
+
+from pipeline.config import settings
+from pipeline.config.settings import LEDGER_PATH
+from pipeline.utils.io_utils import ensure_dir
+
+# note: one row is inserted per finished image, nothing is ever rewritten. WAL mode lets any
+#       number of worker processes append concurrently with readers, and a crash can at worst lose
+#       the image that was in flight -> a resumed run redoes exactly the images without a row.
+#       rows are scoped by a hash of the pipe chain + the settings that change its output, so
+#       changing e.g. PATCH_SIZE or SEED starts a fresh (empty) completion set.
+
+# brief: settings that change what the pipeline writes (part of the config hash)
+LEDGER_CONFIG_KEYS = (
+    "PATCH_SIZE", "SEED", "HEALTHY_TO_LESION_RATIO", "LESION_DILATE_PX", "FOV_REQUIRED",
+    "AVOID_OPTIC_DISC", "PATCH_BLACK_THRESHOLD", "BLACK_RATIO", "HEALTHY_PATCHES_LIMIT_MP",
+    "LESION_LABELS", "PATCH_BACKEND", "METADATA_BACKEND", "PATCH_OUTPUT_DIR",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS done (
+    image_id    TEXT NOT NULL,
+    config_hash TEXT NOT NULL,
+    finished_at REAL NOT NULL,
+    PRIMARY KEY (image_id, config_hash)
+) WITHOUT ROWID
+"""
+
+def config_hash(pipes: Iterable = ()) -> str:
+    # pre: pipes are the pipe instances (or classes) of a pipeline
+    # post: short, stable hex digest of the pipe chain + LEDGER_CONFIG_KEYS settings
+    pipes = [getattr(p, "wrapped", p) for p in pipes]  # a CachedPipe produces what it wraps
+    names = [p.__name__ if isinstance(p, type) else p.__class__.__name__ for p in pipes]
+    conf = {k: str(getattr(settings, k, None)) for k in LEDGER_CONFIG_KEYS}
+    blob = json.dumps({"pipes": names, "settings": conf}, sort_keys=True)
+    return hashlib.sha1(blob.encode()).hexdigest()[:16]
+
+class CompletionLedger:
+    # brief: set of completed image ids for one pipeline config, persisted in SQLite
+    # note: the completed set is read once per process and kept in memory, so lookups are O(1);
+    #       a forked child reopens its own connection (sqlite connections must not cross fork)
+
+    def __init__(self, path: Path = LEDGER_PATH, config: Optional[str] = None):
+        # pre: config is a config_hash() digest (None -> hash of the settings alone)
+        # post: ledger bound to `path`; the database is opened lazily
+        self.path = Path(path)
+        self.config = config or config_hash()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._done: Optional[Set[str]] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # post: open connection for this process, WAL mode, schema present
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        ensure_dir(self.path.parent)
+        conn = sqlite3.connect(str(self.path), timeout=30.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL + NORMAL -> survives process crashes
+        conn.execute(_SCHEMA)
+        conn.commit()
+        self._conn, self._pid, self._done = conn, os.getpid(), None
+        return conn
+
+    def completed(self) -> Set[str]:
+        # post: image ids already finished under this config (cached after the first call)
+        with self._lock:
+            conn = self._connect()
+            if self._done is None:
+                rows = conn.execute("SELECT image_id FROM done WHERE config_hash = ?", (self.config,))
+                self._done = {r[0] for r in rows}
+            return self._done
+
+    def is_done(self, image_id: str) -> bool:
+        return image_id in self.completed()
+
+    def pending(self, items: Iterable[dict]) -> List[dict]:
+        # pre: items carry "image_id"
+        # post: the items not yet completed, in input order
+        done = self.completed()
+        return [item for item in items if item["image_id"] not in done]
+
+    def mark_done(self, image_ids: Iterable[str]) -> None:
+        # post: one row per id appended and committed (already present ids are ignored)
+        ids = [str(i) for i in image_ids]
+        if not ids:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.executemany("INSERT OR IGNORE INTO done (image_id, config_hash, finished_at) VALUES (?, ?, ?)",
+                             [(i, self.config, now) for i in ids])
+            conn.commit()
+            if self._done is not None:
+                self._done.update(ids)
+
+    def reset(self) -> None:
+        # post: every completion recorded under this config is forgotten
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM done WHERE config_hash = ?", (self.config,))
+            conn.commit()
+            self._done = set()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn, self._done = None, None
@@ -0,0 +1,171 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: single-channel lesion mask decoding + a compact, bit-packed mask that expands only the crops asked for
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from pipeline.config.settings import LESION_LABELS
+
+# note: a lesion mask is a 1280x1280 image that is almost entirely zero. PackedMask keeps only the
+#       bounding box of its nonzero pixels, 8 pixels per byte (np.packbits along x), so a
+#       microaneurysm mask is a few KB instead of 1.6 MB (uint8) / 4.9 MB (decoded RGB), and an
+#       empty mask costs nothing. indexing with 2D slices expands just that window.
+
+def read_mask(mask_path: Path) -> Optional[np.ndarray]:
+    # pre: mask_path points to a lesion mask PNG (binary data in the red channel, @see LesionMaskLoadingPipe)
+    # post: HxW uint8 red channel, or None if the file doesn't exist / can't be decoded
+    # desc: decodes without the BGR->RGB conversion and keeps a single channel; a missing file
+    #       is detected by the failed open itself, so no separate exists() stat is needed
+    #       (and opencv doesn't log a warning per missing mask)
+
+    try:
+        buf = np.fromfile(str(mask_path), dtype=np.uint8)
+    except OSError:
+        return None
+    m = cv2.imdecode(buf, cv2.IMREAD_UNCHANGED)
+    if m is None:
+        return None
+    if m.ndim == 3:
+        m = cv2.extractChannel(m, 2)  # BGR(A) order -> red is channel 2 (contiguous copy)
+    return m
+
+@dataclass
+class PackedMask:
+    # brief: binary HxW mask stored as the bit-packed crop of its nonzero bounding box
+    height: int
+    width: int
+    y0: int           # bounding box of the nonzero pixels (empty mask -> 0-sized box)
+    x0: int
+    box_h: int
+    box_w: int
+    bits: np.ndarray  # (box_h, ceil(box_w / 8)) uint8, np.packbits(..., axis=1)
+
+    @classmethod
+    def from_array(cls, mask: np.ndarray) -> "PackedMask":
+        # pre: mask is a 2D array, nonzero = lesion
+        # post: packed copy of (mask > 0)
+        h, w = mask.shape[:2]
+        rows = np.flatnonzero(mask.any(axis=1))
+        if rows.size == 0:
+            return cls(h, w, 0, 0, 0, 0, np.zeros((0, 0), dtype=np.uint8))
+        cols = np.flatnonzero(mask[rows[0]:rows[-1] + 1].any(axis=0))
+        y0, y1, x0, x1 = int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+        bits = np.packbits(mask[y0:y1, x0:x1] > 0, axis=1)
+        return cls(h, w, y0, x0, y1 - y0, x1 - x0, bits)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (self.height, self.width)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.bits.nbytes)
+
+    def any(self) -> bool:
+        return self.box_h > 0
+
+    def window(self, y0: int, y1: int, x0: int, x1: int) -> np.ndarray:
+        # pre: 0 <= y0 <= y1 <= height, 0 <= x0 <= x1 <= width
+        # post: (y1-y0, x1-x0) uint8 0/1 expansion of that window
+        # desc: unpacks only the packed bytes overlapping the window
+        out = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        oy0, oy1 = max(y0, self.y0), min(y1, self.y0 + self.box_h)
+        ox0, ox1 = max(x0, self.x0), min(x1, self.x0 + self.box_w)
+        if oy0 >= oy1 or ox0 >= ox1:
+            return out
+
+        bx0, bx1 = ox0 - self.x0, ox1 - self.x0                # window in box coordinates
+        byte0, byte1 = bx0 // 8, (bx1 + 7) // 8
+        unpacked = np.unpackbits(self.bits[oy0 - self.y0:oy1 - self.y0, byte0:byte1], axis=1)
+        out[oy0 - y0:oy1 - y0, ox0 - x0:ox1 - x0] = unpacked[:, bx0 - 8 * byte0:bx1 - 8 * byte0]
+        return out
+
+    def to_array(self) -> np.ndarray:
+        # post: full HxW uint8 0/1 mask
+        return self.window(0, self.height, 0, self.width)
+
+    def __array__(self, dtype=None, copy=None):
+        m = self.to_array()
+        return m if dtype is None else m.astype(dtype)
+
+    def __getitem__(self, key) -> np.ndarray:
+        # pre: key is (row slice, col slice) with step 1, numpy slicing semantics
+        # post: dense 0/1 uint8 window, same result as to_array()[key]
+        ys, xs = key
+        y0, y1, sy = ys.indices(self.height)
+        x0, x1, sx = xs.indices(self.width)
+        if sy != 1 or sx != 1:
+            raise IndexError("PackedMask only supports contiguous 2D slices")
+        return self.window(y0, max(y0, y1), x0, max(x0, x1))
+
+class LabelCube:
+    # brief: lesion masks as a stack of summed-area tables, one per class with a non-empty mask
+    # note: sats[i] is the SAT of labels[k] for k = the i-th present class. the lesion pixel count of
+    #       any window is 4 lookups per class, so all windows of an image are labelled in one
+    #       vectorized gather instead of a crop + np.any per (patch, class).
+    #       with pad > 0 the SATs cover the masks extended by `pad` px with BORDER_REFLECT_101, the
+    #       same mirroring _reflective_crop applies to the image, so a window hanging over the
+    #       border is labelled from exactly the pixels that were saved
+
+    def __init__(self, masks: Dict[str, Optional[object]], shape: Tuple[int, int],
+                 labels: Sequence[str] = LESION_LABELS, pad: int = 0):
+        # pre: masks maps lesion type -> PackedMask / 2D array / None, all of size shape; pad < min(shape)
+        # post: SATs built; classes whose mask is None are reported by missing()
+        h, w = shape
+        self.labels = list(labels)
+        self.shape = (h, w)
+        self.pad = int(pad)
+        self._missing: List[str] = []
+        self._planes: List[int] = []     # class indices that have a non-empty mask
+        sats = []
+
+        for k, lesion in enumerate(self.labels):
+            m = masks.get(lesion)
+            if m is None:
+                self._missing.append(lesion)
+                continue
+            if not m.any():
+                continue
+            plane = (np.asarray(m) > 0).astype(np.uint8)
+            self._planes.append(k)
+            if self.pad:
+                plane = cv2.copyMakeBorder(plane, self.pad, self.pad, self.pad, self.pad, cv2.BORDER_REFLECT_101)
+            sats.append(cv2.integral(plane, sdepth=cv2.CV_32S))
+
+        p2 = 2 * self.pad
+        self.sats = np.stack(sats) if sats else np.zeros((0, h + p2 + 1, w + p2 + 1), dtype=np.int32)
+
+    def missing(self) -> List[str]:
+        # post: lesion types without a mask for this image
+        return list(self._missing)
+
+    def counts(self, x0, y0, x1, y1) -> np.ndarray:
+        # pre: window bounds (arrays of equal length), [x0, x1) x [y0, y1) in image coordinates
+        # post: (n, len(labels)) int32 lesion pixel counts per window; windows are clipped to the
+        #       image extended by pad (reflected pixels count like the ones they mirror)
+        h, w = self.shape
+        p = self.pad
+        x0, x1 = np.clip(np.asarray(x0) + p, 0, w + 2 * p), np.clip(np.asarray(x1) + p, 0, w + 2 * p)
+        y0, y1 = np.clip(np.asarray(y0) + p, 0, h + 2 * p), np.clip(np.asarray(y1) + p, 0, h + 2 * p)
+        x1, y1 = np.maximum(x0, x1), np.maximum(y0, y1)
+
+        out = np.zeros((x0.size, len(self.labels)), dtype=np.int32)
+        if self._planes:
+            S = self.sats
+            out[:, self._planes] = (S[:, y1, x1] - S[:, y0, x1] - S[:, y1, x0] + S[:, y0, x0]).T
+        return out
+
+    def label_vectors(self, x0, y0, x1, y1) -> np.ndarray:
+        # post: (n, len(labels)) uint8, 1 where the class has any pixel in the window
+        return (self.counts(x0, y0, x1, y1) > 0).astype(np.uint8)
+
+    def area_fractions(self, x0, y0, x1, y1, area: float) -> np.ndarray:
+        # post: (n, len(labels)) float32 share of the window's `area` pixels covered by each class
+        return self.counts(x0, y0, x1, y1).astype(np.float32) / np.float32(area)
@@ -0,0 +1,223 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: columnar, append-only patch metadata store (NumPy structured records) replacing the
+#        per-image patch_frame.pkl files; loads with column projection and lesion-class predicates
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+import os
+import itertools
+import json
+import threading
+import time
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from pipeline.config.settings import LESION_LABELS, PATCH_META_DIR, PATCH_SIZE
+from pipeline.utils.io_utils import ensure_dir
+
+# layout:
+#   PATCH_META_DIR/schema.json       -> dtype descr + category tables (written once)
+#   PATCH_META_DIR/<stream>.bin      -> raw PATCH_META_DTYPE records, append-only, one stream per process
+#
+# note: a record is fixed-width, so a segment is just an array on disk: it is memory-mapped on read,
+#       a torn tail record (crash mid-append) is ignored. patch_id / file_path are not stored, they
+#       are derived from (image_id, x, y) exactly like PatchExtractionPipe builds them.
+
+# brief: categorical codes for filter_tag (index = code)
+FILTER_TAGS = ("lesion", "healthy", "black")
+
+# brief: one row per patch
+#        label_bits -> bit k set <=> LESION_LABELS[k] present in the patch
+#        label_area -> share of the patch covered by LESION_LABELS[k] (soft label)
+#        bbox_x/y   -> top-left corner of the exact PATCH_SIZE window the patch was cropped from
+#                      (may be negative / past the image for reflect-padded healthy patches)
+PATCH_META_DTYPE = np.dtype([
+    ("image_id", "S24"),
+    ("x", "<i2"), ("y", "<i2"),
+    ("tl_x", "<i2"), ("tl_y", "<i2"),
+    ("br_x", "<i2"), ("br_y", "<i2"),
+    ("bbox_x", "<i2"), ("bbox_y", "<i2"),
+    ("label_bits", "u1"),
+    ("filter_tag", "u1"),
+    ("label_area", "<f2", (len(LESION_LABELS),)),
+])
+
+# brief: bytes available for an image_id (longer ids are rejected, never cut off)
+IMAGE_ID_BYTES = PATCH_META_DTYPE["image_id"].itemsize
+
+_STREAM_SEQ = itertools.count()
+
+def lesion_bit(lesion: str) -> int:
+    # pre: lesion in LESION_LABELS
+    # post: bit mask of that lesion class in label_bits
+    return 1 << LESION_LABELS.index(lesion)
+
+def patches_to_records(patches: Sequence[dict]) -> np.ndarray:
+    # pre: patches are the dicts produced by PatchExtractionPipe / LabelPatchesPipe
+    # post: structured array of PATCH_META_DTYPE, one row per patch; raises ValueError if an
+    #       image_id doesn't fit IMAGE_ID_BYTES (numpy would silently truncate it)
+    # desc: fills each column in one vectorized assignment
+
+    rec = np.zeros(len(patches), dtype=PATCH_META_DTYPE)
+    if not patches:
+        return rec
+
+    tl = np.array([p["coordinates"]["top-left"] for p in patches], dtype=np.int32)
+    br = np.array([p["coordinates"]["bottom-right"] for p in patches], dtype=np.int32)
+    labels = np.array([p["label_vector"] for p in patches], dtype=np.uint8).reshape(len(patches), -1)
+    weights = (1 << np.arange(labels.shape[1], dtype=np.uint8))
+
+    image_ids = [p["image_id"].encode() for p in patches]
+    too_long = next((i for i in image_ids if len(i) > IMAGE_ID_BYTES), None)
+    if too_long is not None:
+        raise ValueError(f"image_id {too_long.decode()!r} is {len(too_long)} bytes, the metadata store holds "
+                         f"at most {IMAGE_ID_BYTES}; widen image_id in PATCH_META_DTYPE (and rebuild PATCH_META_DIR)")
+
+    rec["image_id"] = image_ids
+    rec["x"] = [p["x"] for p in patches]
+    rec["y"] = [p["y"] for p in patches]
+    rec["tl_x"], rec["tl_y"] = tl[:, 0], tl[:, 1]
+    rec["br_x"], rec["br_y"] = br[:, 0], br[:, 1]
+    rec["label_bits"] = (labels * weights).sum(axis=1)
+    rec["filter_tag"] = [FILTER_TAGS.index(p["filter_tag"]) for p in patches]
+    if all("bbox" in p for p in patches):
+        bbox = np.array([p["bbox"] for p in patches], dtype=np.int32)
+        rec["bbox_x"], rec["bbox_y"] = bbox[:, 0], bbox[:, 1]
+    if all("label_area" in p for p in patches):
+        rec["label_area"] = np.array([p["label_area"] for p in patches], dtype=np.float32)
+    return rec
+
+def patch_ids(rec: np.ndarray) -> List[str]:
+    # pre: rec has image_id, x, y columns
+    # post: patch ids in PatchExtractionPipe's format (<image_id>_<xxxx>_<yyyy>)
+    return [f"{i.decode()}_{str(x).zfill(4)}_{str(y).zfill(4)}" for i, x, y in zip(rec["image_id"], rec["x"], rec["y"])]
+
+class PatchMetadataStore:
+    # brief: append-only writer + projecting/filtering reader over the segment files in `root`
+
+    def __init__(self, root: Path = PATCH_META_DIR):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._fh = None
+        self._pid = None
+
+    # ---- write ----
+
+    def _check_schema(self):
+        # post: returns if root has no schema yet or its record layout matches PATCH_META_DTYPE
+        # desc: segments are raw records, so reading them with a different layout would be garbage
+        schema = self.root / "schema.json"
+        if not schema.exists():
+            return
+        with open(schema) as f:
+            stored = json.load(f)
+        if json.loads(json.dumps(PATCH_META_DTYPE.descr)) != stored["dtype"]:
+            raise ValueError(f"{self.root} holds records of a different layout; "
+                             f"rebuild it or point PATCH_META_DIR at a new directory")
+
+    def _ensure_segment(self):
+        # post: this process has an open segment (forked children open their own)
+        if self._fh is not None and self._pid == os.getpid():
+            return
+        ensure_dir(self.root)
+        self._check_schema()
+        schema = self.root / "schema.json"
+        if not schema.exists():
+            tmp = schema.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "w") as f:
+                json.dump({"dtype": PATCH_META_DTYPE.descr, "filter_tag": list(FILTER_TAGS),
+                           "label_bits": list(LESION_LABELS), "patch_size": PATCH_SIZE}, f, indent=2)
+            os.replace(tmp, schema)
+        self._pid = os.getpid()
+        name = f"{time.strftime('%Y%m%d%H%M%S')}-{self._pid}-{next(_STREAM_SEQ):03d}.bin"
+        self._fh = open(self.root / name, "ab")
+
+    def append(self, records: np.ndarray) -> None:
+        # pre: records has dtype PATCH_META_DTYPE
+        # post: records appended to this process' segment and handed to the OS
+        if records.dtype != PATCH_META_DTYPE:
+            raise ValueError(f"expected {PATCH_META_DTYPE}, got {records.dtype}")
+        if records.size == 0:
+            return
+        with self._lock:
+            self._ensure_segment()
+            self._fh.write(records.tobytes())
+            self._fh.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None and self._pid == os.getpid():
+                self._fh.close()
+            self._fh = None
+
+    # ---- read ----
+
+    def segments(self) -> List[Path]:
+        return sorted(self.root.glob("*.bin"))
+
+    def _scan(self) -> Iterable[np.ndarray]:
+        # post: yields each segment as a read-only memmap of whole records
+        self._check_schema()
+        for path in self.segments():
+            n = os.path.getsize(path) // PATCH_META_DTYPE.itemsize
+            if n:
+                yield np.memmap(path, dtype=PATCH_META_DTYPE, mode="r", shape=(n,))
+
+    def load(self, columns: Optional[Sequence[str]] = None, lesion: Optional[str] = None,
+             filter_tag: Optional[str] = None, image_ids: Optional[Iterable[str]] = None) -> np.ndarray:
+        # pre: columns is a subset of PATCH_META_DTYPE.names (None = all)
+        # post: structured array with only the requested columns and rows matching every predicate
+        # desc: predicates are evaluated per segment on the mapped columns they touch, and only
+        #       matching rows of the projected columns are copied out
+
+        names = list(columns) if columns is not None else list(PATCH_META_DTYPE.names)
+        out_dtype = np.dtype([(n, PATCH_META_DTYPE.fields[n][0]) for n in names])
+        # ids longer than IMAGE_ID_BYTES can't be stored, so they are dropped rather than cut down to a stored one
+        wanted = None if image_ids is None else np.array([b for b in (i.encode() for i in image_ids)
+                                                          if len(b) <= IMAGE_ID_BYTES], dtype=f"S{IMAGE_ID_BYTES}")
+
+        parts = []
+        for seg in self._scan():
+            keep = np.ones(len(seg), dtype=bool)
+            if lesion is not None:
+                keep &= (seg["label_bits"] & lesion_bit(lesion)) != 0
+            if filter_tag is not None:
+                keep &= seg["filter_tag"] == FILTER_TAGS.index(filter_tag)
+            if wanted is not None:
+                keep &= np.isin(seg["image_id"], wanted)
+            idx = np.flatnonzero(keep)
+
+            part = np.empty(idx.size, dtype=out_dtype)
+            for n in names:
+                part[n] = seg[n][idx]
+            parts.append(part)
+
+        return np.concatenate(parts) if parts else np.empty(0, dtype=out_dtype)
+
+    def to_pandas(self, records: Optional[np.ndarray] = None, **load_kwargs):
+        # post: DataFrame view of the records with decoded image_id, categorical filter_tag,
+        #       one 0/1 column per lesion class (same information as the old label_vector)
+        #       and one <lesion>_area column per class (soft labels)
+        import pandas as pd
+
+        rec = self.load(**load_kwargs) if records is None else records
+        df = pd.DataFrame({n: rec[n] for n in rec.dtype.names if n != "label_area"})
+        if "image_id" in df:
+            df["image_id"] = df["image_id"].str.decode("ascii")
+        if "filter_tag" in df:
+            df["filter_tag"] = pd.Categorical.from_codes(df["filter_tag"], categories=list(FILTER_TAGS))
+        if "label_bits" in df:
+            for k, lesion in enumerate(LESION_LABELS):
+                df[lesion] = ((df["label_bits"].to_numpy() >> k) & 1).astype(np.uint8)
+        if "label_area" in rec.dtype.names:
+            for k, lesion in enumerate(LESION_LABELS):
+                df[f"{lesion}_area"] = rec["label_area"][:, k].astype(np.float32)
+        return df
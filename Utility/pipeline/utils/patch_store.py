@@ -0,0 +1,212 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: sharded binary patch store -> raw uint8 patches packed into fixed-size, memory-mappable shard files
+#        (alternative output backend to one PNG per patch, see PATCH_BACKEND in settings.py)
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+import os
+import csv
+import itertools
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from pipeline.config.settings import PATCH_SIZE, PATCH_OUTPUT_DIR, PATCH_SHARD_DIR, SHARD_DIR_LIMIT
+from pipeline.utils.io_utils import ensure_dir
+from pipeline.utils.patch_writer import WriteBatch
+
+# layout:
+#   PATCH_SHARD_DIR/<stream>-<nnnnn>.bin   -> SHARD_DIR_LIMIT x PATCH_SIZE x PATCH_SIZE x 3 uint8, C order
+#   PATCH_SHARD_DIR/<stream>.idx           -> CSV "patch_id,shard,slot", one line per patch, append-only
+#
+# note: every writer (= process) owns its own stream, so parallel workers never share a file.
+#       byte offset of a patch = slot * PATCH_SIZE * PATCH_SIZE * 3; the last shard of a stream is
+#       cut down to the slots it used when the writer closes (a killed writer leaves it full size),
+#       the .idx file is the source of truth for which slots are used.
+#       if a patch_id shows up in several streams (rerun), the most recently written stream wins.
+
+PATCH_SHAPE = (PATCH_SIZE, PATCH_SIZE, 3)
+
+# brief: per-process stream counter, so a writer reopened within the same second never reuses a name
+_STREAM_SEQ = itertools.count()
+
+class ShardWriter:
+    # brief: appends RGB patches to the shard files of one stream
+    # note: drop-in for PatchWriter (batch / submit / flush / close / stats / report), so
+    #       PatchExtractionPipe and SavePatchesPipe don't care which backend is active.
+    #       a patch write is a single memcpy into the mapped shard, no encoding involved,
+    #       so a failed write raises straight from submit() and a batch has nothing to wait for.
+
+    per_patch_files = False  # no per-image patch directories needed
+
+    def __init__(self, root: Path = PATCH_SHARD_DIR, capacity: int = SHARD_DIR_LIMIT,
+                 patch_shape: Tuple[int, int, int] = PATCH_SHAPE, stream: Optional[str] = None):
+        # pre: capacity >= 1
+        # post: writer for a new stream; files are created lazily on first submit
+
+        self.root = Path(root)
+        self.capacity = int(capacity)
+        self.patch_shape = tuple(patch_shape)
+        self.stream = stream
+        self._lock = threading.Lock()
+        self._shard_no = -1
+        self._slot = self.capacity   # forces a new shard on the first submit
+        self._mm = None
+        self._shard_name = None
+        self._index = None
+        self._pid = None
+        self._stats = {"patches": 0, "bytes": 0, "write_s": 0.0, "sampling_s": 0.0, "shards": 0}
+
+    def _ensure_stream(self):
+        # post: index file open for this process (a forked child gets a stream of its own)
+        if self._index is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._mm, self._index = None, None
+        self._shard_no, self._slot = -1, self.capacity
+        name = self.stream or f"{time.strftime('%Y%m%d%H%M%S')}-{self._pid}-{next(_STREAM_SEQ):03d}"
+        self._stream_name = name
+        self._rel_root = os.path.relpath(self.root, PATCH_OUTPUT_DIR.parent)
+        ensure_dir(self.root)
+        self._index = open(self.root / f"{name}.idx", "a", newline="")
+        if self._index.tell() == 0:
+            self._index.write("patch_id,shard,slot\n")
+
+    def _next_shard(self):
+        # post: a fresh, zero-filled shard file is mapped for writing
+        if self._mm is not None:
+            self._mm.flush()
+        self._shard_no += 1
+        self._slot = 0
+        self._shard_name = f"{self._stream_name}-{self._shard_no:05d}.bin"
+        self._mm = np.memmap(self.root / self._shard_name, dtype=np.uint8, mode="w+",
+                             shape=(self.capacity,) + self.patch_shape)
+        self._stats["shards"] += 1
+
+    def batch(self) -> WriteBatch:
+        # post: a new, empty batch of this writer (one per image)
+        return WriteBatch(self)
+
+    def submit(self, path, patch_rgb: np.ndarray, batch: Optional[WriteBatch] = None) -> str:
+        # pre: patch_rgb has shape patch_shape; the stem of `path` is used as the patch_id
+        # post: patch stored; returns its location "<shard path relative to PATCH_OUTPUT_DIR.parent>#<slot>"
+
+        patch_id = Path(path).stem
+        with self._lock:
+            t0 = time.perf_counter()
+            self._ensure_stream()
+            if self._slot >= self.capacity:
+                self._next_shard()
+            slot = self._slot
+            self._mm[slot] = patch_rgb
+            self._index.write(f"{patch_id},{self._shard_name},{slot}\n")
+            self._slot += 1
+            location = f"{self._rel_root}/{self._shard_name}#{slot}"
+
+            self._stats["patches"] += 1
+            self._stats["bytes"] += int(patch_rgb.nbytes)
+            self._stats["write_s"] += time.perf_counter() - t0
+        return location
+
+    def add_sampling_time(self, seconds: float) -> None:
+        with self._lock:
+            self._stats["sampling_s"] += seconds
+
+    def flush(self) -> None:
+        # post: shard contents and index lines written so far are handed to the OS
+        with self._lock:
+            if self._mm is not None:
+                self._mm.flush()
+            if self._index is not None and self._pid == os.getpid():
+                self._index.flush()
+
+    def flush_batch(self, batch: WriteBatch) -> None:
+        # post: the batch's patches (and everything before them) are handed to the OS
+        self.flush()
+
+    def close(self) -> None:
+        # post: current shard unmapped and truncated to its used slots, index closed;
+        #       a later submit starts a new stream
+        # note: pipelines that run many times keep the writer open in between (DRPipeline.run(keep_open=True)),
+        #       so this normally happens once per worker
+        self.flush()
+        with self._lock:
+            owned = self._index is not None and self._pid == os.getpid()
+            self._mm = None
+            if owned and 0 < self._slot < self.capacity:
+                os.truncate(self.root / self._shard_name, self._slot * int(np.prod(self.patch_shape)))
+            if owned:
+                self._index.close()
+            self._index = None
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._stats)
+
+    def report(self) -> str:
+        s = self.stats()
+        return (f"[ShardWriter] patches={s['patches']}  shards={s['shards']}  MB={s['bytes'] / 1e6:.1f}  "
+                f"write={s['write_s']:.2f}s  sampling={s['sampling_s']:.2f}s")
+
+class ShardReader:
+    # brief: read-only access to a shard store, returns zero-copy views into memory-mapped shards
+
+    def __init__(self, root: Path = PATCH_SHARD_DIR, patch_shape: Tuple[int, int, int] = PATCH_SHAPE):
+        # pre: root contains .idx/.bin files written by ShardWriter
+        # post: offset index loaded; shards are mapped lazily on first access
+
+        self.root = Path(root)
+        self.patch_shape = tuple(patch_shape)
+        self._patch_bytes = int(np.prod(self.patch_shape))
+        self._maps: Dict[str, np.memmap] = {}
+        self.index: Dict[str, Tuple[str, int]] = {}
+
+        # later streams win; ordered by when their index was last written (stream names only carry
+        # the second they were opened, which can't order two processes started together)
+        for idx_path in sorted(self.root.glob("*.idx"), key=lambda p: (p.stat().st_mtime_ns, p.name)):
+            with open(idx_path, newline="") as f:
+                for row in csv.DictReader(f):
+                    self.index[row["patch_id"]] = (row["shard"], int(row["slot"]))
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, patch_id: str) -> bool:
+        return patch_id in self.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def shard(self, name: str) -> np.ndarray:
+        # post: (capacity, H, W, 3) read-only view of a whole shard file
+        mm = self._maps.get(name)
+        if mm is None:
+            path = self.root / name
+            n = os.path.getsize(path) // self._patch_bytes
+            mm = np.memmap(path, dtype=np.uint8, mode="r", shape=(n,) + self.patch_shape)
+            self._maps[name] = mm
+        return mm
+
+    def __getitem__(self, patch_id: str) -> np.ndarray:
+        # post: (H, W, 3) RGB view of the patch, no copy
+        name, slot = self.index[patch_id]
+        return self.shard(name)[slot]
+
+    def locate(self, location: str) -> np.ndarray:
+        # pre: location as returned by ShardWriter.submit ("<rel path>/<shard>#<slot>")
+        # post: (H, W, 3) RGB view of the patch, no copy
+        path, slot = location.rsplit("#", 1)
+        return self.shard(Path(path).name)[int(slot)]
+
+    def close(self) -> None:
+        # post: all mapped shards released
+        self._maps.clear()
@@ -0,0 +1,213 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: background PNG encoder/writer for extracted patches (bounded queue + writer threads)
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+from pipeline.config.settings import (PNG_COMPRESSION_LEVEL, WRITER_THREADS, WRITER_QUEUE_SIZE,
+                                      PATCH_OUTPUT_DIR, PATCH_BACKEND)
+from pipeline.utils.logger import get_logger
+
+logger = get_logger(__name__, file_logging=True)
+
+# note: cv2.imencode / cv2.cvtColor release the GIL, so a couple of threads are enough to keep
+#       PNG compression and filesystem latency off the sampling loop
+
+class WriteBatch:
+    # brief: the patches of one image, submitted through a shared writer (@see PatchWriter.batch)
+    # note: flush() waits for this batch's writes only and raises only their errors, so images in
+    #       flight on other threads (@see DRPipeline.stream_staged) neither wait for nor fail on each other
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.pending = 0
+        self.error: Optional[BaseException] = None
+
+    def submit(self, path, patch_rgb: np.ndarray) -> str:
+        return self.writer.submit(path, patch_rgb, batch=self)
+
+    def add_sampling_time(self, seconds: float) -> None:
+        self.writer.add_sampling_time(seconds)
+
+    def flush(self) -> None:
+        # post: every patch of this batch is on disk; raises if one of them failed
+        self.writer.flush_batch(self)
+
+class PatchWriter:
+    # brief: encodes and writes RGB patches as PNGs in background threads
+    # note: submit() blocks once `queue_size` patches are pending (backpressure), so memory stays
+    #       bounded even if the disk is slower than sampling. flush() waits for everything queued
+    #       so far, a WriteBatch's flush() only for its own patches; close() flushes and joins the
+    #       threads. threads start lazily on first submit, so a writer can be built in a parent
+    #       process and used after fork.
+
+    per_patch_files = True  # PatchExtractionPipe creates PATCH_OUTPUT_DIR/<image_id>/all for us
+
+    def __init__(self, n_threads: int = WRITER_THREADS, queue_size: int = WRITER_QUEUE_SIZE,
+                 compression: int = PNG_COMPRESSION_LEVEL):
+        # pre: n_threads >= 1, queue_size >= 1, compression in [0, 9]
+        # post: idle writer, no threads running yet
+
+        self.n_threads = max(1, int(n_threads))
+        self.compression = int(compression)
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._threads = []
+        self._lock = threading.Lock()
+        self._batch_done = threading.Condition(self._lock)
+        self._error: Optional[BaseException] = None
+        self._stats = {
+            "patches": 0,           # patches written
+            "bytes": 0,             # encoded PNG bytes written
+            "encode_s": 0.0,        # summed over writer threads
+            "write_s": 0.0,         # summed over writer threads
+            "backpressure_s": 0.0,  # time submit() spent blocked on a full queue
+            "sampling_s": 0.0,      # reported by the producer (PatchExtractionPipe)
+        }
+
+    def _start(self):
+        # post: writer threads are running
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.n_threads):
+                t = threading.Thread(target=self._worker, name=f"PatchWriter-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _worker(self):
+        # desc: pulls (path, rgb, batch) jobs until it sees the None sentinel
+        params = [cv2.IMWRITE_PNG_COMPRESSION, self.compression]
+        while True:
+            job = self._queue.get()
+            batch, error = None, None
+            try:
+                if job is None:
+                    return
+                path, patch_rgb, batch = job
+
+                t0 = time.perf_counter()
+                ok, buf = cv2.imencode(".png", cv2.cvtColor(patch_rgb, cv2.COLOR_RGB2BGR), params)
+                if not ok:
+                    raise IOError(f"PNG encode failed for {path}")
+                t1 = time.perf_counter()
+                with open(path, "wb") as f:
+                    f.write(buf.tobytes())
+                t2 = time.perf_counter()
+
+                with self._lock:
+                    self._stats["patches"] += 1
+                    self._stats["bytes"] += int(buf.size)
+                    self._stats["encode_s"] += t1 - t0
+                    self._stats["write_s"] += t2 - t1
+            except Exception as e:
+                logger.error(f"[PatchWriter] {e}")
+                error = e
+            finally:
+                with self._lock:
+                    if batch is not None:
+                        batch.error = batch.error or error
+                        batch.pending -= 1
+                        self._batch_done.notify_all()
+                    elif error is not None:
+                        self._error = self._error or error
+                self._queue.task_done()
+
+    def batch(self) -> WriteBatch:
+        # post: a new, empty batch of this writer (one per image)
+        return WriteBatch(self)
+
+    def submit(self, path, patch_rgb: np.ndarray, batch: Optional[WriteBatch] = None) -> str:
+        # pre: patch_rgb is an RGB uint8 patch the caller will not modify afterwards
+        # post: patch is queued for encoding + writing to `path`; returns the path relative to PATCH_OUTPUT_DIR.parent
+        # desc: blocks while the queue is full; a failed write is reported by batch.flush() (flush() without a batch)
+
+        self._start()
+        if batch is not None:
+            with self._lock:
+                batch.pending += 1
+        t0 = time.perf_counter()
+        self._queue.put((str(path), patch_rgb, batch))
+        waited = time.perf_counter() - t0
+        if waited > 1e-3:
+            with self._lock:
+                self._stats["backpressure_s"] += waited
+        return os.path.relpath(path, PATCH_OUTPUT_DIR.parent)
+
+    def add_sampling_time(self, seconds: float) -> None:
+        # desc: lets the producer report its own time so stats() can compare the two
+        with self._lock:
+            self._stats["sampling_s"] += seconds
+
+    def flush_batch(self, batch: WriteBatch) -> None:
+        # post: every patch of `batch` is on disk
+        # desc: raises if one of its writes failed, so metadata never points at a missing file
+        with self._lock:
+            while batch.pending:
+                self._batch_done.wait()
+            error, batch.error = batch.error, None
+        if error is not None:
+            raise RuntimeError(f"[PatchWriter] failed to write patch: {error}") from error
+
+    def flush(self) -> None:
+        # post: every patch submitted so far is on disk
+        # desc: raises if any write submitted without a batch failed (batches report their own)
+
+        if self._threads:
+            self._queue.join()
+        with self._lock:
+            error, self._error = self._error, None
+        if error is not None:
+            raise RuntimeError(f"[PatchWriter] failed to write patch: {error}") from error
+
+    def close(self) -> None:
+        # post: queue drained, threads joined; the writer can be reused (threads restart on submit)
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                threads, self._threads = self._threads, []
+            for _ in threads:
+                self._queue.put(None)
+            for t in threads:
+                t.join()
+
+    def stats(self) -> Dict[str, float]:
+        # post: copy of the running counters
+        with self._lock:
+            return dict(self._stats)
+
+    def report(self) -> str:
+        # post: one-line summary of encode/write time vs. sampling time
+        s = self.stats()
+        return (f"[PatchWriter] patches={s['patches']}  MB={s['bytes'] / 1e6:.1f}  "
+                f"encode={s['encode_s']:.2f}s  write={s['write_s']:.2f}s  "
+                f"sampling={s['sampling_s']:.2f}s  backpressure={s['backpressure_s']:.2f}s  "
+                f"threads={self.n_threads}")
+
+def make_patch_writer(backend: str = PATCH_BACKEND):
+    # pre: backend is "png" or "shard"
+    # post: a writer with the PatchWriter interface for the requested output backend
+    # desc: "png" -> one PNG per patch under PATCH_OUTPUT_DIR/<image_id>/all (background threads)
+    #       "shard" -> raw patches appended to memory-mappable shard files (see patch_store.py)
+
+    if backend == "png":
+        return PatchWriter()
+    if backend == "shard":
+        from pipeline.utils.patch_store import ShardWriter
+        return ShardWriter()
+    raise ValueError(f"unknown patch backend: {backend!r} (expected 'png' or 'shard')")
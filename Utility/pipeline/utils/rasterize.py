@@ -0,0 +1,164 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: rasterizes XML lesion annotations (circle / ellipse / polygon regions) into per-class mask stacks
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from pipeline.config.settings import LESION_LABELS, XML_LESION_MAP
+
+# note: regions are drawn with cv2's own primitives: circles with cv2.circle, ellipses with
+#       cv2.ellipse (scaled center / axes rounded to whole pixels, cv2's fast integer paths),
+#       polygons with cv2.fillPoly in fixed point (SHIFT fraction bits), so scaled vertices aren't
+#       rounded to whole pixels. only a rotated ellipse under a non-uniform scale (source and target
+#       aspect differ) is no cv2 ellipse any more; it is sampled into an outline (@see
+#       ellipse_outlines) and filled as a polygon.
+#       every region gets its own call: with several polygons in one call fillPoly fills
+#       even-odd, so overlapping markings of a class (common, e.g. a dot inside a haemorrhage
+#       outline) would cancel out.
+#       region_outlines() turns regions into outlines for the geometry code (@see spatial_index.py)
+
+SHIFT = 4               # 1/16 px vertex precision
+MAX_CHORD_ERROR = 0.25  # px, how far a sampled circle / ellipse outline may cut inside the curve
+
+def ellipse_outlines(cx, cy, rx, ry, angle) -> np.ndarray:
+    # pre: equal-length float arrays (centers, semi-axes, rotation in degrees as in the XML / cv2.ellipse)
+    # post: (n, k, 2) float64 outline vertices, the same k for every ellipse of the batch
+    cx, cy, rx, ry, angle = (np.asarray(v, dtype=np.float64) for v in (cx, cy, rx, ry, angle))
+    r_max = max(float(np.max(rx, initial=1.0)), float(np.max(ry, initial=1.0)))
+    k = int(np.clip(np.ceil(np.pi / np.arccos(1.0 - min(MAX_CHORD_ERROR / r_max, 1.0))), 8, 720))
+
+    t = np.linspace(0.0, 2.0 * np.pi, k, endpoint=False)
+    theta = np.deg2rad(angle)[:, None]
+    a = rx[:, None] * np.cos(t)
+    b = ry[:, None] * np.sin(t)
+    xs = cx[:, None] + a * np.cos(theta) - b * np.sin(theta)
+    ys = cy[:, None] + a * np.sin(theta) + b * np.cos(theta)
+    return np.stack([xs, ys], axis=-1)
+
+def region_outlines(records: Iterable[Dict]) -> List[np.ndarray]:
+    # pre: records are lesion records (@see LesionXMLParser.iter_markings)
+    # post: one (k, 2) float64 outline per record whose region has an area, in source pixels
+    # desc: circles and ellipses are collected and sampled in one batch, polygons are taken as is
+    outlines: List[np.ndarray] = []
+    ellipses: List[Tuple[float, float, float, float, float]] = []
+
+    for r in records:
+        region = r["region_type"]
+        if region == "polygonregion":
+            if len(r["polygon_points"]) >= 3:
+                outlines.append(np.asarray(r["polygon_points"], dtype=np.float64))
+        elif region == "circleregion":
+            if r["radius"]:
+                ellipses.append((r["x"], r["y"], r["radius"], r["radius"], 0.0))
+        elif region == "ellipseregion":
+            if r["radius_x"] and r["radius_y"]:
+                ellipses.append((r["x"], r["y"], r["radius_x"], r["radius_y"], r["angle"] or 0.0))
+
+    if ellipses:
+        outlines.extend(ellipse_outlines(*np.array(ellipses, dtype=np.float64).T))
+    return outlines
+
+def draw_regions(plane: np.ndarray, records: Iterable[Dict], scale: Tuple[float, float] = (1.0, 1.0),
+                 bounds: bool = False) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    # pre: plane is a uint8 HxW array, records are lesion records, scale * source pixel = plane pixel
+    # post: the pixels inside every region are set to 1 (overlapping regions stay filled);
+    #       with bounds=True returns the (x, y) pixel bounds (lo, hi) of all regions (None if nothing
+    #       was drawn), otherwise None
+    # desc: circles / ellipses are drawn as they come; polygon outlines are collected, scaled and
+    #       converted to fixed point in one array, then filled one per call
+    sx, sy = scale
+    uniform = sx == sy
+    outlines: List[np.ndarray] = []
+    lo, hi = [], []
+
+    for r in records:
+        region = r["region_type"]
+        if region == "polygonregion":
+            if len(r["polygon_points"]) >= 3:
+                outlines.append(r["polygon_points"])
+            continue
+        if region == "circleregion":
+            rx = ry = r["radius"]
+            angle = 0.0
+        elif region == "ellipseregion":
+            rx, ry, angle = r["radius_x"], r["radius_y"], r["angle"] or 0.0
+        else:
+            continue
+        if not rx or not ry:
+            continue
+        if not uniform and angle % 180.0:
+            outlines.append(ellipse_outlines([r["x"]], [r["y"]], [rx], [ry], [angle])[0])
+            continue
+
+        center = (round(r["x"] * sx), round(r["y"] * sy))
+        ax, ay = round(rx * sx), round(ry * sy)
+        if ax == ay:
+            cv2.circle(plane, center, ax, 1, -1)
+        else:
+            cv2.ellipse(plane, center, (ax, ay), angle, 0, 360, 1, -1)
+        if bounds:
+            reach = max(ax, ay)
+            lo.append((center[0] - reach, center[1] - reach))
+            hi.append((center[0] + reach, center[1] + reach))
+
+    if outlines:
+        ends = np.cumsum([len(o) for o in outlines])
+        points = np.round(np.concatenate(outlines) * (sx * (1 << SHIFT), sy * (1 << SHIFT))).astype(np.int32)
+        start = 0
+        for end in ends.tolist():
+            cv2.fillPoly(plane, [points[start:end]], 1, cv2.LINE_8, SHIFT)
+            start = end
+        if bounds:
+            lo.append(points.min(axis=0) >> SHIFT)
+            hi.append(points.max(axis=0) >> SHIFT)
+
+    if not lo:
+        return None
+    return np.min(lo, axis=0), np.max(hi, axis=0)
+
+def rasterize_markings(records: Iterable[Dict], shape: Tuple[int, int], labels: Sequence[str] = LESION_LABELS,
+                       lesion_map: Dict[str, str] = XML_LESION_MAP, source_shape: Optional[Tuple[int, int]] = None,
+                       min_experts: int = 1, packed: bool = False) -> np.ndarray:
+    # pre: records are the lesion records of one image (any number of annotation files),
+    #      shape is the (h, w) of the masks, source_shape the (h, w) the annotations were drawn on
+    #      (None -> same as shape)
+    # post: (len(labels), h, w) uint8 0/1 stack, plane k = labels[k]; with packed=True bit-packed
+    #       along x -> (len(labels), h, ceil(w / 8)), same as np.packbits(stack, axis=2)
+    # desc: fills the regions of every (annotation file, class) group; with min_experts > 1 the files
+    #       are counted per pixel and a pixel is lesion when at least min_experts mark it.
+    #       marking types lesion_map doesn't list are skipped
+
+    h, w = shape
+    scale = (1.0, 1.0) if source_shape is None else (w / source_shape[1], h / source_shape[0])
+    plane_of = {lesion: k for k, lesion in enumerate(labels)}
+
+    groups: Dict[Tuple[str, int], List[Dict]] = {}
+    for r in records:
+        k = plane_of.get(lesion_map.get(r["type"]))
+        if k is not None:
+            groups.setdefault((r["xml_file"], k), []).append(r)
+
+    stack = np.zeros((len(labels), h, w), dtype=np.uint8)
+    if min_experts <= 1:
+        # union: every file draws straight into the class plane
+        for (_, k), group in groups.items():
+            draw_regions(stack[k], group, scale)
+        return np.packbits(stack, axis=2) if packed else stack
+
+    # vote: each file is drawn into a scratch plane, only its bounding box is added up and cleared again
+    plane = np.zeros((h, w), dtype=np.uint8)
+    for (_, k), group in groups.items():
+        box = draw_regions(plane, group, scale, bounds=True)
+        if box is None:
+            continue
+        (x0, y0), (x1, y1) = np.maximum(box[0] - 1, 0), box[1] + 2
+        stack[k, y0:y1, x0:x1] += plane[y0:y1, x0:x1]
+        plane[y0:y1, x0:x1] = 0
+
+    stack = (stack >= min_experts).view(np.uint8)
+    return np.packbits(stack, axis=2) if packed else stack
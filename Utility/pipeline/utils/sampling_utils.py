@@ -0,0 +1,64 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: batched samplers for patch centers (healthy sampling without per-draw full-image scans)
+
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from pipeline.config.settings import HEALTHY_SAMPLE_BATCH
+from pipeline.utils.image_utils import DarknessTable
+
+class HealthySampler:
+    # brief: draws healthy patch centers uniformly from an "allowed" mask
+    # note: the flat index of allowed pixels is built once per image; every draw after that is a
+    #       batch of random offsets into it, so the sampling loop allocates once per batch instead
+    #       of running np.where over the full image for every single candidate.
+    #       if a DarknessTable is given, its valid-center map is folded into the index up front, so
+    #       black / out-of-FOV centers can never be drawn and nothing is cropped just to be rejected.
+
+    def __init__(self, allowed: np.ndarray, darkness: Optional[DarknessTable] = None,
+                 batch_size: int = HEALTHY_SAMPLE_BATCH, rng: Optional[np.random.RandomState] = None):
+        # pre: allowed is a binary HxW mask, darkness (optional) was built from the same image
+        #      rng is an optional RandomState (None -> the global numpy RNG)
+        # post: sampler ready to draw; self.draws counts candidates drawn so far (whole batches),
+        #       self.tries the ones candidates() actually handed out
+
+        valid = allowed > 0
+        if darkness is not None:
+            valid &= darkness.valid_center_map()
+
+        self.width = allowed.shape[1]
+        self.flat = np.flatnonzero(valid.ravel())
+        self.batch_size = max(1, int(batch_size))
+        self.draws = 0
+        self.tries = 0
+        self.rng = np.random if rng is None else rng
+
+    def __len__(self) -> int:
+        return int(self.flat.size)
+
+    def draw(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        # pre: n >= 0, len(self) > 0
+        # post: (xs, ys) int arrays of n uniformly drawn valid pixels (with replacement)
+        # desc: draws from self.rng, so seeding it (or the global RNG) keeps runs reproducible
+
+        picks = self.flat[self.rng.randint(0, self.flat.size, size=n)]
+        ys, xs = np.divmod(picks, self.width)
+        return xs, ys
+
+    def candidates(self, max_draws: int) -> Iterator[Tuple[int, int]]:
+        # pre: max_draws is the total draw budget (same meaning as the old per-point max_tries)
+        # post: yields (x, y) centers until the budget is spent
+        # desc: the caller stops iterating once it has enough; self.tries holds the candidates it
+        #       took, self.draws rounds that up to the batches drawn
+
+        while self.draws < max_draws and self.flat.size:
+            n = min(self.batch_size, max_draws - self.draws)
+            xs, ys = self.draw(n)
+            self.draws += n
+            for x, y in zip(xs, ys):
+                self.tries += 1
+                yield int(x), int(y)
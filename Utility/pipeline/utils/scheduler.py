@@ -0,0 +1,66 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: cost-aware, guided (shrinking) chunk scheduling for the parallel runner
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+import os
+from typing import Dict, List, Optional, Sequence
+
+from pipeline.config.settings import SCHED_BASE_COST, SCHED_CHUNK_FACTOR
+from pipeline.pipes.xml_masks import mask_source_files
+from pipeline.utils.dir_index import DirectoryIndex
+
+# note: the work per image is dominated by how many lesion components it has (one lesion patch per
+#       component + 1.5x as many healthy ones). the size of the files the masks come from (mask
+#       PNGs or XML annotations, whichever MASK_SOURCE is active) grows with the number/extent of
+#       lesions and is known from a stat() alone, without decoding anything, so it is used as the
+#       cost proxy. SCHED_BASE_COST covers decode + fixed per-image work.
+
+def estimate_image_cost(item: Dict, index: Optional[DirectoryIndex] = None) -> float:
+    # pre: item has "image_path"; index is an optional DirectoryIndex of the mask source folders
+    # post: relative cost estimate (>= SCHED_BASE_COST)
+    # desc: base cost + total bytes of the image's mask source files (@see mask_source_files,
+    #       the same files its cache key hashes); missing files cost nothing
+
+    cost = float(SCHED_BASE_COST)
+    for path in mask_source_files(item["image_path"], index):
+        try:
+            cost += os.path.getsize(path)
+        except OSError:
+            pass
+    return cost
+
+def guided_chunks(costs: Sequence[float], num_workers: int,
+                  factor: float = SCHED_CHUNK_FACTOR, min_chunk: int = 1) -> List[List[int]]:
+    # pre: costs[i] is the estimated cost of item i, num_workers >= 1
+    # post: list of chunks (lists of item indices) covering every item exactly once
+    # desc: guided self-scheduling on cost instead of count -> items are taken most expensive
+    #       first (so a lesion-dense image can't be the last one to start), and every chunk
+    #       targets remaining_cost / (factor * num_workers), so chunks are big early on (low
+    #       dispatch overhead) and shrink to single images toward the end (no stragglers).
+
+    order = sorted(range(len(costs)), key=lambda i: costs[i], reverse=True)
+    remaining = float(sum(costs))
+    chunks: List[List[int]] = []
+    chunk: List[int] = []
+    chunk_cost = 0.0
+    target = remaining / (factor * max(1, num_workers))
+
+    for i in order:
+        chunk.append(i)
+        chunk_cost += costs[i]
+        if len(chunk) >= min_chunk and chunk_cost >= target:
+            chunks.append(chunk)
+            remaining -= chunk_cost
+            chunk, chunk_cost = [], 0.0
+            target = remaining / (factor * max(1, num_workers))
+    if chunk:
+        chunks.append(chunk)
+    return chunks
@@ -0,0 +1,111 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: ring of equally sized shared-memory slots for handing decoded images between processes
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+import os
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+# note: one SharedMemory block is cut into n_slots fixed-size slots. two queues carry only slot
+#       numbers + small metadata: `free` (slots a producer may fill) and `ready` (filled slots
+#       waiting for a consumer). the pixels themselves are written once by the producer and read
+#       in place by the consumer, they never cross a pickle boundary.
+#       the ring is created (and unlinked) by one owner process; producers/consumers receive the
+#       ring as a Process argument and attach to the block by name on first use.
+
+class ShmRing:
+    # brief: fixed pool of shared-memory slots + free/ready queues (producer -> consumer handoff)
+
+    def __init__(self, n_slots: int, slot_shape: Tuple[int, ...], dtype=np.uint8, ctx=None):
+        # pre: n_slots >= 1, slot_shape is the largest array a slot has to hold
+        # post: shared block allocated, every slot is free; the creating process owns the block
+        if n_slots < 1:
+            raise ValueError(f"[ShmRing] n_slots must be >= 1, got {n_slots}")
+        ctx = ctx or mp.get_context()
+
+        self.n_slots = int(n_slots)
+        self.slot_shape = tuple(int(s) for s in slot_shape)
+        self.dtype = np.dtype(dtype)
+        self.slot_bytes = int(np.prod(self.slot_shape)) * self.dtype.itemsize
+
+        self._shm = shared_memory.SharedMemory(create=True, size=self.n_slots * self.slot_bytes)
+        self.name = self._shm.name
+        self._owner_pid = os.getpid()  # forked children inherit the handle, but never unlink it
+
+        self.free = ctx.Queue()
+        self.ready = ctx.Queue()
+        for i in range(self.n_slots):
+            self.free.put(i)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # desc: only the block name travels to child processes, they attach lazily (@see _block)
+        state = self.__dict__.copy()
+        state["_shm"] = None
+        return state
+
+    def _block(self) -> shared_memory.SharedMemory:
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(name=self.name)
+        return self._shm
+
+    def slot(self, i: int, shape: Optional[Tuple[int, ...]] = None) -> np.ndarray:
+        # pre: 0 <= i < n_slots, prod(shape) <= prod(slot_shape)
+        # post: contiguous writable view of slot i with the given shape (default slot_shape), no copy
+        shape = self.slot_shape if shape is None else tuple(int(s) for s in shape)
+        nbytes = int(np.prod(shape)) * self.dtype.itemsize
+        if nbytes > self.slot_bytes:
+            raise ValueError(f"[ShmRing] array of shape {shape} doesn't fit a slot of shape {self.slot_shape}")
+        offset = i * self.slot_bytes
+        return np.ndarray(shape, dtype=self.dtype, buffer=self._block().buf, offset=offset)
+
+    # ----- producer side -----
+
+    def acquire(self, timeout: Optional[float] = None) -> int:
+        # post: number of a free slot, now owned by the caller (blocks while every slot is in use)
+        return self.free.get(timeout=timeout)
+
+    def publish(self, i: int, meta: Dict[str, Any]) -> None:
+        # pre: slot i was acquired and filled; meta is small and picklable (shape, ids, ...)
+        self.ready.put((i, meta))
+
+    def finish(self, n_consumers: int) -> None:
+        # post: one end marker per consumer, receive() returns None once it reaches it
+        for _ in range(n_consumers):
+            self.ready.put(None)
+
+    # ----- consumer side -----
+
+    def receive(self, timeout: Optional[float] = None) -> Optional[Tuple[int, Dict[str, Any]]]:
+        # post: (slot, meta) of the next filled slot, or None when the producers are done
+        return self.ready.get(timeout=timeout)
+
+    def release(self, i: int) -> None:
+        # pre: no view of slot i is used anymore by the caller
+        # post: slot i can be refilled by a producer
+        self.free.put(i)
+
+    def close(self) -> None:
+        # post: this process detached from the block; the owner also frees it
+        # note: views returned by slot() must be gone before this is called
+        if self._shm is not None:
+            self._shm.close()
+            if os.getpid() == self._owner_pid:
+                self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self) -> "ShmRing":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,238 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: per-image uniform grid over the lesions (mask components or XML annotations) for batch window queries
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from pipeline.config.settings import LESION_LABELS, PATCH_SIZE, XML_LESION_MAP
+from pipeline.utils.rasterize import region_outlines
+
+# note: the image is cut into cell x cell squares and every lesion is listed in each cell its
+#       bounding box touches, CSR-style like ComponentPixelIndex: members[offsets[c]:offsets[c + 1]]
+#       are the lesions of cell c. a query expands every window to the cells it covers and gathers
+#       their member ranges in one go. a (window, lesion) pair is found in every cell both touch, so
+#       it is only kept in the cell holding the top-left corner of their overlap (no sort / unique).
+#       with cell ~ window size a window touches <= 4 cells -> cost O(windows + candidate pairs),
+#       no python loop over windows or lesions.
+
+def _expand_ranges(starts: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # pre: starts, counts are equal-length int arrays, counts >= 0
+    # post: (owner, values) -> range i contributes counts[i] entries starts[i], starts[i] + 1, ... owned by i
+    counts = np.asarray(counts, dtype=np.int64)
+    owner = np.repeat(np.arange(len(counts)), counts)
+    first = np.cumsum(counts) - counts
+    values = np.arange(int(counts.sum()), dtype=np.int64) - np.repeat(first - np.asarray(starts, dtype=np.int64), counts)
+    return owner, values
+
+def _shoelace(outlines: Sequence[np.ndarray]) -> np.ndarray:
+    # post: (n,) area of every closed outline, all at once over the concatenated vertices
+    if not len(outlines):
+        return np.zeros(0, dtype=np.float64)
+    lengths = np.array([len(o) for o in outlines])
+    starts = np.cumsum(lengths) - lengths
+    pts = np.concatenate(outlines)
+    nxt = np.arange(len(pts)) + 1
+    nxt[starts + lengths - 1] = starts  # last vertex of an outline connects back to its first
+    cross = pts[:, 0] * pts[nxt, 1] - pts[nxt, 0] * pts[:, 1]
+    return 0.5 * np.abs(np.add.reduceat(cross, starts))
+
+@dataclass
+class LesionIndex:
+    # brief: lesion bounding boxes + classes of one image, bucketed into a uniform grid
+
+    labels: List[str]
+    boxes: np.ndarray       # (n, 4) float64 (x0, y0, x1, y1), half-open
+    classes: np.ndarray     # (n,) int, index into labels
+    areas: np.ndarray       # (n,) float64 area of each lesion (pixels / polygon area)
+    cell: int
+    grid: Tuple[int, int]   # (nx, ny) cells
+    offsets: np.ndarray     # (nx * ny + 1,) int64
+    members: np.ndarray     # lesion ids, grouped by cell
+    outlines: Optional[List[np.ndarray]] = None                  # XML source: (k, 2) outline per lesion
+    pixels: Optional[Tuple[int, np.ndarray, np.ndarray]] = None  # mask source: (width, offsets, flat pixel ids)
+    _polygons: Optional[np.ndarray] = field(default=None, repr=False, compare=False)  # shapely polygons, built on first use
+
+    @classmethod
+    def build(cls, boxes: np.ndarray, classes: np.ndarray, areas: np.ndarray, shape: Tuple[int, int],
+              labels: Sequence[str] = LESION_LABELS, cell: int = PATCH_SIZE, **geometry) -> "LesionIndex":
+        # pre: boxes (n, 4) (x0, y0, x1, y1), shape = (h, w) of the image, cell >= 1
+        # post: index over the boxes; geometry (outlines= / pixels=) enables exact overlap areas
+        if cell < 1:
+            raise ValueError(f"[LesionIndex] cell must be >= 1, got {cell}")
+        h, w = shape
+        grid = (max(1, -(-w // cell)), max(1, -(-h // cell)))
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+        index = cls(list(labels), boxes, np.asarray(classes, dtype=np.int64), np.asarray(areas, dtype=np.float64),
+                    int(cell), grid, np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64), **geometry)
+        owner, cells = index._cells(boxes)
+        order = np.argsort(cells, kind="stable")
+        index.members = owner[order]
+        index.offsets = np.zeros(grid[0] * grid[1] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=grid[0] * grid[1]), out=index.offsets[1:])
+        return index
+
+    @classmethod
+    def from_components(cls, components: Dict[str, object], shape: Tuple[int, int],
+                        labels: Sequence[str] = LESION_LABELS, cell: int = PATCH_SIZE) -> "LesionIndex":
+        # pre: components maps lesion type -> ComponentPixelIndex (@see LesionComponentsPipe)
+        # post: one lesion per connected component; exact areas are pixel counts
+        boxes, classes, areas, pixels, pixel_counts = [], [], [], [], []
+        for k, lesion in enumerate(labels):
+            comp = components.get(lesion)
+            if comp is None or not len(comp):
+                continue
+            x, y, bw, bh = (comp.bboxes[:, i].astype(np.float64) for i in range(4))
+            boxes.append(np.stack([x, y, x + bw, y + bh], axis=1))
+            classes.append(np.full(len(comp), k))
+            areas.append(comp.areas)
+            pixels.append(comp.pixels)
+            pixel_counts.append(comp.areas)
+
+        if not boxes:
+            return cls.build(np.zeros((0, 4)), [], [], shape, labels, cell,
+                             pixels=(shape[1], np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32)))
+        pixel_offsets = np.zeros(sum(len(a) for a in pixel_counts) + 1, dtype=np.int64)
+        np.cumsum(np.concatenate(pixel_counts), out=pixel_offsets[1:])
+        return cls.build(np.concatenate(boxes), np.concatenate(classes), np.concatenate(areas), shape, labels, cell,
+                         pixels=(shape[1], pixel_offsets, np.concatenate(pixels)))
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict], shape: Tuple[int, int], labels: Sequence[str] = LESION_LABELS,
+                     lesion_map: Dict[str, str] = XML_LESION_MAP, source_shape: Optional[Tuple[int, int]] = None,
+                     cell: int = PATCH_SIZE) -> "LesionIndex":
+        # pre: records are lesion records of one image (@see LesionXMLParser.iter_markings), shape = (h, w)
+        #      of the image the windows refer to, source_shape the one the annotations were drawn on
+        # post: one lesion per marking with an area (types lesion_map doesn't list are skipped);
+        #       exact areas are polygon intersections (circles / ellipses as sampled outlines)
+        h, w = shape
+        scale = np.ones(2) if source_shape is None else np.array([w / source_shape[1], h / source_shape[0]])
+        plane_of = {lesion: k for k, lesion in enumerate(labels)}
+
+        grouped: Dict[int, List[Dict]] = {}
+        for r in records:
+            k = plane_of.get(lesion_map.get(r["type"]))
+            if k is not None:
+                grouped.setdefault(k, []).append(r)
+
+        outlines, classes = [], []
+        for k, group in sorted(grouped.items()):
+            found = [o * scale for o in region_outlines(group)]
+            outlines.extend(found)
+            classes.extend([k] * len(found))
+
+        boxes = np.array([np.concatenate([o.min(axis=0), o.max(axis=0)]) for o in outlines]).reshape(-1, 4)
+        return cls.build(boxes, classes, _shoelace(outlines), shape, labels, cell, outlines=outlines)
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def _cell_range(self, x0, y0, x1, y1) -> Tuple[np.ndarray, ...]:
+        # post: inclusive (cx0, cy0, cx1, cy1) cell ranges of half-open boxes, clipped to the grid
+        nx, ny = self.grid
+        c = self.cell
+        cx0 = np.clip(np.floor_divide(x0, c), 0, nx - 1).astype(np.int64)
+        cy0 = np.clip(np.floor_divide(y0, c), 0, ny - 1).astype(np.int64)
+        cx1 = np.maximum(np.clip(np.ceil(np.asarray(x1) / c) - 1, 0, nx - 1).astype(np.int64), cx0)
+        cy1 = np.maximum(np.clip(np.ceil(np.asarray(y1) / c) - 1, 0, ny - 1).astype(np.int64), cy0)
+        return cx0, cy0, cx1, cy1
+
+    def _cells(self, boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # post: (owner, cell) for every (box, grid cell it touches) pair
+        cx0, cy0, cx1, cy1 = self._cell_range(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3])
+        span_x = cx1 - cx0 + 1
+        owner, k = _expand_ranges(np.zeros(len(boxes), dtype=np.int64), span_x * (cy1 - cy0 + 1))
+        cx = cx0[owner] + k % span_x[owner]
+        cy = cy0[owner] + k // span_x[owner]
+        return owner, cy * self.grid[0] + cx
+
+    def _shapely_polygons(self) -> np.ndarray:
+        # post: shapely polygon per outline, built once for all outlines (flat vertices + ring ids);
+        #       self-crossing annotation polygons are repaired (make_valid) so intersection() works on them
+        import shapely  # only the exact path on annotations needs it
+        if self._polygons is None:
+            ring_ids = np.repeat(np.arange(len(self.outlines)), [len(o) for o in self.outlines])
+            rings = shapely.linearrings(np.concatenate(self.outlines), indices=ring_ids)
+            self._polygons = shapely.make_valid(shapely.polygons(rings))
+        return self._polygons
+
+    def query(self, x0, y0, x1, y1) -> Tuple[np.ndarray, np.ndarray]:
+        # pre: window bounds (arrays of equal length), [x0, x1) x [y0, y1) in image pixels
+        # post: (windows, lesions) index pairs of every window / lesion whose boxes overlap with a
+        #       positive area, grouped by window (ascending)
+        windows = np.stack([np.asarray(v, dtype=np.float64).ravel() for v in (x0, y0, x1, y1)], axis=1)
+        if not len(self) or not len(windows):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        owner, cells = self._cells(windows)
+        win, pos = _expand_ranges(self.offsets[cells], self.offsets[cells + 1] - self.offsets[cells])
+        cells, win = cells[win], owner[win]
+        les = self.members[pos]
+
+        a, b = windows[win], self.boxes[les]
+        ox0, oy0 = np.maximum(a[:, 0], b[:, 0]), np.maximum(a[:, 1], b[:, 1])
+        ox1, oy1 = np.minimum(a[:, 2], b[:, 2]), np.minimum(a[:, 3], b[:, 3])
+        rx, ry, _, _ = self._cell_range(ox0, oy0, ox1, oy1)
+        keep = (ox1 > ox0) & (oy1 > oy0) & (ry * self.grid[0] + rx == cells)  # counted in one cell only
+        return win[keep], les[keep]
+
+    def overlap_areas(self, windows: np.ndarray, lesions: np.ndarray, x0, y0, x1, y1,
+                      exact: bool = False) -> np.ndarray:
+        # pre: (windows, lesions) pairs from query() with the same window bounds
+        # post: (n_pairs,) float64 area of each lesion inside its window; bounding-box overlap by
+        #       default (an upper bound), exact=True -> pixel counts (mask components) or polygon
+        #       intersection areas (XML annotations, needs shapely >= 2)
+        x0, y0, x1, y1 = (np.asarray(v, dtype=np.float64).ravel()[windows] for v in (x0, y0, x1, y1))
+        b = self.boxes[lesions]
+        ox0, oy0 = np.maximum(x0, b[:, 0]), np.maximum(y0, b[:, 1])
+        ox1, oy1 = np.minimum(x1, b[:, 2]), np.minimum(y1, b[:, 3])
+        bbox = np.clip(ox1 - ox0, 0, None) * np.clip(oy1 - oy0, 0, None)
+        if not exact or not len(lesions):
+            return bbox
+
+        if self.pixels is None and self.outlines is None:
+            raise ValueError("[LesionIndex] exact areas need lesion outlines or pixels")
+
+        # a lesion fully inside its window counts whole, only the others are intersected
+        inside = (b[:, 0] >= x0) & (b[:, 1] >= y0) & (b[:, 2] <= x1) & (b[:, 3] <= y1)
+        part = np.flatnonzero(~inside)
+        lp = lesions[part]
+
+        if self.pixels is not None:
+            out = np.where(inside, self.areas[lesions], 0.0)
+            width, pixel_offsets, pixels = self.pixels
+            owner, pos = _expand_ranges(pixel_offsets[lp], pixel_offsets[lp + 1] - pixel_offsets[lp])
+            py, px = np.divmod(pixels[pos].astype(np.int64), width)
+            hit = (px >= x0[part][owner]) & (px < x1[part][owner]) & (py >= y0[part][owner]) & (py < y1[part][owner])
+            out[part] = np.bincount(owner, weights=hit, minlength=len(part))
+            return out
+
+        import shapely  # only the exact path on annotations needs it
+        polygons = self._shapely_polygons()
+        out = np.where(inside, shapely.area(polygons)[lesions], 0.0)  # repaired area, not the shoelace one
+        windows = shapely.box(x0[part], y0[part], x1[part], y1[part])
+        out[part] = shapely.area(shapely.intersection(polygons[lp], windows))
+        return out
+
+    def window_areas(self, x0, y0, x1, y1, exact: bool = False) -> np.ndarray:
+        # pre: window bounds (arrays of equal length)
+        # post: (n_windows, len(labels)) float64 lesion area per class inside every window
+        # note: summed per lesion -> lesions of one class that overlap each other are counted twice
+        #       (a LabelCube counts mask pixels once); use it for per-lesion / area based labelling
+        n = np.asarray(x0).size
+        windows, lesions = self.query(x0, y0, x1, y1)
+        areas = self.overlap_areas(windows, lesions, x0, y0, x1, y1, exact=exact)
+        out = np.zeros((n, len(self.labels)), dtype=np.float64)
+        np.add.at(out, (windows, self.classes[lesions]), areas)
+        return out
@@ -0,0 +1,221 @@
+# Jakob Balkovec
+# DR-Pipeline
+#   Sun Oct 18th 2026
+
+# brief: content-addressed cache for intermediate pipe outputs (compressed .npz under CACHE_DIR, LRU byte budget)
+
+# == sys path ==
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# == sys path ==
+
+import os
+import dataclasses
+import hashlib
+import importlib
+import json
+import threading
+import zipfile
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from pipeline.config import settings
+from pipeline.config.settings import CACHE_DIR, CACHE_MAX_BYTES, CACHE_VERSION, STAGE_CACHE, LOG_ALL
+from pipeline.utils.io_utils import ensure_dir
+from pipeline.utils.logger import get_logger
+
+logger = get_logger(__name__, file_logging=True)
+
+# layout:
+#   CACHE_DIR/stages/<key[:2]>/<key>.npz   -> one entry = every key a pipe provides for one image
+#
+# note: key = sha1(pipe class + its cache_settings values + CACHE_VERSION + content hash of its
+#       cache_files), so an entry is only reused when the inputs and everything that shapes the
+#       output are identical. supported values: ndarrays, scalars, None, dicts and dataclasses
+#       of those (e.g. masks, ComponentPixelIndex). a hit touches the file's mtime, eviction
+#       removes the oldest mtimes first.
+
+_MISSING = b"<missing>"
+
+# brief: per-process memo of file digests, keyed by (path, size, mtime) so edits are picked up
+_DIGESTS: Dict[Tuple[str, int, int], bytes] = {}
+
+def file_digest(path) -> bytes:
+    # pre: path is a file path (may not exist)
+    # post: sha1 digest of the file contents, or a fixed marker if the file doesn't exist
+    try:
+        st = os.stat(path)
+    except OSError:
+        return _MISSING
+    memo = (str(path), st.st_size, st.st_mtime_ns)
+    digest = _DIGESTS.get(memo)
+    if digest is None:
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        digest = _DIGESTS[memo] = h.digest()
+    return digest
+
+def _encode(value, arrays: Dict[str, np.ndarray]):
+    # post: JSON-able description of value; its arrays are added to `arrays` under fresh names
+    if value is None:
+        return {"t": "none"}
+    if isinstance(value, np.ndarray):
+        name = f"a{len(arrays)}"
+        arrays[name] = value
+        return {"t": "array", "a": name}
+    if isinstance(value, (bool, int, float, str, np.integer, np.floating)):
+        return {"t": "scalar", "v": value.item() if isinstance(value, np.generic) else value}
+    if isinstance(value, dict):
+        return {"t": "dict", "items": {str(k): _encode(v, arrays) for k, v in value.items()}}
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        cls = type(value)
+        return {"t": "dataclass", "cls": f"{cls.__module__}:{cls.__qualname__}",
+                "fields": {f.name: _encode(getattr(value, f.name), arrays) for f in dataclasses.fields(value)}}
+    raise TypeError(f"[StageCache] can't cache values of type {type(value).__name__}")
+
+def _decode(desc, arrays):
+    # post: value rebuilt from _encode's description
+    t = desc["t"]
+    if t == "none":
+        return None
+    if t == "array":
+        return arrays[desc["a"]]
+    if t == "scalar":
+        return desc["v"]
+    if t == "dict":
+        return {k: _decode(v, arrays) for k, v in desc["items"].items()}
+    module, qualname = desc["cls"].split(":")
+    cls = importlib.import_module(module)
+    for part in qualname.split("."):
+        cls = getattr(cls, part)
+    return cls(**{k: _decode(v, arrays) for k, v in desc["fields"].items()})
+
+class StageCache:
+    # brief: key -> dict of pipe outputs, stored as one compressed .npz per key
+
+    def __init__(self, root: Path = CACHE_DIR / "stages", max_bytes: int = CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None  # bytes on disk, scanned lazily
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.npz"
+
+    def get(self, key: str) -> Optional[Dict]:
+        # post: the outputs stored under key, or None on a miss (or an unreadable entry)
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+            os.utime(path)  # LRU: mark as recently used
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            self.misses += 1
+            return None
+        manifest = json.loads(str(arrays.pop("__manifest__")))
+        self.hits += 1
+        return {k: _decode(v, arrays) for k, v in manifest.items()}
+
+    def put(self, key: str, outputs: Dict) -> None:
+        # pre: outputs values are of a supported type (see _encode)
+        # post: entry written atomically (tmp + rename), old entries evicted if over budget
+        arrays: Dict[str, np.ndarray] = {}
+        manifest = {k: _encode(v, arrays) for k, v in outputs.items()}
+        arrays["__manifest__"] = np.array(json.dumps(manifest))
+
+        path = self._path(key)
+        ensure_dir(path.parent)
+        tmp = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+        np.savez_compressed(tmp, **arrays)
+        os.replace(tmp, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _scan_size(self) -> int:
+        return sum(p.stat().st_size for p in self.root.glob("*/*.npz"))
+
+    def _evict(self) -> None:
+        # post: least recently used entries removed until the cache is below 90% of its budget
+        entries = []
+        for p in self.root.glob("*/*.npz"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue  # removed by another process
+            entries.append((st.st_mtime, st.st_size, p))
+        entries.sort()
+
+        size = sum(e[1] for e in entries)
+        target = int(0.9 * self.max_bytes)
+        for _, nbytes, p in entries:
+            if size <= target:
+                break
+            try:
+                p.unlink()
+            except OSError:
+                pass
+            size -= nbytes
+        self._size = size
+        logger.info(f"[StageCache] evicted down to {size / 1e6:.1f} MB") if LOG_ALL else None
+
+class CachedPipe:
+    # brief: wraps a Pipe; on a cache hit its outputs are restored instead of running process()
+    # note: the wrapped pipe controls its key through `cache_settings` (names in settings.py) and
+    #       cache_files(data) (the files its output is derived from). the wrapper mirrors the
+    #       pipe's requires/provides/consumes, so DRPipeline validates and plans it like the original.
+
+    def __init__(self, pipe, cache: Optional[StageCache] = None):
+        # pre: pipe declares `provides` (the keys stored in the cache) and doesn't consume anything
+        if not getattr(pipe, "provides", ()):
+            raise ValueError(f"[StageCache] {pipe.__class__.__name__} declares no outputs to cache")
+        if getattr(pipe, "consumes", ()):
+            raise ValueError(f"[StageCache] {pipe.__class__.__name__} consumes keys and can't be cached")
+        self.wrapped = pipe
+        self.cache = cache if cache is not None else StageCache()
+        self.requires = getattr(pipe, "requires", None)
+        self.provides = tuple(pipe.provides)
+        self.consumes = ()
+        self.deprecated = getattr(pipe, "deprecated", False)
+
+    def cache_key(self, data: Dict) -> str:
+        # post: hex key of the wrapped pipe's output for this item
+        cls = type(self.wrapped)
+        conf = {k: str(getattr(settings, k)) for k in getattr(self.wrapped, "cache_settings", ())}
+        h = hashlib.sha1(json.dumps({"pipe": f"{cls.__module__}.{cls.__qualname__}", "settings": conf,
+                                     "version": CACHE_VERSION}, sort_keys=True).encode())
+        for path in self.wrapped.cache_files(data):
+            h.update(file_digest(path))
+        return h.hexdigest()
+
+    def process(self, data: Dict) -> Dict:
+        key = self.cache_key(data)
+        outputs = self.cache.get(key)
+        if outputs is not None:
+            logger.debug(f"[StageCache] hit {type(self.wrapped).__name__} {key[:10]}") if LOG_ALL else None
+            data.update(outputs)
+            return data
+
+        data = self.wrapped.process(data)
+        self.cache.put(key, {k: data[k] for k in self.provides})
+        return data
+
+    def close(self) -> None:
+        close = getattr(self.wrapped, "close", None)
+        if callable(close):
+            close()
+
+def with_stage_cache(pipe, enabled: bool = STAGE_CACHE):
+    # post: pipe wrapped in a CachedPipe if the stage cache is enabled, else pipe itself
+    return CachedPipe(pipe) if enabled else pipe